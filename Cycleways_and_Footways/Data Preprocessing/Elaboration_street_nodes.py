@@ -8,6 +8,10 @@ import numpy as np
 import json
 from shapely import wkt
 import osmnx as ox
+import sys
+#the cache of the downloads is shared with the scripts of the road network
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import osmCache
 
 
 """In this file we are going to make some preprocessing on street nodes in order to find 
@@ -176,12 +180,12 @@ def save_gdf(gdf, path):
 
 
 def preprocessing(gdf_cycleways, gdf_footways, gdf_crossing_ways, options):
-    G_total = ox.graph_from_point((options.lat, options.lon),
-                                  dist=int(options.dist),
-                                  dist_type='bbox',
-                                  simplify=False,
-                                  network_type='all_private'
-                                  )
+    G_total = osmCache.OsmCache().graph_from_point((options.lat, options.lon),
+                                                   dist=int(options.dist),
+                                                   dist_type='bbox',
+                                                   simplify=False,
+                                                   network_type='all_private'
+                                                   )
 
     nodes, edges = ox.graph_to_gdfs(G_total)
     nodes.reset_index(inplace=True)
@@ -1,5 +1,4 @@
 import argparse
-import requests
 import geopandas as gpd
 from Get_footways_from_OSM import createQueryFootways, App
 from Get_crossing_ways_from_OSM import createQueryCrossingWays
@@ -52,15 +51,18 @@ def add_options():
     parser.add_argument('--nameFileNeighborhood', '-fnb', dest='file_name_neighborhood', type=str,
                         help="""Insert the name of the neighborhood .json file.""",
                         required=True)
+    parser.add_argument('--pbf', dest='pbf', type=str,
+                        help="""Insert the path of a local .osm.pbf file to read instead of querying the Overpass API.""",
+                        required=False, default=None)
     return parser
 
 
 
-def getData(url, query, greeter, strIdx, strType, filename):
-    """Get the data of interest from OSM"""
+def getData(url, query, greeter, strIdx, strType, filename, data=None):
+    """Get the data of interest from OSM, data are the elements already extracted from a .osm.pbf file"""
 
-    result = requests.get(url, params={'data': query})
-    data = result.json()['elements']
+    if data is None:
+        data = get_elements(url, query)
     print("Get Data from OSM")
     features = [elem_to_feature(elem, strType) for elem in data]
     gdf = gpd.GeoDataFrame.from_features(features, crs=4326)
@@ -88,23 +90,28 @@ def main(args=None):
     greeter = App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
     path = greeter.get_path()[0][0] + '\\' + greeter.get_import_folder_name()[0][0] + '\\'
     url = 'http://overpass-api.de/api/interpreter'
+    """A single pass over the local .osm.pbf file replaces the overpass queries"""
+    pbf = {}
+    if options.pbf:
+        import pbfReader
+        pbf = pbfReader.read_pbf(options.pbf, lat, lon, dist)
     queryCycleways = createQueryCycleways(dist, lat, lon)
-    getDataCycleways(url, queryCycleways, options.file_name_cycleways, path)
+    getDataCycleways(url, queryCycleways, options.file_name_cycleways, path, pbf.get('cycleways'))
     print("Extracting CYCLEWAYS data : done")
     
     """Generate overpass query to fetch footways data and extract them"""
     queryFootways = createQueryFootways(dist, lat, lon)
-    getData(url, queryFootways, greeter, "way/", "LineString", options.file_name_footways)
+    getData(url, queryFootways, greeter, "way/", "LineString", options.file_name_footways, pbf.get('footways'))
     print("Extracting footways data : done")
     
     """Generate overpass query to fetch crossing nodes data and extract them"""
     queryCrossNodes = createQueryCrossingNodes(dist, lat, lon)
-    getData(url, queryCrossNodes, greeter, "node/", "Point", options.file_name_crossingnodes)
+    getData(url, queryCrossNodes, greeter, "node/", "Point", options.file_name_crossingnodes, pbf.get('crossing_nodes'))
     print("Extracting crossing nodes data : done")
 
     """Generate overpass query to fetch crossing ways data and extract them"""
     queryCrossWays = createQueryCrossingWays(dist, lat, lon)
-    getData(url, queryCrossWays, greeter, "way/", "LineString", options.file_name_crossingways)
+    getData(url, queryCrossWays, greeter, "way/", "LineString", options.file_name_crossingways, pbf.get('crossing_ways'))
     print("Extracting crossing ways data : done")
 
     """Extract street nodes data from OSM"""
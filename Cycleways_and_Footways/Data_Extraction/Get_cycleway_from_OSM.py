@@ -8,7 +8,6 @@ import os
 import geopandas as gpd
 import numpy as np
 import pandas as pd
-import requests
 from Tools import *
 
 """Extract cycleways and roads where bicycles are allowed from OSM"""
@@ -119,9 +118,10 @@ def createQueryCycleways(dist, lat, lon):
                 );out geom;"""
     return query
 
-def getDataCycleways(url, query, filename, path):
-    result = requests.get(url, params={'data': query})
-    data = result.json()['elements']
+def getDataCycleways(url, query, filename, path, data=None):
+    """data are the elements already extracted (for example from a .osm.pbf file), None to run the query"""
+    if data is None:
+        data = get_elements(url, query)
     """generating a geodataframe with line geometry"""
     features = [elem_to_feature(elem, "LineString") for elem in data]
     gdf = gpd.GeoDataFrame.from_features(features, crs=4326)
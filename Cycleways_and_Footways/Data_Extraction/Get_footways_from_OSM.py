@@ -4,7 +4,6 @@ import argparse
 import os
 import geopandas as gpd
 import pandas as pd
-import requests
 from Tools import *
 
 class App:
@@ -107,8 +106,7 @@ def main(args=None):
     query = createQueryFootways(dist, lat, lon)
 
     """Crossing ways extraction and generation of the GeoDataframe"""
-    result = requests.get(url, params={'data': query})
-    data = result.json()['elements']
+    data = get_elements(url, query)
     features = [elem_to_feature(elem, "LineString") for elem in data]
     gdf = gpd.GeoDataFrame.from_features(features, crs=4326)
     list_ids = ["way/"+str(elem["id"]) for elem in data]
@@ -2,6 +2,7 @@ import osmnx as ox
 import argparse
 from neo4j import GraphDatabase
 import os
+from Tools import osmCache
 
 
 class App:
@@ -75,13 +76,13 @@ def add_options():
 def getBicycleNodes(dist, lat, lon, greeter, filename):
     """Get the street nodes data from OSM"""
 
-    G = ox.graph_from_point((lat, lon),
-                            dist=int(dist),
-                            dist_type='bbox',
-                            simplify=False,
-                            network_type='all_private',
-                            custom_filter = '["highway"]["bicycle"!~"no"][!"boundary"]["highway"!~"motorway_link"]["highway"!~"motorway"]["highway"!~"trunk"]["highway"!~"trunk_link"]["highway"!~"motorway_junction"][!"railway"][!"destination"]'
-                            )
+    G = osmCache.OsmCache().graph_from_point((lat, lon),
+                                             dist=int(dist),
+                                             dist_type='bbox',
+                                             simplify=False,
+                                             network_type='all_private',
+                                             custom_filter = '["highway"]["bicycle"!~"no"][!"boundary"]["highway"!~"motorway_link"]["highway"!~"motorway"]["highway"!~"trunk"]["highway"!~"trunk_link"]["highway"!~"motorway_junction"][!"railway"][!"destination"]'
+                                             )
 
     path = greeter.get_path()[0][0] + '\\' + greeter.get_import_folder_name()[0][0] + '\\' + filename + '_bike.graphml'
     ox.save_graphml(G, path)
@@ -89,13 +90,13 @@ def getBicycleNodes(dist, lat, lon, greeter, filename):
 def getFootNodes(dist, lat, lon, greeter, filename):
     """Get the street nodes data from OSM"""
 
-    G = ox.graph_from_point((lat, lon),
-                            dist=int(dist),
-                            dist_type='bbox',
-                            simplify=False,
-                            network_type='all_private',
-                            custom_filter = '["foot"!~"no"]["highway"!~"motorway_link"]["highway"!~"motorway"]["highway"!~"trunk"]["highway"!~"trunk_link"]["highway"!~"motorway_junction"][!"railway"]'
-                            )
+    G = osmCache.OsmCache().graph_from_point((lat, lon),
+                                             dist=int(dist),
+                                             dist_type='bbox',
+                                             simplify=False,
+                                             network_type='all_private',
+                                             custom_filter = '["foot"!~"no"]["highway"!~"motorway_link"]["highway"!~"motorway"]["highway"!~"trunk"]["highway"!~"trunk_link"]["highway"!~"motorway_junction"][!"railway"]'
+                                             )
 
     path = greeter.get_path()[0][0] + '\\' + greeter.get_import_folder_name()[0][0] + '\\' + filename + '_foot.graphml'
     ox.save_graphml(G, path)
@@ -1,5 +1,10 @@
 import pandas as pd
 import geopandas as gpd
+import os
+import sys
+#the cache of the downloads is shared with the scripts of the road network
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import osmCache
 
 """This file contains some functions useful to the data extraction process"""
 
@@ -12,6 +17,11 @@ def save_gdf(gdf, path, filename):
     df['geometry'] = df['geometry'].astype(str)
     df.to_json(path + filename, orient='table')
 
+def get_elements(url, query):
+    """elements returned by the overpass query, read from the local cache when already downloaded"""
+
+    return osmCache.OsmCache().overpass(query, url)['elements']
+
 def elem_to_feature(elem, geomType):
     """Convert the element in a json format"""
 
@@ -3,7 +3,11 @@ import overpy
 import json
 import argparse
 import os
+import sys
 import time
+#the spatial layer is shared with the scripts of the road network
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+import spatialLayer
 
 """In this file we are going to show how to generate nodes referring to cycling paths"""
 
@@ -43,24 +47,9 @@ class App:
         return result.values()
 
 
-    def import_lanes_in_spatial_layer(self):
-        """Import BicycleLane nodes on a Neo4j spatial layer """
-
-        with self.driver.session() as session:
-            result = session.write_transaction(self._import_lanes_in_spatial_layer)
-            return result
-
-    @staticmethod
-    def _import_lanes_in_spatial_layer(tx):
-        tx.run("""
-                call spatial.addWKTLayer('spatial', 'geometry')
-                """)
-        result = tx.run("""
-                       match(b:BicycleLane) with collect(b) as lanes UNWIND lanes AS l CALL spatial.addNode('spatial', l) yield node return node
-        """)
-                        
-        return result.values()
-
+    def import_lanes_in_spatial_layer(self, batch_size=1000):
+        """Import BicycleLane nodes on a Neo4j spatial layer, in batches of batch_size nodes"""
+        return spatialLayer.add_to_layer(self.driver, 'BicycleLane', batch_size=batch_size)
 
     def add_index(self):
         """Add an index to the numeric id"""
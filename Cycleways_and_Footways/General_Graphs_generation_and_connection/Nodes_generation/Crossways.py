@@ -3,7 +3,11 @@ import overpy
 import json
 import argparse
 import os
+import sys
 import time
+#the spatial layer is shared with the scripts of the road network
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+import spatialLayer
 
 """In this file we are going ti show how to generate nodes referring to signaled crossings mapped as ways on OSM"""
 
@@ -35,21 +39,11 @@ class App:
         return result.values()
 
 
-    def import_crossways_in_spatial_layer(self):
-        """Import CrossWay nodes on a Neo4j Spatial Layer"""
+    def import_crossways_in_spatial_layer(self, batch_size=1000):
+        """Import CrossWay nodes on a Neo4j Spatial Layer, in batches of batch_size nodes"""
+        return spatialLayer.add_to_layer(self.driver, 'CrossWay', batch_size=batch_size)
 
-        with self.driver.session() as session:
-            result = session.write_transaction(self._import_crossways_in_spatial_layer)
-            return result
 
-    @staticmethod
-    def _import_crossways_in_spatial_layer(tx):
-        result = tx.run("""
-                       match(n:CrossWay)
-                       CALL spatial.addNode('spatial', n) yield node return node
-        """)
-                       
-        return result.values()
 
 
 
@@ -3,7 +3,11 @@ import overpy
 import json
 import argparse
 import os
+import sys
 import time
+#the spatial layer is shared with the scripts of the road network
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+import spatialLayer
 
 """In this file we are going to show how to generate nodes referring to footways"""
 
@@ -41,20 +45,9 @@ class App:
 
         return result.values()
 
-    def import_footways_in_spatial_layer(self):
-        """import Footway nodes on a Neo4j Spatial Layer"""
-        with self.driver.session() as session:
-            result = session.write_transaction(self._import_footways_in_spatial_layer)
-            return result
-
-    @staticmethod
-    def _import_footways_in_spatial_layer(tx):
-        result = tx.run("""
-                       Match (n:Footway) where NOT "BicycleLane" in labels(n)
-                       CALL spatial.addNode('spatial', n) yield node return node
-        """)
-                        
-        return result.values()
+    def import_footways_in_spatial_layer(self, batch_size=1000):
+        """import Footway nodes on a Neo4j Spatial Layer, in batches of batch_size nodes"""
+        return spatialLayer.add_to_layer(self.driver, 'Footway', batch_size=batch_size, exclude='BicycleLane')
 
     def add_index(self):
         """Add an index on numeric id attribute"""
@@ -3,6 +3,10 @@ import overpy
 import json
 import argparse
 import os
+import sys
+#the spatial layer is shared with the scripts of the road network
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+import spatialLayer
 
 """In this file we are going to show hoe to generate nodes representing neighborhoods"""
 
@@ -30,22 +34,9 @@ class App:
         return result.values()
 
     
-    def import_neighborhoods_in_spatial_layer(self):
-        """Import Neighborhood nodes on a Neo4j Spatial Layer"""
-        with self.driver.session() as session:
-            result = session.write_transaction(self._import_neighborhoods_in_spatial_layer)
-            return result
-
-    @staticmethod
-    def _import_neighborhoods_in_spatial_layer(tx):
-        result = tx.run("""
-                       match(n:Neighborhood) with collect(n) as neighborhoods UNWIND neighborhoods AS nb 
-                       CALL spatial.addNode('spatial', nb) yield node return node
-        """)
-                        
-        return result.values()
-
-
+    def import_neighborhoods_in_spatial_layer(self, batch_size=1000):
+        """Import Neighborhood nodes on a Neo4j Spatial Layer, in batches of batch_size nodes"""
+        return spatialLayer.add_to_layer(self.driver, 'Neighborhood', batch_size=batch_size)
 
 
 
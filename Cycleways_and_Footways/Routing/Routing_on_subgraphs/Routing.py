@@ -1,8 +1,10 @@
 from neo4j import GraphDatabase
+from functools import partial
 import overpy
 import json
 import argparse
 import os
+import sys
 import time
 import folium as fo
 import osmnx as ox
@@ -11,11 +13,28 @@ import pandas as pd
 import geopandas as gpd
 import numpy as np
 from ast import literal_eval
+#the projection manager is shared with the scripts of the road network
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+import projectionManager
+import graphVersion
+import nodeStore
+import snapIndex
 """In this file we perform routing on projections using A*"""
 
+#labels of the junctions of the footways
+FOOT_LABELS = ['FootCross', 'JunctionFootCross', 'RoadFootJunction']
+#labels of the nodes of the subgraphs, the ones of the projections and of the community routing
+SUBGRAPH_LABELS = ['BikeCross', 'JunctionBikeCross', 'RoadBikeJunction', 'BikeNode'] + FOOT_LABELS
+
+
 class App:
     def __init__(self, uri, user, password):
         self.driver = GraphDatabase.driver(uri, auth=(user, password))
+        self.projections = projectionManager.ProjectionManager(self.driver)
+        #osm ids and coordinates of the nodes of the paths, resolved locally
+        self.nodes = nodeStore.NodeStore(self.driver, SUBGRAPH_LABELS, graph=graphVersion.CYCLEWAYS)
+        #junctions nearest to the points of interest and to the coordinates, resolved locally
+        self.snap = None
 
     def close(self):
         self.driver.close()
@@ -34,66 +53,40 @@ class App:
         return result.values()
 
     def create_projections(self,mode,weight):
-        """Create projections, one considering as weight the travel time and one the cost"""
-        with self.driver.session() as session:
-            result = session.write_transaction(self._create_projections,mode,weight)
-            return result
+        """Gets from the projection manager the projections, one considering as weight the travel time and one the cost.
+           Returns a dictionary with the name of the projection of each weight."""
+        graph = graphVersion.FOOTWAYS if mode.startswith('foot') else graphVersion.CYCLEWAYS
+        weights = ['cost', 'travel_time'] if weight == 'both' else [weight]
+        projections = {}
+        try:
+            for w in weights:
+                projections[w] = self.projections.acquire(graph, w, partial(self._create_projection, mode=graph, weight=w))
+        except Exception:
+            self.delete_projected_graph(projections)
+            raise
+        return projections
 
     @staticmethod
-    def _create_projections(tx,mode,weight):
+    def _create_projection(tx,name,mode,weight):
         if(mode == 'cycleways'):
-            name = 'bike_routes'
-            if(weight == 'cost' or weight == 'both'):
-                result = tx.run("""
-                call gds.graph.create('bike_routes_cost', ['BikeCross', 'FootCross', 'JunctionBikeCross', 'JunctionFootCross', 'RoadBikeJunction', 'RoadFootJunction'], 
-                ['BIKE_ROUTE', 'FOOT_ROUTE', 'IS_THE_SAME'], 
-                {nodeProperties: ['lat', 'lon'], relationshipProperties: 'cost'});
-                """)
-            if(weight == 'travel_time' or weight == 'both'):
-                result = tx.run("""
-                call gds.graph.create('bike_routes_travel_time', ['BikeCross', 'FootCross', 'JunctionBikeCross', 'JunctionFootCross', 'RoadBikeJunction', 'RoadFootJunction'], 
-                ['BIKE_ROUTE', 'FOOT_ROUTE', 'IS_THE_SAME'], 
-                {nodeProperties: ['lat', 'lon'], relationshipProperties: 'travel_time'});
-                """)
-        elif(mode == 'footways'):
-            name = 'foot_routes'
-            if(weight == 'cost' or weight == 'both'):
-                result = tx.run("""
-                call gds.graph.create('foot_routes_cost', ['FootCross', 'JunctionFootCross', 'RoadFootJunction'], 
-                ['FOOT_ROUTE'], 
-                {nodeProperties: ['lat', 'lon'], relationshipProperties: 'cost'});
-                """)
-            if(weight == 'travel_time' or weight == 'both'):
-                result = tx.run("""
-                call gds.graph.create('foot_routes_travel_time', ['FootCross', 'JunctionFootCross', 'RoadFootJunction'], 
-                ['FOOT_ROUTE'], 
-                {nodeProperties: ['lat', 'lon'], relationshipProperties: 'travel_time'});
-                """)
-        return name
-    
-    def delete_projected_graph(self,weight,graph_name):
-        """This method deletes an existing graph projection. 
-           The mode parameter is set to 'r' for dual graph and 'j' for primal graph."""
-        with self.driver.session() as session:
-            path = session.read_transaction(self._drop_projected_graph,weight,graph_name)
-
-    @staticmethod
-    def _drop_projected_graph(tx,weight,graph_name):
-        if weight == 'both':
-            name = graph_name + '_cost'
-            tx.run("""
-                CALL gds.graph.drop( $name)
-                        """,name = name)
-            name = graph_name + '_travel_time'
             result = tx.run("""
-                CALL gds.graph.drop( $name)
-                        """,name = name)
+            call gds.graph.create($name, ['BikeCross', 'FootCross', 'JunctionBikeCross', 'JunctionFootCross', 'RoadBikeJunction', 'RoadFootJunction'], 
+            ['BIKE_ROUTE', 'FOOT_ROUTE', 'IS_THE_SAME'], 
+            {nodeProperties: ['lat', 'lon'], relationshipProperties: $weight});
+            """, name=name, weight=weight)
         else:
-            name = graph_name + '_' + weight
             result = tx.run("""
-                CALL gds.graph.drop( $name)
-                        """,name = name)
-        return result
+            call gds.graph.create($name, ['FootCross', 'JunctionFootCross', 'RoadFootJunction'], 
+            ['FOOT_ROUTE'], 
+            {nodeProperties: ['lat', 'lon'], relationshipProperties: $weight});
+            """, name=name, weight=weight)
+        return result.consume()
+    
+    def delete_projected_graph(self,projections):
+        """This method releases the projections returned by create_projections:
+           the projection manager drops them when they are no longer used by anyone."""
+        for name in projections.values():
+            self.projections.release(name)
     
     def update_cost(tx,beta=0.5):
         with self.driver.session() as session:
@@ -127,68 +120,37 @@ class App:
                     """)
         return result.values()
         
+    def get_snap_index(self):
+        """spatial index of the junctions of the subgraphs, built on the first use
+           and again when the subgraphs change"""
+        if self.snap is None:
+            self.snap = snapIndex.SnapIndex(self.driver, ['Junction'] + FOOT_LABELS, graph=graphVersion.CYCLEWAYS)
+        return self.snap.refresh()
+
     def get_the_nearest_junction_to_POI(self, osmid, foot = False):
-        """Routing considering as weight the cost, which is a tradeoff between the travel time and
-           the safety of the path
+        """returns the distance and the id of the junction nearest to the point of interest
+           (a foot junction if foot is True), found on the spatial index of the junctions
         """
-        with self.driver.session() as session:
-            print(dest)
-            result = session.write_transaction(self._get_the_nearest_junction_to_POI, osmid, foot)
-            return result
-
-    @staticmethod
-    def _get_the_nearest_junction_to_POI(tx, osmid, foot):
-        if foot:
-            result = tx.run("""match (p:PointOfInterest {osm_id: $osmid}) 
-                                match (p)-[:MEMBER]->(o:OSMWayNode)
-                                match (o)<-[:IS_NEAR_TO]-(m) with point({latitude: tofloat(o.lat), longitude: tofloat(o.lon)}) as location,m
-                                match (m)-[:CONTAINS]->(j:Junction)
-                                where j:FootCross or j:JunctionFootCross or j:RoadFootJunction
-                                return distance(location,j.location) as distance, j.id
-                                order by distance limit 1""",osmid = osmid)
-        else:
-            result = tx.run("""match (p:PointOfInterest {osm_id: $osmid}) 
-                                match (p)-[:MEMBER]->(o:OSMWayNode)
-                                match (o)<-[:IS_NEAR_TO]-(m) with point({latitude: tofloat(o.lat), longitude: tofloat(o.lon)}) as location,m
-                                match (m)-[:CONTAINS]->(j:Junction)
-                                return distance(location,j.location) as distance, j.id
-                                order by distance limit 1""",osmid = osmid)
-        return result.values()
+        labels = FOOT_LABELS if foot else ['Junction']
+        junctions = self.get_snap_index().poi_junctions(osmid, radius=np.inf, k=1, labels=labels)
+        return [[distance, junction] for junction, distance in junctions.items()]
         
     def get_the_nearest_junction_to_coordinates(self, lat, lon, foot = False):
-        """Routing considering as weight the cost, which is a tradeoff between the travel time and
-           the safety of the path
+        """returns the distance and the id of the junction within 100 meters nearest to the coordinates
+           (a foot junction if foot is True), found on the spatial index of the junctions
         """
-        with self.driver.session() as session:
-            result = session.write_transaction(self._get_the_nearest_junction_to_coordinates, lat, lon, foot)
-            return result
-
-    @staticmethod
-    def _get_the_nearest_junction_to_coordinates(tx, lat, lon, foot):
-        if foot:
-            print(lat)
-            print(lon)
-            query = """CALL spatial.withinDistance('spatial', {latitude:"""+str(lat) +""", longitude:"""+str(lon)+"""}, 0.1) 
-            yield node,distance 
-            where node:FootCross or node:JunctionFootCross or node:RoadFootJunction
-            return distance,node.id as osmid order by distance limit 1"""
-            result = tx.run(query)
-        else:
-            print(lat)
-            print(lon)
-            query = """CALL spatial.withinDistance('spatial', {latitude:"""+str(lat) +""", longitude:"""+str(lon)+"""}, 0.1) 
-            yield node,distance 
-            where node:Junction
-            return distance,node.id as osmid order by distance limit 1"""
-            result = tx.run(query)
-        return result.values()
+        labels = FOOT_LABELS if foot else ['Junction']
+        found = self.get_snap_index().nearest(float(lat), float(lon), k=1, labels=labels, radius=100)
+        return [[distance, junction] for distance, junction, _ in found]
 
 
     def routing_algorithm(self, source, target, projection, mode,alg = 'd'):
         """Routing considering as weight just the travel time"""
         with self.driver.session() as session:
             result = session.write_transaction(self._routing_algorithm, source, target, projection, mode,alg)
-            return result
+        self.nodes.refresh()
+        return [[path, [{'latitude': lat, 'longitude': lon} for lat, lon in self.nodes.coordinates(nodeIds)],
+                 totalCost, self.nodes.ids(nodeIds)] for path, totalCost, nodeIds in result]
 
     
     @staticmethod
@@ -205,12 +167,8 @@ class App:
                     relationshipWeightProperty: $mode
                     })
                     YIELD index, sourceNode, targetNode, totalCost, nodeIds, costs, path
-                    with index,
-                        totalCost,
-                        [nodeId IN nodeIds | {latitude:gds.util.asNode(nodeId).lat,longitude:gds.util.asNode(nodeId).lon}] AS nodeCord,
-                        [nodeId IN nodeIds | gds.util.asNode(nodeId).id] AS nodeIDs
-                    match (n)-[:CONTAINS]->(j:Junction) where j.id in nodeIDs with collect(distinct(n.id_num)) as path, nodeIDs, totalCost, nodeCord 
-                    return path, nodeCord, totalCost, nodeIDs
+                    match (n)-[:CONTAINS]->(j:Junction) where id(j) in nodeIds with collect(distinct(n.id_num)) as path, nodeIds, totalCost
+                    return path, totalCost, nodeIds
                     """, source=source, target=target, projection=projection, mode=mode)
         else:
             print('algorithm is:-----------------------------------')
@@ -226,12 +184,8 @@ class App:
                     relationshipWeightProperty: $mode
                     })
                     YIELD index, sourceNode, targetNode, totalCost, nodeIds, costs, path
-                    with index,
-                        totalCost,
-                        [nodeId IN nodeIds | {latitude:gds.util.asNode(nodeId).lat,longitude:gds.util.asNode(nodeId).lon}] AS nodeCord,
-                        [nodeId IN nodeIds | gds.util.asNode(nodeId).id] AS nodeIDs
-                    match(n)-[:CONTAINS]->(j:Junction) where j.id in nodeIDs with collect(distinct(n.id_num)) as path, nodeIDs, totalCost, nodeCord 
-                    return path, nodeCord, totalCost, nodeIDs
+                    match(n)-[:CONTAINS]->(j:Junction) where id(j) in nodeIds with collect(distinct(n.id_num)) as path, nodeIds, totalCost
+                    return path, totalCost, nodeIds
                     """, source=source, target=target, projection=projection, mode=mode)
         return result.values()
         
@@ -248,28 +202,26 @@ class App:
         return result.values()
     
     def generate_inter_community_graph(self):
-        """evaluate the best route between the source and the target
+        """gets the projection of the graph of the communities from the projection manager
         """
-        with self.driver.session() as session:
-            result = session.execute_write(self._generate_inter_community_graph)
-            return result
+        return self.projections.acquire(graphVersion.CYCLEWAYS, 'community_graph', self._generate_inter_community_graph)
     @staticmethod
-    def _generate_inter_community_graph(tx):
+    def _generate_inter_community_graph(tx,name):
         query = """
-        call gds.graph.project('community_graph', ['Community'], 
+        call gds.graph.project($name, ['Community'], 
                 ['INTRA_COMMUNITY'], 
                 { relationshipProperties: ['cost']});"""
-        result = tx.run(query)
+        result = tx.run(query, name=name)
         return result.values()
         
-    def generate_inter_community_path(self,source,target):
+    def generate_inter_community_path(self,projection,source,target):
         """evaluate the best route between the source and the target
         """
         with self.driver.session() as session:
-            result = session.execute_write(self._generate_inter_community_path,source,target)
+            result = session.execute_write(self._generate_inter_community_path,projection,source,target)
             return result
     @staticmethod
-    def _generate_inter_community_path(tx,source,target): 
+    def _generate_inter_community_path(tx,projection,source,target): 
         #query = """
         #match (bks:BikeNode{id:'%s'})
         #match (bkt:BikeNode{id:'%s'})
@@ -285,7 +237,7 @@ class App:
         match (source:Community{id:bks.louvain})
         match (target:Community{id:bkt.louvain})
         with source as s, target as t
-        CALL gds.shortestPath.dijkstra.stream('community_graph', {
+        CALL gds.shortestPath.dijkstra.stream($projection, {
                                             sourceNode: s,
                                             targetNode: t,
                                             relationshipWeightProperty: 'cost'
@@ -295,7 +247,7 @@ class App:
         match (bk:BikeNode{louvain:start_node,border_louvain:True})-[r:BORDER_LOUVAIN_ROUTE]->(bk2:BikeNode{louvain:start_node,border_louvain:True})-[r2:BIKE_ROUTE]->(bk3:BikeNode{louvain:end_node,border_louvain:True})
         return bk.id,r.cost,r.path_cost,bk2.id,r2.cost,bk3.id,start_node,end_node"""%(source,target)
         #print(query)
-        result = tx.run(query)
+        result = tx.run(query, projection=projection)
         return result.values()
         
     def evaluate_path_metrics(self,pairs):
@@ -345,68 +297,68 @@ class App:
         return result.values()
         
     def generate_louvain_community_graph(self, id_community):
-        """generate the graph projection for the given community"""
-
-        with self.driver.session() as session:
-            result = session.execute_write(self._generate_louvain_community_graph, id_community)
-            return result
+        """gets the graph projection for the given community from the projection manager"""
+        return self.projections.acquire(graphVersion.CYCLEWAYS, 'subgraph_community_lp_' + str(id_community),
+                                        partial(self._generate_louvain_community_graph, id_community=id_community))
     @staticmethod
-    def _generate_louvain_community_graph(tx, id_community):
-        query ="""call gds.graph.project.cypher('subgraph_community_lp_""" + str(id_community) + """','MATCH (n:BikeNode {louvain:"""
+    def _generate_louvain_community_graph(tx, name, id_community):
+        query ="""call gds.graph.project.cypher($name,'MATCH (n:BikeNode {louvain:"""
         query = query + str(id_community) + """}) RETURN id(n) AS id','MATCH (n:BikeNode{louvain:"""+ str(id_community) 
         query = query + """})-[r:BIKE_ROUTE]->(m:BikeNode{louvain: """ + str(id_community) + """}) RETURN id(n) AS source, id(m) AS target, r.travel_time as travel_time, r.danger as danger, r.cost as cost')
                         YIELD
                           graphName AS graph, nodeQuery, nodeCount AS nodes, relationshipQuery, relationshipCount AS rels"""
-        result = tx.run(query)
+        result = tx.run(query, name=name)
         return result.values()
         
-    def routing_source_targets(self,source,targets):
+    def routing_source_targets(self,projection,source,targets):
         """evaluate the best route between the source and the target
         """
         with self.driver.session() as session:
-            result = session.execute_write(self._routing_source_targets,source,targets)
-            return result
+            result = session.execute_write(self._routing_source_targets,projection,source,targets)
+        self.nodes.refresh()
+        return [[*self.nodes.ids([sourceNode, targetNode]), self.nodes.ids(nodeIds), weight]
+                for sourceNode, targetNode, nodeIds, weight in result]
     @staticmethod
-    def _routing_source_targets(tx,source,targets):
+    def _routing_source_targets(tx,projection,source,targets):
         query = """
         match (s:BikeNode {id: '%s'})
         unwind %s as t_id
         match (t:BikeNode {id: t_id}) 
         with s,t
-        CALL gds.shortestPath.dijkstra.stream('subgraph_community_lp_' + toString(s.louvain), {
+        CALL gds.shortestPath.dijkstra.stream($projection, {
                                             sourceNode: s,
                                             targetNode: t,
                                             relationshipWeightProperty: 'cost'
                                             })
                                             YIELD index, sourceNode, targetNode, totalCost, nodeIds
-        with  gds.util.asNode(sourceNode).id as sourceNode,gds.util.asNode(targetNode).id as targetNode,[nodeId IN nodeIds | gds.util.asNode(nodeId).id] AS nodes_path, totalCost as weight
-        return sourceNode,targetNode,nodes_path,weight"""%(source,targets)
-        result = tx.run(query)
+        return sourceNode,targetNode,nodeIds,totalCost as weight"""%(source,targets)
+        result = tx.run(query, projection=projection)
         return result.values()
         
-    def routing_sources_target(self,sources,target):
+    def routing_sources_target(self,projection,sources,target):
         """evaluate the best route between the source and the target
         """
         with self.driver.session() as session:
-            result = session.execute_write(self._routing_sources_target,sources,target)
-            return result
+            result = session.execute_write(self._routing_sources_target,projection,sources,target)
+        self.nodes.refresh()
+        return [[*self.nodes.ids([sourceNode, targetNode]), self.nodes.ids(nodeIds), weight]
+                for sourceNode, targetNode, nodeIds, weight in result]
     @staticmethod
-    def _routing_sources_target(tx,sources,target):
+    def _routing_sources_target(tx,projection,sources,target):
         query = """
         match (t:BikeNode {id: '%s'})
         unwind %s as s_id
         match (s:BikeNode {id: s_id}) 
         with s,t
-        CALL gds.shortestPath.dijkstra.stream('subgraph_community_lp_' + toString(s.louvain), {
+        CALL gds.shortestPath.dijkstra.stream($projection, {
                                             sourceNode: s,
                                             targetNode: t,
                                             relationshipWeightProperty: 'cost'
                                             })
                                             YIELD index, sourceNode, targetNode, totalCost, nodeIds
-        with  gds.util.asNode(sourceNode).id as sourceNode,gds.util.asNode(targetNode).id as targetNode,[nodeId IN nodeIds | gds.util.asNode(nodeId).id] AS nodes_path, totalCost as weight
-        return sourceNode,targetNode,nodes_path,weight"""%(target, sources)
+        return sourceNode,targetNode,nodeIds,totalCost as weight"""%(target, sources)
         #print(query)
-        result = tx.run(query)
+        result = tx.run(query, projection=projection)
         return result.values()
         
     def get_coordinates(self,final_path):
@@ -425,53 +377,60 @@ class App:
         return result.values()
         
     def drop_all_projections(self):
-        with self.driver.session() as session:
-            result = session.execute_write(self._drop_all_projections)
-            return result
-    @staticmethod    
-    def _drop_all_projections(tx):
-        result = tx.run("""CALL gds.graph.list() YIELD graphName
-                    CALL gds.graph.drop(graphName)
-                    YIELD database
-                    RETURN 'dropped ' + graphName""")
-        return result.values()
+        """drops all the projections of the projection manager that are not used by anyone"""
+        return self.projections.drop_all()
 
     def routing_old_style(self,source,target):
         """evaluate the best route between the source and the target
         """
-        with self.driver.session() as session:
-            result = session.execute_write(self._routing_old_style,source,target)
-            return result
+        with self.projections.projection(graphVersion.CYCLEWAYS, 'subgraph_routing', self._subgraph_routing_projection) as projection:
+            with self.driver.session() as session:
+                nodeIds, weight, total_danger, total_distance = session.execute_write(self._routing_old_style,projection,source,target)
+        self.nodes.refresh()
+        return [self.nodes.ids(nodeIds), weight, total_danger, total_distance]
     @staticmethod
-    def _routing_old_style(tx,source,target):
-        tx.run("""call gds.graph.project('subgraph_routing', ['BikeJunction','BikeCrossing'], 
+    def _subgraph_routing_projection(tx,name):
+        tx.run("""call gds.graph.project($name, ['BikeJunction','BikeCrossing'], 
                 ['BIKE_ROUTE'], 
                 {nodeProperties: ['lat', 'lon'], relationshipProperties: ['cost']});
-            """)
+            """, name=name).consume()
+    @staticmethod
+    def _routing_old_style(tx,projection,source,target):
         query = """
         match (s:BikeNode {id: '%s'})
         match (t:BikeNode {id: '%s'})
-        CALL gds.shortestPath.dijkstra.stream('subgraph_routing', {
+        CALL gds.shortestPath.dijkstra.stream($projection, {
                                             sourceNode: s,
                                             targetNode: t,
                                             relationshipWeightProperty: 'cost'
                                             })
                                             YIELD index, sourceNode, targetNode, totalCost, nodeIds, path
-        with  [nodeId IN nodeIds | gds.util.asNode(nodeId).id] AS nodes_path, totalCost as weight,path as p
-        unwind relationships(p) as n with startNode(n).id as start_node,endNode(n).id as end_node,nodes_path,weight
+        with nodeIds, totalCost as weight,path as p
+        unwind relationships(p) as n with startNode(n).id as start_node,endNode(n).id as end_node,nodeIds,weight
         match (bk:BikeNode{id:start_node})-[r:BIKE_ROUTE]->(bk2:BikeNode{id:end_node})
-        return nodes_path,weight, sum(r.danger) as total_danger, sum(r.distance) as total_distance"""%(source,target)
-        result = tx.run(query)
-        tx.run("""call gds.graph.drop('subgraph_routing')""")
+        return nodeIds,weight, sum(r.danger) as total_danger, sum(r.distance) as total_distance"""%(source,target)
+        result = tx.run(query, projection=projection)
         return result.values()[0]
         
         
         
 def routing_with_communities(greeter,source,target,boolMap=False,file=''):
-    greeter.generate_inter_community_graph()
+    #the projections are kept for the next requests, the projection manager evicts them when unused:
+    #the leases are released also when the routing fails
+    acquired = []
+    try:
+        return _routing_with_communities(greeter,acquired,source,target,boolMap,file)
+    finally:
+        for projection in acquired:
+            greeter.projections.release(projection)
+
+
+def _routing_with_communities(greeter,acquired,source,target,boolMap,file):
+    community_graph = greeter.generate_inter_community_graph()
+    acquired.append(community_graph)
     #find all the shortest path between communities and then find all the possible border nodes path
     start_time = time.time()
-    result = greeter.generate_inter_community_path(source,target)
+    result = greeter.generate_inter_community_path(community_graph,source,target)
     percorso = pd.DataFrame(result, columns = ['bk.id', 'r.cost', 'r.path_cost', 'bk2.id', 'r2.cost', 'bk3.id',
        'start_node', 'end_node'])
     percorso['r.path_cost'] = percorso['r.path_cost'].apply(str)
@@ -516,17 +475,19 @@ def routing_with_communities(greeter,source,target,boolMap=False,file=''):
         else:
             choice['total_cost'] = choice['r2.cost_' + str(i)] + choice['total_cost']
     #generate the graph of the source community
-    greeter.generate_louvain_community_graph(sequence[0])   
+    source_graph = greeter.generate_louvain_community_graph(sequence[0])
+    acquired.append(source_graph)
     #generate all the possible path between the soruce node and the border nodes that point to the next community
     str_target = '[' + ",".join('"'  + str(x) + '"' for x in choice['bk2.id_0'].unique()) + ']'
-    df_source = pd.DataFrame(greeter.routing_source_targets(source,str_target), columns = ['source', 'border', 'r.path_cost_s', 'cost'])
+    df_source = pd.DataFrame(greeter.routing_source_targets(source_graph,source,str_target), columns = ['source', 'border', 'r.path_cost_s', 'cost'])
     df_source['r.path_cost_s'] = df_source['r.path_cost_s'].apply(str)
     choice = pd.merge(df_source,choice,left_on=  ['border'],right_on= ['bk2.id_0'],how='outer')
     #generate the graph of the target community
-    greeter.generate_louvain_community_graph(sequence[-1])
+    target_graph = greeter.generate_louvain_community_graph(sequence[-1])
+    acquired.append(target_graph)
     #generate all the possible path between the target node and the border nodes that comes from the previous community
     str_source = '[' + ",".join('"'  + str(x) + '"' for x in choice['bk3.id_'+ str(len(sequence)-2)].unique()) + ']'
-    df_target = pd.DataFrame(greeter.routing_sources_target(str_source,target), columns = ['border', 'target', 'r.path_cost_t', 'cost_t']) 
+    df_target = pd.DataFrame(greeter.routing_sources_target(target_graph,str_source,target), columns = ['border', 'target', 'r.path_cost_t', 'cost_t']) 
     choice = pd.merge(df_target,choice,left_on=  ['border'],right_on= ['bk3.id_'+ str(len(sequence)-2)],how='outer',
                       suffixes = ['_target',''])
     #find the total cost of the path
@@ -568,7 +529,6 @@ def routing_with_communities(greeter,source,target,boolMap=False,file=''):
     dic['#crossings']= greeter.count_crossings(pairs = str(pairs))[0][0]
     dic['#communities']= greeter.count_communities(pairs = str(pairs))[0][0]
     #dic['pairs'] = pairs
-    greeter.drop_all_projections()
     return dic
 
 def routing_old_way(greeter,source,target,boolMap=False,file=''):
@@ -608,7 +568,6 @@ def routing_old_way(greeter,source,target,boolMap=False,file=''):
     dic['distance']= ev[0][2]
     dic['#crossings']= greeter.count_crossings(pairs = str(pairs))[0][0]
     dic['#communities']= greeter.count_communities(pairs = str(pairs))[0][0]
-    greeter.drop_all_projections()
     return dic
 
 def read_file(path):
@@ -750,91 +709,11 @@ def add_options():
     return parser
 
 
-def main(args=None):
-    """Parsing input parameters"""
-    argParser = add_options()
-    options = argParser.parse_args(args=args)
-    greeter = App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
-    path = greeter.get_path()[0][0] + '\\' + greeter.get_import_folder_name()[0][0] + '\\' 
-
-    #G = ox.io.load_graphml(path + options.file_name)
-    #nodes, edges = ox.graph_to_gdfs(G)
-    #nodes.reset_index(inplace=True)
-    #print("Loading grapml file : done")
-    
-    """The user can choose how to travel, using a bike or just walking"""
-    graph_projection = ""
-    foot = False
-    if options.mode == 'cycleways':
-        graph_projection = "bike_routes"
-    elif options.mode == 'footway':
-        graph_projection = "foot_routes"
-        foot = True
-    elif options.mode == 'community':
-        result = routing_with_communities(greeter,options.source,options.dest,True,options.mapName)
-        print("execution time:" + str(result['exec_time']))
-        print("number of hops:" + str(result['hops']))
-        print("total cost:" + str(result['cost']))
-        print("average danger:" + str(result['danger']))
-        print("total distance:" + str(result['distance']))
-        print("number of crossings:" + str(result['#crossings']))
-        print("number of communities:" + str(result['#communities']))
-        return 0
-    elif options.mode == 'old':
-        result = routing_old_way(greeter,options.source,options.dest,True,options.mapName)
-        print("execution time:" + str(result['exec_time']))
-        print("number of hops:" + str(result['hops']))
-        print("total cost:" + str(result['cost']))
-        print("average danger:" + str(result['danger']))
-        print("total distance:" + str(result['distance']))
-        print("number of crossings:" + str(result['#crossings']))
-        print("number of communities:" + str(result['#communities']))
-        return 0
-
-    if options.lat == '':
-        if options.source != '':
-            result = greeter.get_the_nearest_junction_to_POI(options.source,foot)
-            print(result)
-            distance_source = result[0][0]
-            source_osmid = result[0][1]
-        else:
-            print("SOURCE INFORMATION ARE REQUIRED")
-            raise RuntimeError("Wrong parameter value")
-    else:
-        if options.lon != '':
-            result = greeter.get_the_nearest_junction_to_coordinates(options.lat, options.lon, foot)
-            print(result)
-            distance_source = result[0][0]
-            source_osmid = result[0][1]
-        else:
-            print("SOURCE INFORMATION ARE REQUIRED")
-            greeter.delete_projected_graph()
-            raise RuntimeError("Wrong parameter value")
-    
-    if options.lat_dest == '':
-        if options.dest != '':
-            result = greeter.get_the_nearest_junction_to_POI(options.dest,foot)
-            print(result)
-            distance_dest = result[0][0]
-            dest_osmid = result[0][1]
-        else:
-            print("DESTINATION INFORMATION ARE REQUIRED")
-            raise RuntimeError("Wrong parameter value")
-    else:
-        if options.lon_dest != '':
-            result = greeter.get_the_nearest_junction_to_coordinates(options.lat_dest, options.lon_dest, foot)
-            print(result)
-            distance_dest = result[0][0]
-            dest_osmid = result[0][1]
-        else:
-            print("DESTINATION INFORMATION ARE REQUIRED")
-            raise RuntimeError("Wrong parameter value")
-    print(distance_source,source_osmid,distance_dest,dest_osmid)
-    #create graph projections
-    graph_name = greeter.create_projections(options.mode, options.weight)
+def route_on_projections(greeter, options, projections, source_osmid, dest_osmid):
+    """routing between the two junctions on the projections of the weights chosen by the user"""
     if options.weight == "cost" or options.weight == "travel_time":
         """Routing considering as weight the cost"""
-        result_routing_cost = greeter.routing_algorithm(source_osmid, dest_osmid, graph_projection+"_"+options.weight,options.weight, options.alg )
+        result_routing_cost = greeter.routing_algorithm(source_osmid, dest_osmid, projections[options.weight],options.weight, options.alg )
         print("Find the best path between your source location and the target location, considering the travel time needed and the level of security of the paths used : done")
         print(result_routing_cost[0][1])
         listNodes = result_routing_cost[0][3]
@@ -870,7 +749,7 @@ def main(args=None):
 
     elif options.weight == "both":
         """Routing considering as weight the cost"""
-        result_routing_cost = greeter.routing_algorithm(source_osmid, dest_osmid, graph_projection + "_cost", "cost", options.alg )
+        result_routing_cost = greeter.routing_algorithm(source_osmid, dest_osmid, projections["cost"], "cost", options.alg )
         print(
             """Find the best path between your source location and the target location,
             considering the travel time needed and the level of security of the paths used : done""")
@@ -902,7 +781,7 @@ def main(args=None):
         print('Total travel time in minutes:')
         print(time/60)
         """Routing considering as weight the travel time"""
-        result_routing_travel_time = greeter.routing_algorithm(source_osmid, dest_osmid, graph_projection + "_travel_time", "travel_time", options.alg )
+        result_routing_travel_time = greeter.routing_algorithm(source_osmid, dest_osmid, projections["travel_time"], "travel_time", options.alg )
         print(
             "Find the best path between your source location and the target location, considering only the travel time needed : done")
         listNodes = result_routing_travel_time[0][3]
@@ -938,7 +817,94 @@ def main(args=None):
 
     else:
         raise RuntimeError("Wrong parameter value")
-    greeter.delete_projected_graph(options.weight, graph_name)
+
+
+def main(args=None):
+    """Parsing input parameters"""
+    argParser = add_options()
+    options = argParser.parse_args(args=args)
+    greeter = App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
+    path = greeter.get_path()[0][0] + '\\' + greeter.get_import_folder_name()[0][0] + '\\' 
+
+    #G = ox.io.load_graphml(path + options.file_name)
+    #nodes, edges = ox.graph_to_gdfs(G)
+    #nodes.reset_index(inplace=True)
+    #print("Loading grapml file : done")
+    
+    """The user can choose how to travel, using a bike or just walking"""
+    graph_projection = ""
+    foot = False
+    if options.mode == 'cycleways':
+        graph_projection = "bike_routes"
+    elif options.mode == 'footway':
+        graph_projection = "foot_routes"
+        foot = True
+    elif options.mode == 'community':
+        result = routing_with_communities(greeter,options.source,options.dest,True,options.mapName)
+        print("execution time:" + str(result['exec_time']))
+        print("number of hops:" + str(result['hops']))
+        print("total cost:" + str(result['cost']))
+        print("average danger:" + str(result['danger']))
+        print("total distance:" + str(result['distance']))
+        print("number of crossings:" + str(result['#crossings']))
+        print("number of communities:" + str(result['#communities']))
+        return 0
+    elif options.mode == 'old':
+        result = routing_old_way(greeter,options.source,options.dest,True,options.mapName)
+        print("execution time:" + str(result['exec_time']))
+        print("number of hops:" + str(result['hops']))
+        print("total cost:" + str(result['cost']))
+        print("average danger:" + str(result['danger']))
+        print("total distance:" + str(result['distance']))
+        print("number of crossings:" + str(result['#crossings']))
+        print("number of communities:" + str(result['#communities']))
+        return 0
+
+    if options.lat == '':
+        if options.source != '':
+            result = greeter.get_the_nearest_junction_to_POI(options.source,foot)
+            print(result)
+            distance_source = result[0][0]
+            source_osmid = result[0][1]
+        else:
+            print("SOURCE INFORMATION ARE REQUIRED")
+            raise RuntimeError("Wrong parameter value")
+    else:
+        if options.lon != '':
+            result = greeter.get_the_nearest_junction_to_coordinates(options.lat, options.lon, foot)
+            print(result)
+            distance_source = result[0][0]
+            source_osmid = result[0][1]
+        else:
+            print("SOURCE INFORMATION ARE REQUIRED")
+            raise RuntimeError("Wrong parameter value")
+    
+    if options.lat_dest == '':
+        if options.dest != '':
+            result = greeter.get_the_nearest_junction_to_POI(options.dest,foot)
+            print(result)
+            distance_dest = result[0][0]
+            dest_osmid = result[0][1]
+        else:
+            print("DESTINATION INFORMATION ARE REQUIRED")
+            raise RuntimeError("Wrong parameter value")
+    else:
+        if options.lon_dest != '':
+            result = greeter.get_the_nearest_junction_to_coordinates(options.lat_dest, options.lon_dest, foot)
+            print(result)
+            distance_dest = result[0][0]
+            dest_osmid = result[0][1]
+        else:
+            print("DESTINATION INFORMATION ARE REQUIRED")
+            raise RuntimeError("Wrong parameter value")
+    print(distance_source,source_osmid,distance_dest,dest_osmid)
+    #create graph projections
+    projections = greeter.create_projections(options.mode, options.weight)
+    try:
+        route_on_projections(greeter, options, projections, source_osmid, dest_osmid)
+    finally:
+        #the leases are released also when the routing fails
+        greeter.delete_projected_graph(projections)
     return 0
 
 
@@ -70,7 +70,7 @@ class App:
         #        match (b)<-[:CONTAINS]-(bl:Footway)-[:CONTINUE_ON_FOOTWAY_BY_CROSSING_ROAD]-(bl2:Footway)-[:CONTAINS]->(b2)
         #        where bl.osm_id <> bl2.osm_id
         #        set r.danger = round(toFloat(bl.danger + bl2.danger)/2,0,'UP') + 15 """)
-		"""relazioni tra footway e bicyclelane in termini di sicurezza da rivedere"""
+        """relazioni tra footway e bicyclelane in termini di sicurezza da rivedere"""
         #tx.run("""
         #        match (b:FootJunction)-[r:FOOT_ROUTE]->(b2:BikeJunction) 
         #        set r.danger = 3 """)
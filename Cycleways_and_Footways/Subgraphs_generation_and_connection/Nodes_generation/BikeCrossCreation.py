@@ -3,7 +3,11 @@ import overpy
 import json
 import argparse
 import os
+import sys
 import time
+#the spatial layer is shared with the scripts of the road network
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+import spatialLayer
 
 """In this file we are going to show how subgraph cycleways layer nodes are generated"""
 
@@ -165,31 +169,13 @@ class App:
         
 
 
-    def import_bikecrosses_into_spatial_layer(self):
-        """Import subgraph cycleways layer nodes in a Neo4j Spatial Layer"""
-        with self.driver.session() as session:
-            result = session.write_transaction(self._import_bikecrosses_into_spatial_layer)
-            return result
-
-    
-    @staticmethod
-    def _import_bikecrosses_into_spatial_layer(tx):
-        tx.run("""
-                match (n:BikeCross)
-                CALL spatial.addNode('spatial', n) yield node return node;
-                """)
-
-        tx.run("""
-                match (n:BikeJunction)
-                CALL spatial.addNode('spatial', n) yield node return node; 
-                """)
-
-        result = tx.run("""
-                match (n:BikeRoad)
-                CALL spatial.addNode('spatial', n) yield node return node;
-                """)
+    def import_bikecrosses_into_spatial_layer(self, batch_size=1000):
+        """Import subgraph cycleways layer nodes in a Neo4j Spatial Layer, in batches of batch_size nodes"""
+        added = spatialLayer.add_to_layer(self.driver, 'BikeCross', batch_size=batch_size)
+        added += spatialLayer.add_to_layer(self.driver, 'BikeJunction', batch_size=batch_size)
+        added += spatialLayer.add_to_layer(self.driver, 'BikeRoad', batch_size=batch_size)
+        return added
 
-        return result.values()        
 
 
 
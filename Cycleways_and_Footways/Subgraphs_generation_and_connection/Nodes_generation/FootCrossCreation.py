@@ -4,7 +4,11 @@ import overpy
 import json
 import argparse
 import os
+import sys
 import time
+#the spatial layer is shared with the scripts of the road network
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+import spatialLayer
 
 """In this file we are going to show how subgraph footways layer nodes are generated"""
 
@@ -171,31 +175,13 @@ class App:
         return result
 
 
-    def import_footcrosses_into_spatial_layer(self):
-        """Import subgraph footways layer nodes in a Neo4j Spatial Layer"""
-        with self.driver.session() as session:
-            result = session.write_transaction(self._import_footcrosses_into_spatial_layer)
-            return result
-
-    
-    @staticmethod
-    def _import_footcrosses_into_spatial_layer(tx):
-        tx.run("""
-                match(n:FootCross) where not "BikeNode" in labels(n)
-                CALL spatial.addNode('spatial', n) yield node return node; 
-                """)
-
-        tx.run("""
-                match(n:FootJunction) where not "BikeNode" in labels(n) 
-                CALL spatial.addNode('spatial', n) yield node return node; 
-                """)
-
-        result = tx.run("""
-                match(n:FootRoad) where not "BikeNode" in labels(n)  
-                CALL spatial.addNode('spatial', n) yield node return node;
-                """)
+    def import_footcrosses_into_spatial_layer(self, batch_size=1000):
+        """Import subgraph footways layer nodes in a Neo4j Spatial Layer, in batches of batch_size nodes"""
+        added = spatialLayer.add_to_layer(self.driver, 'FootCross', batch_size=batch_size, exclude='BikeNode')
+        added += spatialLayer.add_to_layer(self.driver, 'FootJunction', batch_size=batch_size, exclude='BikeNode')
+        added += spatialLayer.add_to_layer(self.driver, 'FootRoad', batch_size=batch_size, exclude='BikeNode')
+        return added
 
-        return        
 
 
 
@@ -16,6 +16,9 @@ import sys
 sys.path.insert(1, '../routing')
 import Routing_on_subgraphs.GraphProjections
 import Routing_on_subgraphs.SetWeights
+#the version counters are shared with the scripts of the road network
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import graphVersion
 
 """In this file we are going to show how to generate different layers' subgraphs"""
 
@@ -131,6 +134,13 @@ def main(args=None):
     greeterSetWeights.set_relations_weights()
     greeterSetWeights.close()
 
+    """The projections, the node stores and the snapping indexes built on the previous subgraphs are outdated"""
+    driver = GraphDatabase.driver(options.neo4jURL, auth=(options.neo4juser, options.neo4jpwd))
+    with driver.session() as session:
+        session.write_transaction(graphVersion.bump_version, graphVersion.CYCLEWAYS)
+        session.write_transaction(graphVersion.bump_version, graphVersion.FOOTWAYS)
+    driver.close()
+
     """Create projections"""
     greeterProj = Routing_on_subgraphs.GraphProjections.App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
     greeterProj.create_projections()
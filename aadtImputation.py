@@ -0,0 +1,95 @@
+"""Estimation of the AADT of the ROUTE relationships without traffic data.
+   The relationships are read once and two relationships are neighbours when they share a junction:
+   the adjacency is the sparse product of the incidence matrix of the relationships and the junctions
+   with its transpose. The known AADT values stay fixed and each missing value is replaced, at every
+   iteration, by the average of the neighbours with a value (Jacobi iterations of the Laplacian smoothing),
+   so the values spread from the measured roads to the roads around them until they converge.
+   The relationships not connected to any measured road take the average AADT of their highway type,
+   then all the estimates are written in batches."""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+ROUTE_COLUMNS = ['id', 'source', 'target', 'AADT', 'highway']
+
+
+def read_routes(tx):
+    """all the ROUTE relationships with their ends, AADT and highway type as a DataFrame"""
+    result = tx.run("""
+                MATCH (m:RoadJunction)-[r:ROUTE]->(n:RoadJunction)
+                RETURN id(r) AS id, id(m) AS source, id(n) AS target, r.AADT AS AADT, r.highway AS highway""")
+    routes = pd.DataFrame(result.values(), columns=ROUTE_COLUMNS)
+    routes['AADT'] = pd.to_numeric(routes['AADT'], errors='coerce')
+    return routes
+
+
+def adjacency(routes):
+    """sparse matrix of the relationships that share a junction"""
+    junctions, ends = np.unique(np.concatenate([routes.source.values, routes.target.values]), return_inverse=True)
+    rows = np.tile(np.arange(len(routes)), 2)
+    incidence = sparse.csr_matrix((np.ones(len(rows)), (rows, ends)), shape=(len(routes), len(junctions)))
+    neighbours = (incidence @ incidence.T).tocsr()
+    neighbours.setdiag(0)
+    neighbours.eliminate_zeros()
+    #a relationship counts once even when it shares both the junctions
+    neighbours.data[:] = 1.0
+    return neighbours
+
+
+def smooth(neighbours, values, iterations=200, tolerance=1e-3):
+    """the known values (not NaN) are kept, the missing ones are the average of their neighbours with a
+       value, repeated until the largest change is below tolerance. The values that cannot be reached
+       from a known one stay NaN."""
+    known = ~np.isnan(values)
+    estimate = np.where(known, values, 0.0)
+    valued = known.astype(np.float64)
+    for _ in range(iterations):
+        total = neighbours @ estimate
+        count = neighbours @ valued
+        with np.errstate(invalid='ignore', divide='ignore'):
+            average = np.where(count > 0, total / count, 0.0)
+        update = np.where(known, estimate, average)
+        reached = known | (count > 0)
+        change = np.abs(update - estimate)[reached]
+        estimate, valued = update, reached.astype(np.float64)
+        if len(change) == 0 or change.max() < tolerance:
+            break
+    return np.where(valued > 0, estimate, np.nan)
+
+
+def estimate(routes, iterations=200, tolerance=1e-3):
+    """the AADT of every relationship: the known one, the smoothed one or the average of its highway type.
+       Returns the relationships whose AADT was missing with the estimate, when it exists."""
+    missing = routes['AADT'].isna().values
+    if not missing.any():
+        return routes.iloc[:0][['id', 'AADT']]
+    values = smooth(adjacency(routes), routes['AADT'].values.astype(np.float64), iterations, tolerance)
+    highway = routes['highway'].astype(str).where(routes['highway'].notna(), '')
+    means = pd.Series(values).groupby(highway.values).transform('mean').values
+    values = np.where(np.isnan(values), means, values)
+    result = pd.DataFrame({'id': routes['id'].values, 'AADT': values})[missing]
+    return result[result.AADT.notna()]
+
+
+def write_estimates(tx, rows):
+    tx.run("""
+                UNWIND $rows AS row
+                MATCH ()-[r:ROUTE]->()
+                WHERE id(r) = row.id
+                SET r.AADT = row.AADT
+                """, rows=rows).consume()
+
+
+def impute(driver, batch_size=10000, iterations=200, tolerance=1e-3, progress=print):
+    """estimates the missing AADT of the ROUTE relationships and writes it in batches of batch_size
+       relationships, one transaction per batch. Returns the number of relationships written."""
+    with driver.session() as session:
+        routes = session.read_transaction(read_routes)
+        estimates = estimate(routes, iterations, tolerance)
+        for start in range(0, len(estimates), batch_size):
+            batch = estimates.iloc[start:start + batch_size]
+            rows = [{'id': int(i), 'AADT': float(aadt)} for i, aadt in zip(batch['id'], batch['AADT'])]
+            session.write_transaction(write_estimates, rows)
+            if progress is not None:
+                progress('{} of {} AADT estimates written'.format(min(start + batch_size, len(estimates)), len(estimates)))
+    return len(estimates)
@@ -1,30 +1,38 @@
 from neo4j import GraphDatabase
+from functools import partial
 import folium as fo
 import pandas as pd
 import os
 import webbrowser
 import argparse
+import projectionManager
+import graphVersion
 
 
 class App:
     def __init__(self, uri, user, password):
         self.driver = GraphDatabase.driver(uri, auth=(user, password))
+        self.projections = projectionManager.ProjectionManager(self.driver)
+        #names of the projections in use for the primal ('j') and the dual ('r') graph
+        self.graphs = {}
 
     def close(self):
         self.driver.close()
 
     def create_projected_graph(self,mode):
-        """This method creates a new graph as a projection of the existing nodes and relations. 
+        """This method gets from the projection manager a projection of the existing nodes and relations,
+           creating it if it does not exist for the current version of the graph.
            The mode parameter is set to 'r' for dual graph and 'j' for primal graph."""
-        with self.driver.session() as session:
-            path = session.read_transaction(self._projected_graph,mode)
+        graph = graphVersion.DUAL if mode == 'r' else graphVersion.PRIMAL
+        self.graphs[mode] = self.projections.acquire(graph, 'centrality', partial(self._projected_graph, mode=mode))
+        return self.graphs[mode]
 
     @staticmethod
-    def _projected_graph(tx,mode):
+    def _projected_graph(tx,name,mode):
         if(mode == 'r'):
             str = """
                 CALL gds.graph.create.cypher(
-                    "r",
+                    $name,
                     "MATCH (n) where n:RoadOsm RETURN id(n) as id,toInteger(round(n.traffic,0)) as traffic",
                     "MATCH (n)-[r:CONNECTED]->(m) return id(n) as source,id(m) as target,type(r) as type,r.location as location,r.junction as junction,r.score as traffic"
                 )
@@ -32,39 +40,33 @@ class App:
         else:
             str = """
                 CALL gds.graph.create.cypher(
-                    "j",
+                    $name,
                     "MATCH (n) where n:RoadJunction or n:OSMWayNode RETURN id(n) AS id, n.lat AS lat, n.lon AS lon",
-                    "MATCH ()-[r:ROUTE]->() with min(r.AADT) as min_AADT,max(r.AADT) as max_AADT,max(r.distance) as max_dist,min(r.distance) as min_dist MATCH (n)-[r:ROUTE]->(m) WHERE r.status = 'active' RETURN id(n) AS source, id(m) AS target, toFloat(r.AADT) / toFloat(r.distance) as traffic, r.AADT as AADT, r.distance as distance, type(r) as type"
+                    "MATCH (n)-[r:ROUTE]->(m) WHERE r.status = 'active' RETURN id(n) AS source, id(m) AS target, toFloat(r.AADT) / toFloat(r.distance) as traffic, r.AADT as AADT, r.distance as distance, type(r) as type"
                 )
                         """
-        result = tx.run(str)
-        return result
+        result = tx.run(str, name=name)
+        return result.consume()
 
     def delete_projected_graph(self,mode):
-        """This method deletes an existing graph projection. 
+        """This method releases the projection in use: the projection manager drops it
+           when it is no longer used by anyone.
            The mode parameter is set to 'r' for dual graph and 'j' for primal graph."""
-        with self.driver.session() as session:
-            path = session.read_transaction(self._drop_projected_graph,mode)
-
-    @staticmethod
-    def _drop_projected_graph(tx,mode):
-        result = tx.run("""
-                CALL gds.graph.drop('""" + mode + """')
-                        """)
-        return result
+        if mode in self.graphs:
+            self.projections.release(self.graphs.pop(mode))
 
 
     def betweenness_centrality(self):
         """This method evaluates the BC of the primal graph."""
         with self.driver.session() as session:
-            path = session.write_transaction(self._betweenness_centrality)
+            path = session.write_transaction(self._betweenness_centrality, self.graphs['j'])
             return path
 
     @staticmethod
-    def _betweenness_centrality(tx):
+    def _betweenness_centrality(tx, graph):
         result = tx.run("""
                     CALL gds.betweenness.write(
-                     'j',
+                     $graph,
                      {
                       writeProperty: 'bc'
                      }
@@ -73,20 +75,20 @@ class App:
                     nodePropertiesWritten,
                     minimumScore,
                     maximumScore 
-                        """)
+                        """, graph=graph)
         return result.values()
 
     def degree_centrality(self):
         """This method evaluates the Degree Centrality of the primal graph."""
         with self.driver.session() as session:
-            path = session.write_transaction(self._degree_centrality)
+            path = session.write_transaction(self._degree_centrality, self.graphs['j'])
             return path
 
     @staticmethod
-    def _degree_centrality(tx):
+    def _degree_centrality(tx, graph):
         result = tx.run("""
                     CALL gds.degree.write(
-                     'j',
+                     $graph,
                      {
                       writeProperty: 'degree',
                       relationshipWeightProperty: 'traffic'
@@ -95,7 +97,7 @@ class App:
                     YIELD nodePropertiesWritten, centralityDistribution
                     return centralityDistribution.min AS minimumScore,
                     centralityDistribution.max as maximumScore,nodePropertiesWritten
-                        """)
+                        """, graph=graph)
         return result.values()
 
     def get_important_junctions(self,property):
@@ -128,20 +130,23 @@ class App:
                     match (:RoadOsm)-[c:CONNECTED {junction: id_junction}]->(:RoadOsm)
                     set c.score = degree
                     """)
-        return result.values()
+        values = result.values()
+        #the score is part of the projections of the dual graph
+        graphVersion.bump_version(tx, graphVersion.DUAL)
+        return values
 
     def speaker_listener_community(self):
         """This method applies Speaker Listener community detection algorithm to the dual graph."""
         with self.driver.session() as session:
-            result = session.read_transaction(self._speaker_listener_community)
+            result = session.read_transaction(self._speaker_listener_community, self.graphs['r'])
             return result
 
     @staticmethod
-    def _speaker_listener_community(tx):
-        result = tx.run("""CALL gds.alpha.sllpa.stream('r', {maxIterations: 100, minAssociationStrength: 0.1})
+    def _speaker_listener_community(tx, graph):
+        result = tx.run("""CALL gds.alpha.sllpa.stream($graph, {maxIterations: 100, minAssociationStrength: 0.1})
         YIELD nodeId, values
         return gds.util.asNode(nodeId).osmid AS osmid,gds.util.asNode(nodeId).name AS name, values.communityIds AS communityIds,size(values.communityIds) as dim
-        ORDER BY dim DESC, name ASC""")
+        ORDER BY dim DESC, name ASC""", graph=graph)
         df = pd.DataFrame(result.values(),columns = result.keys())
         print(df.head())
         return df
@@ -166,12 +171,12 @@ class App:
     def page_rank_roads(self):
         """This method applies Page Rank algorithm to the dual graph weighted on the traffic."""
         with self.driver.session() as session:
-            result = session.read_transaction(self._page_rank_roads)
+            result = session.read_transaction(self._page_rank_roads, self.graphs['r'])
             return result
 
     @staticmethod    
-    def _page_rank_roads(tx):
-        query = """CALL gds.pageRank.stream('r', {
+    def _page_rank_roads(tx, graph):
+        query = """CALL gds.pageRank.stream($graph, {
                     dampingFactor: 0.85,
                     relationshipWeightProperty: 'traffic'
                     })
@@ -179,7 +184,7 @@ class App:
                     return gds.util.asNode(nodeId).osmid AS osmid,gds.util.asNode(nodeId).name AS name, score
                     ORDER BY score DESC, name ASC
                 """
-        result = tx.run(query)
+        result = tx.run(query, graph=graph)
         df = pd.DataFrame(result.values(),columns = result.keys())
         return df
 
@@ -3,6 +3,8 @@ import json
 from neo4j import GraphDatabase
 import argparse
 import os
+import osmCache
+import spatialLayer
 
 
 class App:
@@ -98,18 +100,9 @@ class App:
                         """)
         return result.values()
         
-    def import_nodes_into_spatial_layer(self):
-        """Import OSMWayNodes nodes in a Neo4j Spatial Layer"""
-        with self.driver.session() as session:
-            result = session.write_transaction(self._import_nodes_into_spatial_layer)
-            return result
-    @staticmethod
-    def _import_nodes_into_spatial_layer(tx):
-        tx.run("""
-                match(n:OSMWayNode)
-                CALL spatial.addNode('spatial', n) yield node return node;
-                """)
-        return result.values()
+    def import_nodes_into_spatial_layer(self, batch_size=1000):
+        """Import OSMWayNodes nodes in a Neo4j Spatial Layer, in batches of batch_size nodes"""
+        return spatialLayer.add_to_layer(self.driver, 'OSMWayNode', batch_size=batch_size)
 
     def connect_amenity(self):
         """Connect the OSMWayNode of the POI to the nearest Node in the graph."""
@@ -132,14 +125,15 @@ class App:
         return result.values()
 
     def set_location(self):
-       """Insert the location in the OSMWayNode."""
+        """Insert the location in the OSMWayNode."""
         with self.driver.session() as session:
             result = session.write_transaction(self._set_location)
+            return result
     
     @staticmethod
     def _set_location(tx):
-       result = tx.run("""MATCH (n:OSMWayNode) SET n.location = point({latitude: tofloat(n.lat), longitude: tofloat(n.lon)})""")
-       return result.values()
+        result = tx.run("""MATCH (n:OSMWayNode) SET n.location = point({latitude: tofloat(n.lat), longitude: tofloat(n.lon)})""")
+        return result.values()
        
     def set_index(self):
         """create index on nodes"""
@@ -181,6 +175,12 @@ def add_options():
     parser.add_argument('--spatial', '-s', dest='spatial', type=str,
                         help="""True if a neo4j spatial layer is present""",
                         required=False, default = 'False')
+    parser.add_argument('--batchSize', '-b', dest='batch_size', type=int,
+                        help="""Insert the number of nodes added to the spatial layer in each transaction.""",
+                        required=False, default=1000)
+    parser.add_argument('--pbf', dest='pbf', type=str,
+                        help="""Insert the path of a local .osm.pbf file to read instead of querying the Overpass API.""",
+                        required=False, default=None)
     return parser
 
 
@@ -188,8 +188,14 @@ def main(args=None):
     argParser = add_options()
     #retrieving arguments
     options = argParser.parse_args(args=args)
-    #creating an instance of the overpass API
+    #creating an instance of the overpass API, the responses are read from the local cache when already downloaded
     api = overpy.Overpass()
+    cache = osmCache.OsmCache()
+    pbf = None
+    if options.pbf:
+        #a single pass over the local file replaces the two queries
+        import pbfReader
+        pbf = pbfReader.read_pbf(options.pbf, options.lat, options.lon, options.dist)
     #define the bounding circle
     dist = options.dist
     lon = options.lon
@@ -198,11 +204,14 @@ def main(args=None):
     greeter = App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
     path = greeter.get_path()[0][0] + '\\' + greeter.get_import_folder_name()[0][0] + "\\"
     #query the api for POI ways
-    result = api.query(f"""(   
+    if pbf is not None:
+        result = overpy.Result.from_json(pbfReader.response(pbf['amenity_ways']), api=api)
+    else:
+        result = overpy.Result.from_json(cache.overpass(f"""[out:json];(   
                                way(around:{dist},{lat},{lon})["amenity"];
                            );(._;>;);
                            out body;
-                    """)
+                    """, api.url), api=api)
     #generate a json file with the retrieved information about the nodes that compose each way
     list_node_way = []
     for w in result.ways:
@@ -245,11 +254,14 @@ def main(args=None):
     greeter.import_way()
     print("import wayfile.json: done")
     #query overpass API for POI represented as nodes
-    result = api.query(f"""(   
+    if pbf is not None:
+        result = overpy.Result.from_json(pbfReader.response(pbf['amenity_nodes']), api=api)
+    else:
+        result = overpy.Result.from_json(cache.overpass(f"""[out:json];(   
                                node(around:{dist},{lat},{lon})["amenity"];
                            );
                            out body;
-                           """)
+                           """, api.url), api=api)
     #generation of the node file in the import directory
     list_node = []
     for node in result.nodes:
@@ -271,7 +283,7 @@ def main(args=None):
     greeter.import_node()
     #adding the nodes to the spatial layer
     if (options.spatial == 'True'):
-        greeter.import_nodes_into_spatial_layer()
+        greeter.import_nodes_into_spatial_layer(options.batch_size)
     #adding the location property to the OSMWayNodes
     greeter.set_location()
     #connect POI with roads layer
@@ -1,6 +1,18 @@
 from neo4j import GraphDatabase
 import folium as fo
 import argparse
+import csv
+import dualGraph
+import graphVersion
+
+#status of the relationships for each status of the options
+STATUSES = {'open': 'active', 'active': 'active', 'close': 'close'}
+
+
+def bump_versions(tx):
+    #the projections and the caches of the previous versions of the primal graph are no longer valid,
+    #the version of the dual graph is incremented when its streets are updated
+    graphVersion.bump_version(tx, graphVersion.PRIMAL)
 
 
 class App:
@@ -13,90 +25,103 @@ class App:
     def close_street(self, street):
         """the method closes the given street to traffic 
            setting its status to close and connecting its POI to other roads"""
-        with self.driver.session() as session:
-            result = session.write_transaction(self._close_one_street, street)
-            print('{} is now close'.format(street))
-            return result
-
-    @staticmethod
-    def _close_one_street(tx, street):
-        result = tx.run("""
-                    MATCH ()-[r:ROUTE]-() 
-                    WHERE r.name = $street  
-                        SET r.status='close'""",
-                        street=street)
-        esult = tx.run("""
-                    MATCH (r:RoadOsm)
-                    WHERE r.name = $street  
-                        SET r.status='close'""",
-                        street=street)
-        return result.values()
+        result = self.change_streets([{'street': street, 'status': 'close'}])
+        print('{} is now close'.format(street))
+        return result
     
     def close_street_by_osmid(self, osmid):
         """the method closes the given street to traffic 
            setting its status to close and connecting its POI to other roads"""
-        with self.driver.session() as session:
-            result = session.write_transaction(self._close_one_street_by_osmid, osmid)
-            print('{} is now close'.format(osmid))
-            return result
-
-    @staticmethod
-    def _close_one_street_by_osmid(tx, osmid):
-        result = tx.run("""
-                    MATCH ()-[r:ROUTE]-() 
-                    WHERE r.osmid = $osmid  
-                        SET r.status='close' """,
-                        osmid=osmid)
-        result = tx.run("""
-                    MATCH (r:RoadOsm)
-                    WHERE r.osmid = $osmid  
-                        SET r.status='close'""",
-                        osmid=osmid)
-        return result.values()
+        result = self.change_streets([{'osmid': osmid, 'status': 'close'}])
+        print('{} is now close'.format(osmid))
+        return result
 
     def active_street(self, street):
         """the method opens the given street to traffic 
            setting its status to active and re-connecting its POI to other roads"""
-        with self.driver.session() as session:
-            result = session.write_transaction(self._active_one_street, street)
-            print('{} is now active'.format(street))
-            return result
-
-    @staticmethod
-    def _active_one_street(tx, street):
-        result = tx.run("""
-            MATCH (n)-[r:ROUTE]-() 
-            WHERE r.name = $street  
-                SET r.status = 'active' 
-            """,street=street)
-        result = tx.run("""
-            MATCH (r:RoadOsm)
-            WHERE r.name = $street 
-                SET r.status = 'active' 
-            """,street=street)
-        return result.values()
+        result = self.change_streets([{'street': street, 'status': 'active'}])
+        print('{} is now active'.format(street))
+        return result
     
     def active_street_by_osmid(self, osmid):
         """the method opens the given street to traffic 
            setting its status to active and re-connecting its POI to other roads"""
+        result = self.change_streets([{'osmid': osmid, 'status': 'active'}])
+        print('{} is now active'.format(osmid))
+        return result
+
+    def change_streets(self, changes, batch_size=10000):
+        """the method changes the status of many streets in a single transaction.
+           changes is a list of dictionaries with the new status ('active' or 'close')
+           and the name of the street (street) or its OSM id (osmid).
+           The dual graph is updated in batches of batch_size streets.
+           Returns the number of ROUTE relationships and of RoadOsm nodes changed."""
+        by_name = [{'key': c['street'], 'status': c['status']} for c in changes if c.get('street')]
+        by_osmid = [{'key': c['osmid'], 'status': c['status']} for c in changes if c.get('osmid')]
         with self.driver.session() as session:
-            result = session.write_transaction(self._active_one_street_by_osmid, osmid)
-            print('{} is now active'.format(osmid))
-            return result
+            #the schema changes need their own transactions
+            session.write_transaction(self._set_index)
+            session.read_transaction(self._await_indexes)
+            routes, osmids = session.write_transaction(self._change_streets, by_name, by_osmid)
+        #only the changed streets of the dual graph and their connections are computed again
+        roads, _ = dualGraph.update(self.driver, osmids, batch_size)
+        return routes, roads
+
+    @staticmethod
+    def _set_index(tx):
+        #the same indexes of createJunctionGraph.py, missing when the graph has been imported with neo4j-admin
+        tx.run("""
+                  create index route_name if not exists for ()-[r:ROUTE]-() on (r.name)
+               """)
+        tx.run("""
+                  create index route_osmid if not exists for ()-[r:ROUTE]-() on (r.osmid)
+               """)
 
     @staticmethod
-    def _active_one_street_by_osmid(tx, osmid):
-        result = tx.run("""
-            MATCH (n)-[r:ROUTE]-() 
-            WHERE r.osmid = $osmid  
-                SET r.status = 'active' 
-            """,osmid=osmid)
-        result = tx.run("""
-            MATCH (r:RoadOsm)
-            WHERE r.osmid = $osmid  
-                SET r.status = 'active' 
-            """,osmid=osmid)
-        return result.values()
+    def _await_indexes(tx):
+        #a new index is populated in the background: without waiting the update would scan all the routes
+        tx.run("""
+                  CALL db.awaitIndexes(300)
+               """).consume()
+
+    @staticmethod
+    def _change_streets(tx, by_name, by_osmid):
+        #directed patterns, so that each relationship is matched once through the
+        #relationship property indexes on the name and the osmid
+        routes = 0
+        osmids = set()
+        for prop, changes in (('name', by_name), ('osmid', by_osmid)):
+            if len(changes) == 0:
+                continue
+            result = tx.run("""
+                    UNWIND $changes AS change
+                    MATCH ()-[r:ROUTE]->()
+                    WHERE r.""" + prop + """ = change.key
+                        SET r.status = change.status
+                    RETURN count(r), collect(DISTINCT r.osmid)""",
+                            changes=changes)
+            count, changed = result.single()
+            routes += count
+            osmids.update(changed)
+        bump_versions(tx)
+        return routes, osmids
+
+
+def read_changes_file(path):
+    """reads the streets to change from a .csv file with the columns status ('open' or 'close')
+       and street (name of the street) or osmid"""
+    changes = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            status = row.get('status', '').strip().lower()
+            if status not in STATUSES:
+                raise ValueError("Unknown status '{}' in {}: use 'open' or 'close'".format(status, path))
+            change = {'street': (row.get('street') or '').strip(), 'osmid': (row.get('osmid') or '').strip(),
+                      'status': STATUSES[status]}
+            if change['street'] == '' and change['osmid'] == '':
+                raise ValueError('No street name nor osmid in a row of ' + path)
+            changes.append(change)
+    return changes
 
 
 def addOptions():
@@ -109,7 +134,14 @@ def addOptions():
                         required=False, default = "")
     parser.add_argument('--status', '-st', dest='new_status', type=str,
                         help="""Insert 'open' to open the street and 'close' to close the street.""",
-                        required=True, default = "")
+                        required=False, default = "")
+    parser.add_argument('--file', '-f', dest='file_name', type=str,
+                        help="""Insert the path of a .csv file with the columns street or osmid and status ('open' or 'close'):
+                              all the streets are changed in a single transaction.""",
+                        required=False, default = "")
+    parser.add_argument('--batchSize', '-b', dest='batch_size', type=int,
+                        help="""Insert the number of streets of the dual graph updated in each transaction.""",
+                        required=False, default=10000)
     parser.add_argument('--neo4jURL', '-n', dest='neo4jURL', type=str,
                         help="""Insert the address of the local neo4j instance. For example: neo4j://localhost:7687""",
                         required=True)
@@ -129,9 +161,20 @@ def main(args=None):
     street = options.street_name
     osmid = options.osmid_name
     status = options.new_status
-    if(street == "" and osmid == ""):
+    if options.file_name:
+        #changing all the streets of the file at once
+        changes = read_changes_file(options.file_name)
+        greeter = App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
+        routes, roads = greeter.change_streets(changes, options.batch_size)
+        print('{} streets changed: {} routes and {} road sections'.format(len(changes), routes, roads))
+        greeter.close()
+        return 0
+    if((street is None or street == "") and osmid == ""):
         print("ERROR: no osmid nor street name provided")
         return 0
+    if status not in ('open', 'close'):
+        print("ERROR: the status must be 'open' or 'close'")
+        return 0
     #connecting to Neo4j instance
     greeter = App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
     if (status == 'open'):
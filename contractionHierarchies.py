@@ -0,0 +1,328 @@
+import argparse
+import heapq
+import time
+import numpy as np
+import routingEngine
+
+
+class ContractionHierarchy:
+    """Contraction Hierarchies built on the in-memory primal graph for one weight (distance or traffic).
+       The nodes are contracted offline in order of importance adding shortcuts that preserve the
+       shortest paths; the resulting upward graphs are stored in compact arrays and queried with
+       a bidirectional Dijkstra that only relaxes relationships towards more important nodes."""
+
+    def __init__(self, weight, junction_ids, lat, lon, rank,
+                 fwd_offsets, fwd_targets, fwd_weights, fwd_middle,
+                 bwd_offsets, bwd_targets, bwd_weights, bwd_middle, version=None, fingerprint=None):
+        self.weight = str(weight)
+        #version of the primal graph and RoadGraph.fingerprint of the weight the hierarchy was built on
+        self.version = None if version is None else int(version)
+        self.fingerprint = None if fingerprint is None else str(fingerprint)
+        self.junction_ids = np.asarray(junction_ids, dtype=np.int64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.rank = np.asarray(rank, dtype=np.int32)
+        #upward graph of the forward search: u -> v with rank[v] > rank[u]
+        self.fwd_offsets = np.asarray(fwd_offsets, dtype=np.int64)
+        self.fwd_targets = np.asarray(fwd_targets, dtype=np.int32)
+        self.fwd_weights = np.asarray(fwd_weights, dtype=np.float64)
+        #middle node of the shortcuts, -1 for the original relationships
+        self.fwd_middle = np.asarray(fwd_middle, dtype=np.int32)
+        #upward graph of the backward search: stored in v, u -> v with rank[u] > rank[v]
+        self.bwd_offsets = np.asarray(bwd_offsets, dtype=np.int64)
+        self.bwd_targets = np.asarray(bwd_targets, dtype=np.int32)
+        self.bwd_weights = np.asarray(bwd_weights, dtype=np.float64)
+        self.bwd_middle = np.asarray(bwd_middle, dtype=np.int32)
+        self._index = {junction: i for i, junction in enumerate(self.junction_ids.tolist())}
+        self._fwd = (self.fwd_offsets.tolist(), self.fwd_targets.tolist(), self.fwd_weights.tolist(), self.fwd_middle.tolist())
+        self._bwd = (self.bwd_offsets.tolist(), self.bwd_targets.tolist(), self.bwd_weights.tolist(), self.bwd_middle.tolist())
+
+    @property
+    def shortcut_count(self):
+        return int((self.fwd_middle >= 0).sum() + (self.bwd_middle >= 0).sum())
+
+    @classmethod
+    def build(cls, graph, weight='distance', witness_limit=100, verbose=True):
+        """contracts all the nodes of a routingEngine.RoadGraph considering the given weight.
+           witness_limit is the maximum number of nodes settled by each witness search:
+           lower values are faster but add more (useless) shortcuts."""
+        n = graph.node_count
+        out_adj = [dict() for _ in range(n)]
+        in_adj = [dict() for _ in range(n)]
+        targets = graph.targets.tolist()
+        weights = graph.weights[weight].tolist()
+        offsets = graph.offsets.tolist()
+        for u in range(n):
+            for e in range(offsets[u], offsets[u + 1]):
+                v, w = targets[e], weights[e]
+                #relationships without weight and self loops are useless for the shortest paths
+                if w != w or v == u:
+                    continue
+                if w < out_adj[u].get(v, (float('inf'), -1))[0]:
+                    out_adj[u][v] = (w, -1)
+                    in_adj[v][u] = (w, -1)
+        contracted = [False] * n
+        deleted_neighbours = [0] * n
+        rank = [0] * n
+        fwd = [[] for _ in range(n)]
+        bwd = [[] for _ in range(n)]
+
+        def witness(source, excluded, limit_cost):
+            #bounded Dijkstra from source that ignores the node being contracted
+            dist = {source: 0.0}
+            queue = [(0.0, source)]
+            settled = 0
+            while queue and settled < witness_limit:
+                d, u = heapq.heappop(queue)
+                if d > dist[u]:
+                    continue
+                if d > limit_cost:
+                    break
+                settled += 1
+                for v, (w, _) in out_adj[u].items():
+                    if v == excluded:
+                        continue
+                    dv = d + w
+                    if dv < dist.get(v, float('inf')):
+                        dist[v] = dv
+                        heapq.heappush(queue, (dv, v))
+            return dist
+
+        def shortcuts(v):
+            #shortcuts needed to contract v
+            result = []
+            incoming = [(u, w) for u, (w, _) in in_adj[v].items()]
+            outgoing = [(x, w) for x, (w, _) in out_adj[v].items()]
+            if not outgoing:
+                return result
+            max_out = max(w for _, w in outgoing)
+            for u, w_in in incoming:
+                dist = witness(u, v, w_in + max_out)
+                for x, w_out in outgoing:
+                    if x == u:
+                        continue
+                    if dist.get(x, float('inf')) > w_in + w_out:
+                        result.append((u, x, w_in + w_out))
+            return result
+
+        def priority(v):
+            #edge difference plus the number of contracted neighbours, with the shortcuts of v
+            needed = shortcuts(v)
+            return len(needed) - len(in_adj[v]) - len(out_adj[v]) + deleted_neighbours[v], needed
+
+        queue = [(priority(v)[0], v) for v in range(n)]
+        heapq.heapify(queue)
+        level = 0
+        start = time.time()
+        while queue:
+            _, v = heapq.heappop(queue)
+            if contracted[v]:
+                continue
+            #lazy update of the priority
+            p, needed = priority(v)
+            if queue and p > queue[0][0]:
+                heapq.heappush(queue, (p, v))
+                continue
+            for u, x, w in needed:
+                if w < out_adj[u].get(x, (float('inf'), -1))[0]:
+                    out_adj[u][x] = (w, v)
+                    in_adj[x][u] = (w, v)
+            #the relationships still attached to v lead to more important nodes,
+            #they are moved to the upward graphs and removed from the remaining graph
+            for x, (w, middle) in out_adj[v].items():
+                fwd[v].append((x, w, middle))
+                deleted_neighbours[x] += 1
+                del in_adj[x][v]
+            for u, (w, middle) in in_adj[v].items():
+                bwd[v].append((u, w, middle))
+                deleted_neighbours[u] += 1
+                del out_adj[u][v]
+            out_adj[v] = {}
+            in_adj[v] = {}
+            contracted[v] = True
+            rank[v] = level
+            level += 1
+            if verbose and level % 10000 == 0:
+                print('{} of {} nodes contracted in {:.1f}s'.format(level, n, time.time() - start))
+        return cls(weight, graph.junction_ids, graph.lat, graph.lon, rank,
+                   *cls._to_csr(fwd), *cls._to_csr(bwd), graph.version, graph.fingerprint(weight))
+
+    @staticmethod
+    def _to_csr(adjacency):
+        offsets = np.zeros(len(adjacency) + 1, dtype=np.int64)
+        np.cumsum([len(edges) for edges in adjacency], out=offsets[1:])
+        edges = [edge for edges in adjacency for edge in edges]
+        targets = np.array([e[0] for e in edges], dtype=np.int32)
+        weights = np.array([e[1] for e in edges], dtype=np.float64)
+        middle = np.array([e[2] for e in edges], dtype=np.int32)
+        return offsets, targets, weights, middle
+
+    def save(self, path):
+        """store the hierarchy in a compressed .npz file"""
+        np.savez_compressed(path, weight=self.weight, junction_ids=self.junction_ids, lat=self.lat, lon=self.lon,
+                            rank=self.rank, fwd_offsets=self.fwd_offsets, fwd_targets=self.fwd_targets,
+                            fwd_weights=self.fwd_weights, fwd_middle=self.fwd_middle,
+                            bwd_offsets=self.bwd_offsets, bwd_targets=self.bwd_targets,
+                            bwd_weights=self.bwd_weights, bwd_middle=self.bwd_middle,
+                            **({} if self.version is None else {'version': self.version}),
+                            **({} if self.fingerprint is None else {'fingerprint': self.fingerprint}))
+
+    @classmethod
+    def load(cls, path):
+        """load a hierarchy previously stored with save"""
+        data = np.load(path)
+        return cls(data['weight'], data['junction_ids'], data['lat'], data['lon'], data['rank'],
+                   data['fwd_offsets'], data['fwd_targets'], data['fwd_weights'], data['fwd_middle'],
+                   data['bwd_offsets'], data['bwd_targets'], data['bwd_weights'], data['bwd_middle'],
+                   data['version'] if 'version' in data.files else None,
+                   data['fingerprint'] if 'fingerprint' in data.files else None)
+
+    def check(self, version=None, graph=None):
+        """raises ValueError if the hierarchy was built on another version of the primal graph or, when the
+           graph is given, on other routes or weights: its shortcuts would skip closed streets or keep old costs"""
+        if self.version is None or self.fingerprint is None:
+            raise ValueError('The hierarchy was saved without the version of the graph, build it again.')
+        if version is not None and self.version != version:
+            raise ValueError('The hierarchy was built on the version {} of the primal graph, the current one is {}: '
+                             'build it again.'.format(self.version, version))
+        if graph is not None and self.fingerprint != graph.fingerprint(self.weight):
+            raise ValueError('The hierarchy of the {} weight was built on different routes or weights, '
+                             'build it again.'.format(self.weight))
+
+    def query(self, source, target):
+        """bidirectional search between two node indexes.
+           Returns the total cost and the list of node indexes of the path or None if no path exists."""
+        fo, ft, fw, _ = self._fwd
+        bo, bt, bw, _ = self._bwd
+        dist = ({source: 0.0}, {target: 0.0})
+        parent = ({source: -1}, {target: -1})
+        queues = ([(0.0, source)], [(0.0, target)])
+        graphs = ((fo, ft, fw), (bo, bt, bw))
+        best, meeting = float('inf'), -1
+        if source == target:
+            return 0.0, [source]
+        while queues[0] or queues[1]:
+            #alternate the two directions, a direction stops when its minimum exceeds the best path
+            for side in (0, 1):
+                queue = queues[side]
+                if not queue:
+                    continue
+                d, u = heapq.heappop(queue)
+                if d >= best:
+                    queue.clear()
+                    continue
+                if d > dist[side][u]:
+                    continue
+                other = dist[1 - side].get(u)
+                if other is not None and d + other < best:
+                    best, meeting = d + other, u
+                offsets, targets, weights = graphs[side]
+                for e in range(offsets[u], offsets[u + 1]):
+                    v = targets[e]
+                    dv = d + weights[e]
+                    if dv < dist[side].get(v, float('inf')):
+                        dist[side][v] = dv
+                        parent[side][v] = u
+                        heapq.heappush(queue, (dv, v))
+        if meeting == -1:
+            return None
+        up = []
+        u = meeting
+        while u != -1:
+            up.append(u)
+            u = parent[0][u]
+        down = []
+        u = parent[1][meeting]
+        while u != -1:
+            down.append(u)
+            u = parent[1][u]
+        packed = up[::-1] + down
+        path = [packed[0]]
+        for a, b in zip(packed[:-1], packed[1:]):
+            self._unpack(a, b, path)
+        return best, path
+
+    def _edge_middle(self, a, b):
+        #middle node of the relationship a -> b of the hierarchy
+        if self.rank[a] < self.rank[b]:
+            offsets, targets, weights, middle = self._fwd
+            start, end, other = offsets[a], offsets[a + 1], b
+        else:
+            offsets, targets, weights, middle = self._bwd
+            start, end, other = offsets[b], offsets[b + 1], a
+        best, found = float('inf'), -1
+        for e in range(start, end):
+            if targets[e] == other and weights[e] < best:
+                best, found = weights[e], middle[e]
+        return found
+
+    def _unpack(self, a, b, path):
+        #replace the shortcuts with the original relationships
+        stack = [(a, b)]
+        while stack:
+            a, b = stack.pop()
+            middle = self._edge_middle(a, b)
+            if middle == -1:
+                path.append(b)
+            else:
+                stack.append((middle, b))
+                stack.append((a, middle))
+
+    def shortest_path(self, source, target):
+        """route between two junctions (osm ids), returns the same values of RoadGraph.shortest_path"""
+        result = self.query(self._index[int(source)], self._index[int(target)])
+        if result is None:
+            return []
+        cost, path = result
+        path = np.asarray(path, dtype=np.int64)
+        return [[source, target, cost, np.column_stack((self.lat[path], self.lon[path])).tolist()]]
+
+
+def add_options():
+    parser = argparse.ArgumentParser(description='Offline creation of the Contraction Hierarchies of the primal graph.')
+    parser.add_argument('--neo4jURL', '-n', dest='neo4jURL', type=str,
+                        help="""Insert the address of the local neo4j instance. For example: neo4j://localhost:7687""",
+                        required=True)
+    parser.add_argument('--neo4juser', '-u', dest='neo4juser', type=str,
+                        help="""Insert the name of the user of the local neo4j instance.""",
+                        required=True)
+    parser.add_argument('--neo4jpwd', '-p', dest='neo4jpwd', type=str,
+                        help="""Insert the password of the local neo4j instance.""",
+                        required=True)
+    parser.add_argument('--weight', '-w', dest='weight', type=str,
+                        help="""Insert the weight of the hierarchy: distance, traffic or both.""",
+                        choices=['distance', 'traffic', 'both'],
+                        required=False, default='both')
+    parser.add_argument('--fileOutput', '-f', dest='file_name', type=str,
+                        help="""Insert the prefix of the .npz files where the hierarchies are saved,
+                              the name of the weight is added as suffix.""",
+                        required=False, default='ch')
+    parser.add_argument('--graphFile', '-g', dest='graph_file', type=str,
+                        help="""Insert the path of the .npz file where the in-memory graph is cached.""",
+                        required=False, default=None)
+    parser.add_argument('--witnessLimit', '-l', dest='witness_limit', type=int,
+                        help="""Insert the maximum number of nodes settled by each witness search.""",
+                        required=False, default=100)
+    return parser
+
+
+def main(args=None):
+    argParser = add_options()
+    #retrieving arguments
+    options = argParser.parse_args(args=args)
+    #connecting to the neo4j instance and loading the graph in memory
+    greeter = routingEngine.App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
+    graph = routingEngine.load_graph(greeter, options.graph_file)
+    greeter.close()
+    weights = ['distance', 'traffic'] if options.weight == 'both' else [options.weight]
+    for weight in weights:
+        start = time.time()
+        ch = ContractionHierarchy.build(graph, weight, options.witness_limit)
+        ch.save(options.file_name + '_' + weight + '.npz')
+        print('{} hierarchy: {} shortcuts added in {:.1f}s, saved in {}'.format(
+            weight, ch.shortcut_count, time.time() - start, options.file_name + '_' + weight + '.npz'))
+    return 0
+
+
+if __name__ == "__main__":
+    main()
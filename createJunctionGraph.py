@@ -1,7 +1,10 @@
 import osmnx as ox
 import argparse
 from neo4j import GraphDatabase
-import os
+import graphLoader
+import graphVersion
+import osmCache
+import spatialLayer
 
 
 class App:
@@ -11,130 +14,50 @@ class App:
     def close(self):
         self.driver.close()
 
-    def creation_graph(self, file):
-        """create the graph from the .graphml file"""
-        with self.driver.session() as session:
-            result = session.write_transaction(self._creation_graph, file)
-            return result
-
-    @staticmethod
-    def _creation_graph(tx, file):
-        result = tx.run("""
-                        CALL apoc.import.graphml($file, {storeNodeIds: true, defaultRelationshipType: 'ROUTE'});
-                    """, file=file)
-        return result.values()
-
-    def get_path(self):
-        """gets the path of the neo4j instance"""
-        with self.driver.session() as session:
-            result = session.write_transaction(self._get_path)
-            return result
-
-    @staticmethod
-    def _get_path(tx):
-        result = tx.run("""
-                        Call dbms.listConfig() yield name,value where name = 'dbms.directories.neo4j_home' return value;
-                    """)
-        return result.values()
-        
-    def get_import_folder_name(self):
-        """get the name of the import directory for the neo4j instance"""
-        with self.driver.session() as session:
-            result = session.write_transaction(self._get_import_folder_name)
-            return result
-
-    @staticmethod
-    def _get_import_folder_name(tx):
-        result = tx.run("""
-                        Call dbms.listConfig() yield name,value where name = 'dbms.directories.import' return value;
-                    """)
-        return result.values()
-
-    def set_label(self):
-        """set the Node lable to nodes"""
-        with self.driver.session() as session:
-            result = session.write_transaction(self._creation_label)
-            return result
-
-    @staticmethod
-    def _creation_label(tx):
-        result = tx.run("""
-                        MATCH (n) SET n:RoadJunction;
-                    """)
-        return result.values()
+    def load_graph(self, G, batch_size=10000):
+        """write the junctions and the routes of the osmnx graph in batches of batch_size rows"""
+        nodes, edges = graphLoader.junction_frames(G)
+        graphLoader.load_frames(self.driver, nodes, edges, batch_size)
+        return len(nodes), len(edges)
 
-    def set_location(self):
-        """insert the location in the node attributes"""
+    def bump_versions(self):
+        #the projections and the caches of the previous graph are no longer valid
         with self.driver.session() as session:
-            result = session.write_transaction(self._creation_location)
-            return result
-
-    @staticmethod
-    def _creation_location(tx):
-        result = tx.run("""
-                           MATCH (n:RoadJunction) SET n.location = point({latitude: tofloat(n.y), longitude: tofloat(n.x)}),
-                                            n.lat = tofloat(n.y), 
-                                            n.lon = tofloat(n.x),
-                                            n.geometry='POINT(' + n.y + ' ' + n.x +')';
-                       """)
-        return result.values()
-
-    def set_distance(self):
-        """insert the distance in the nodes' relationships."""
-        with self.driver.session() as session:
-            result = session.write_transaction(self._set_distance)
-            return result
+            session.write_transaction(graphVersion.bump_version, graphVersion.PRIMAL)
 
-    @staticmethod
-    def _set_distance(tx):
-        result = tx.run("""
-                           MATCH (n:RoadJunction)-[r:ROUTE]-() SET r.distance=tofloat(r.length), r.status='active'
-                       """)
-        return result.values()
-    
     def set_index(self):
-        """create index on nodes"""
+        """create index on nodes and on the properties of the routes used to change the status of the streets"""
         with self.driver.session() as session:
             result = session.write_transaction(self._set_index)
+            session.write_transaction(self._set_route_index)
             return result
 
     @staticmethod
     def _set_index(tx):
         result = tx.run("""
-                           create index on :RoadJunction(id)
+                           create index road_junction_id if not exists for (n:RoadJunction) on (n.id)
                        """)
         return result.values()
-        
-    def generate_spatial_layer(self):
-        """generate the spatial layer of the project"""
-        with self.driver.session() as session:
-            result = session.write_transaction(self._generate_spatial_layer)
-            return result
 
     @staticmethod
-    def _generate_spatial_layer(tx):
+    def _set_route_index(tx):
+        #relationship property indexes, used by changeStreetStatus.py
+        tx.run("""
+                  create index route_name if not exists for ()-[r:ROUTE]-() on (r.name)
+               """)
         result = tx.run("""
-                call spatial.layers()
-                """)
-        if len(result.values()) == 0:
-            result = tx.run("""
-                call spatial.addWKTLayer('spatial', 'geometry')
-                """)
+                           create index route_osmid if not exists for ()-[r:ROUTE]-() on (r.osmid)
+                       """)
         return result.values()
         
-    def import_nodes_in_spatial_layer(self):
-        """insert the road junctions in the spatial layer of the project"""
+    def generate_spatial_layer(self):
+        """generate the spatial layer of the project"""
         with self.driver.session() as session:
-            result = session.write_transaction(self._import_nodes_in_spatial_layer)
-            return result
+            session.write_transaction(spatialLayer.generate_layer)
 
-    @staticmethod
-    def _import_nodes_in_spatial_layer(tx):
-        result = tx.run("""
-        match (n:RoadJunction)
-        CALL spatial.addNode('spatial', n) yield node return node;
-        """)
-        return result.values()
+    def import_nodes_in_spatial_layer(self, batch_size=1000):
+        """insert the road junctions in the spatial layer of the project, in batches of batch_size nodes"""
+        return spatialLayer.add_to_layer(self.driver, 'RoadJunction', batch_size=batch_size)
 
 
 def add_options():
@@ -158,8 +81,15 @@ def add_options():
                         help="""Insert the password of the local neo4j instance.""",
                         required=True)
     parser.add_argument('--nameFile', '-f', dest='file_name', type=str,
-                        help="""Insert the name of the .graphml file.""",
-                        required=True)
+                        help="""Insert the name of a .graphml file where to save also a copy of the graph.""",
+                        required=False, default=None)
+    parser.add_argument('--batchSize', '-b', dest='batch_size', type=int,
+                        help="""Insert the number of junctions or routes written in each transaction.""",
+                        required=False, default=10000)
+    parser.add_argument('--adminImport', '-a', dest='admin_directory', type=str,
+                        help="""Insert the path of a directory where to write the .csv files for neo4j-admin import
+                              instead of writing the graph through the driver (for very large regions).""",
+                        required=False, default=None)
     return parser
 
 
@@ -167,31 +97,34 @@ def main(args=None):
     argParser = add_options()
     #retireve attributes
     options = argParser.parse_args(args=args)
+    #using osmnx to download the road network, read from the local cache when already downloaded
+    G = osmCache.OsmCache().graph_from_point((options.lat, options.lon),
+                                             dist=int(options.dist),
+                                             dist_type='bbox',
+                                             simplify=False,
+                                             network_type='drive'
+                                             )
+    if options.file_name:
+        ox.save_graphml(G, options.file_name)
+    if options.admin_directory:
+        #the database is created offline by neo4j-admin, the indexes and the spatial layer later
+        nodes, edges = graphLoader.junction_frames(G)
+        nodes_path, edges_path = graphLoader.write_admin_csv(nodes, edges, options.admin_directory)
+        print('{} junctions and {} routes written, import them with:'.format(len(nodes), len(edges)))
+        print('neo4j-admin import --nodes={} --relationships={}'.format(nodes_path, edges_path))
+        return 0
     #connecting to the neo4j instance
     greeter = App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
-    path = greeter.get_path()[0][0] + '\\' + greeter.get_import_folder_name()[0][0] + '\\' + options.file_name
-    #using osmnx to generate the graphml file
-    G = ox.graph_from_point((options.lat, options.lon),
-                            dist=int(options.dist),
-                            dist_type='bbox',
-                            simplify=False,
-                            network_type='drive'
-                            )
-    ox.save_graphml(G, path)
     #check if there is a spatial layer and if there is not generate it
     greeter.generate_spatial_layer()
-    #creating the graph
-    greeter.creation_graph(options.file_name)
-    #setting nodes' labels
-    greeter.set_label()
-    #setting nodes' locations
-    greeter.set_location()
-    #setting nodes' distances
-    greeter.set_distance()
-    #setting index
+    #setting index, before the routes are matched on the ids of the junctions
     greeter.set_index()
+    #creating the graph with labels, locations and distances
+    junctions, routes = greeter.load_graph(G, options.batch_size)
+    print('{} junctions and {} routes imported'.format(junctions, routes))
+    greeter.bump_versions()
     #inserting the nodes in the spatial layer
-    
+
     greeter.close()
 
     return 0
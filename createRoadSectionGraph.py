@@ -1,7 +1,7 @@
-import osmnx as ox
 import argparse
 from neo4j import GraphDatabase
-import os
+import dualGraph
+import graphVersion
 
 
 class App:
@@ -11,44 +11,17 @@ class App:
     def close(self):
         self.driver.close()
 
-    def creation_graph(self):
-        #creation of the dual graph
+    def creation_graph(self, batch_size=10000):
+        #creation of the dual graph from the edge list of the primal graph
+        streets, connections = dualGraph.build(self.driver, batch_size)
+        print('{} streets and {} connections created'.format(streets, connections))
+        return streets, connections
+
+    def bump_versions(self):
+        #the projections and the caches of the previous dual graph are no longer valid
         with self.driver.session() as session:
-            result = session.write_transaction(self._creation_graph)
-            return result
+            session.write_transaction(graphVersion.bump_version, graphVersion.DUAL)
 
-    @staticmethod
-    def _creation_graph(tx):
-        #creation of nodes, a node for each street
-        result = tx.run("""
-                        match (m:RoadJunction)-[r:ROUTE {status: 'active'}]->(n:RoadJunction) 
-                        with distinct r.osmid as street_names
-                        unwind street_names as street_name
-                        create (road:RoadOsm {osmid: street_name})
-                        with street_name
-                        match (m:RoadJunction)-[r1:ROUTE {osmid: street_name, status: 'active'}]->(n:RoadJunction)
-                        with avg(r1.AADT) as AADT, sum(r1.distance) as dist,street_name,r1.name as road_name
-                        match (d:RoadOsm {osmid: street_name}) set d.traffic = AADT/dist, status = 'active',
-                                        d.AADT=AADT,d.distance = dist,d.name= road_name
-                    """)
-        print(result.values())
-        #creation of relations, a relation for each connection 
-        #(a junction will be represented by more than one connection)
-        result = tx.run("""
-                        match (m:RoadJunction)-[r:ROUTE]->(n:RoadJunction) 
-                        with distinct r.osmid as street_names
-                        unwind street_names as street_name
-                        match (m:RoadJunction)-[r1:ROUTE {osmid: street_name}]->(n:RoadJunction)
-                        with m,street_name
-                        match (x:RoadJunction)-[r2:ROUTE]->(m:RoadJunction)
-                        where r2.osmid <> street_name
-                        with r2.osmid as source,street_name,m
-                        match (r1:RoadOsm {osmid:source}),(r2:RoadOsm {osmid:street_name})
-                        create (r1)-[r:CONNECTED {junction: m.id,location: m.location}]->(r2)
-                    """)
-        print(result.values())
-        return result.values()
-        
     def set_index(self):
         """create index on nodes"""
         with self.driver.session() as session:
@@ -58,7 +31,7 @@ class App:
     @staticmethod
     def _set_index(tx):
         result = tx.run("""
-                           create index on :RoadOsm(osmid)
+                           create index road_osm_osmid if not exists for (r:RoadOsm) on (r.osmid)
                        """)
         return result.values()
 
@@ -73,6 +46,9 @@ def add_options():
     parser.add_argument('--neo4jpwd', '-p', dest='neo4jpwd', type=str,
                         help="""Insert the password of the local neo4j instance.""",
                         required=True)
+    parser.add_argument('--batchSize', '-b', dest='batch_size', type=int,
+                        help="""Insert the number of streets or connections written in each transaction.""",
+                        required=False, default=10000)
     return parser
 
 def main(args=None):
@@ -81,10 +57,11 @@ def main(args=None):
     options = argParser.parse_args(args=args)
     #connecting to the neo4j instance
     greeter = App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
-    #creation of the dual graph
-    greeter.creation_graph()
-    #set index on road nodes
+    #set index on road nodes, before the connections are matched on the osmids of the streets
     greeter.set_index()
+    #creation of the dual graph
+    greeter.creation_graph(options.batch_size)
+    greeter.bump_versions()
     greeter.close()
     return 0
 
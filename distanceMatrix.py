@@ -0,0 +1,206 @@
+from neo4j import GraphDatabase
+from multiprocessing import Pool
+import argparse
+import os
+import numpy as np
+import pandas as pd
+import routingEngine
+
+WEIGHTS = {'d': 'distance', 'h': 'hops', 't': 'traffic'}
+
+
+class App:
+    def __init__(self, uri, user, password):
+        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+
+    def close(self):
+        self.driver.close()
+
+    def read_poi_junctions(self, pois=None):
+        """returns the road junctions near to each point of interest with their distance,
+           for all the points of interest connected to the road network when pois is None"""
+        with self.driver.session() as session:
+            result = session.read_transaction(self._read_poi_junctions, pois)
+            return result
+
+    @staticmethod
+    def _read_poi_junctions(tx, pois):
+        if pois is None:
+            result = tx.run("""
+                    MATCH (p:PointOfInterest)-[:MEMBER]->(:OSMWayNode)-[r:NEAR]->(j:RoadJunction)
+                    RETURN p.osm_id AS poi, j.id AS junction, min(r.distance) AS distance
+                    """)
+        else:
+            result = tx.run("""
+                    UNWIND $pois AS poi
+                    MATCH (p:PointOfInterest {osm_id: poi})-[:MEMBER]->(:OSMWayNode)-[r:NEAR]->(j:RoadJunction)
+                    RETURN p.osm_id AS poi, j.id AS junction, min(r.distance) AS distance
+                    """, pois=pois)
+        return pd.DataFrame(result.values(), columns=['poi', 'junction', 'distance'])
+
+
+class MatrixBuilder:
+    """Matrix of the costs (distance, hops or traffic) between all the pairs of a list of points of interest.
+       Each row is evaluated with one shortest path tree from the junctions near to the source
+       on the in-memory graph. The matrix is written in a .npy file opened as a memory map
+       (prefix.npy), with the osm ids of the points of interest, the mode and the version of the primal graph
+       (prefix_index.npz) and the rows already completed (prefix_done.npy): an interrupted run continues from
+       the missing rows, unless the graph has changed in the meantime. Unreachable pairs have an infinite cost."""
+
+    def __init__(self, graph, candidates, mode='d'):
+        self.graph = graph
+        self.mode = mode
+        self.weight = WEIGHTS[mode]
+        self.pois = np.array(sorted(candidates.poi.unique()), dtype=np.int64)
+        #connections of every point of interest to its junctions, as virtual edges of the graph
+        self.connections = []
+        for poi, group in candidates.groupby('poi', sort=True):
+            edges = graph.virtual_edges(dict(zip(group.junction, group.distance)), mode)
+            self.connections.append(edges)
+        self.target_poi = np.concatenate([np.full(len(edges), i, dtype=np.int64)
+                                          for i, edges in enumerate(self.connections)] + [np.empty(0, np.int64)])
+        self.target_node = np.array([v for edges in self.connections for v in edges], dtype=np.int64)
+        self.target_cost = np.array([c for edges in self.connections for c in edges.values()], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.pois)
+
+    def row(self, i):
+        """costs from the i-th point of interest to all the others"""
+        row = np.full(len(self.pois), np.inf)
+        if len(self.connections[i]) > 0:
+            costs = self.graph.reachable(self.connections[i], self.weight)
+            dist = np.full(self.graph.node_count, np.inf)
+            dist[np.fromiter(costs.keys(), dtype=np.int64, count=len(costs))] = \
+                np.fromiter(costs.values(), dtype=np.float64, count=len(costs))
+            np.minimum.at(row, self.target_poi, dist[self.target_node] + self.target_cost)
+        row[i] = 0.0
+        return row
+
+    @staticmethod
+    def _matches(prefix, pois, mode, version):
+        if not all(os.path.exists(prefix + suffix) for suffix in ('.npy', '_index.npz', '_done.npy')):
+            return False
+        index = np.load(prefix + '_index.npz')
+        #the rows of an unknown version of the graph are never reused
+        if version is None or 'version' not in index.files or int(index['version']) != version:
+            return False
+        return str(index['mode']) == mode and np.array_equal(index['pois'], pois)
+
+    def open(self, prefix):
+        """opens the files of the matrix, creating them when they do not exist or when they have been
+           created for other points of interest, another mode or another version of the primal graph"""
+        pois = self.pois
+        if self._matches(prefix, pois, self.mode, self.graph.version):
+            matrix = np.load(prefix + '.npy', mmap_mode='r+')
+            done = np.load(prefix + '_done.npy', mmap_mode='r+')
+            return matrix, done
+        if os.path.exists(prefix + '.npy'):
+            print('{}.npy has been evaluated on other points of interest, mode or graph: it is evaluated again'.format(prefix))
+        np.savez(prefix + '_index.npz', pois=pois, mode=self.mode,
+                 **({} if self.graph.version is None else {'version': self.graph.version}))
+        matrix = np.lib.format.open_memmap(prefix + '.npy', mode='w+', dtype=np.float64, shape=(len(pois), len(pois)))
+        matrix[:] = np.nan
+        done = np.lib.format.open_memmap(prefix + '_done.npy', mode='w+', dtype=bool, shape=(len(pois),))
+        done[:] = False
+        matrix.flush()
+        done.flush()
+        return matrix, done
+
+    def build(self, prefix, workers=1, flush=100):
+        """evaluates the missing rows of the matrix with a pool of processes and returns the matrix"""
+        matrix, done = self.open(prefix)
+        missing = np.flatnonzero(~done).tolist()
+        print('{} of {} rows to evaluate'.format(len(missing), len(self.pois)))
+        with Pool(processes=max(workers, 1), initializer=_init_worker, initargs=(self,)) as pool:
+            for count, (i, row) in enumerate(pool.imap_unordered(_row_task, missing, chunksize=4), 1):
+                matrix[i] = row
+                done[i] = True
+                if count % flush == 0:
+                    #the rows are marked as done only after they are written
+                    matrix.flush()
+                    done.flush()
+                    print('{} of {} rows evaluated'.format(count, len(missing)))
+        matrix.flush()
+        done.flush()
+        return matrix
+
+
+#builder shared by the processes of the pool
+_pool_builder = None
+
+
+def _init_worker(builder):
+    global _pool_builder
+    _pool_builder = builder
+
+
+def _row_task(i):
+    return i, _pool_builder.row(i)
+
+
+def add_options():
+    parser = argparse.ArgumentParser(description='Matrix of the costs between points of interest on the road network.')
+    parser.add_argument('--pois', '-f', dest='poi_file', type=str,
+                        help="""Insert the path of a .csv file with the column poi (OSM ids of the points of interest).
+                              All the points of interest connected to the road network are used when it is not provided.""",
+                        required=False, default=None)
+    parser.add_argument('--mode', '-m', dest='mode', type=str,
+                        help="""Insert the cost: distance[d], hops[h] or traffic volume[t].""",
+                        required=False, default='d')
+    parser.add_argument('--output', '-o', dest='output', type=str,
+                        help="""Insert the prefix of the output files (prefix.npy, prefix_index.npz and prefix_done.npy).
+                              The run continues from the rows already evaluated with the same prefix.""",
+                        required=False, default='matrix')
+    parser.add_argument('--npz', dest='npz', action='store_true',
+                        help="""Write also the matrix and the osm ids in a compressed prefix.npz file at the end.""")
+    parser.add_argument('--workers', '-w', dest='workers', type=int,
+                        help="""Insert the number of processes used to evaluate the rows.""",
+                        required=False, default=1)
+    parser.add_argument('--graphFile', '-g', dest='graph_file', type=str,
+                        help="""Insert the path of the .npz file where the in-memory graph is cached.""",
+                        required=False, default=None)
+    parser.add_argument('--neo4jURL', '-n', dest='neo4jURL', type=str,
+                        help="""Insert the address of the local neo4j instance. For example: neo4j://localhost:7687""",
+                        required=True)
+    parser.add_argument('--neo4juser', '-u', dest='neo4juser', type=str,
+                        help="""Insert the name of the user of the local neo4j instance.""",
+                        required=True)
+    parser.add_argument('--neo4jpwd', '-p', dest='neo4jpwd', type=str,
+                        help="""Insert the password of the local neo4j instance.""",
+                        required=True)
+    return parser
+
+
+def main(args=None):
+    argParser = add_options()
+    #retrieving arguments
+    options = argParser.parse_args(args=args)
+    mode = options.mode.lower()[:1]
+    if mode not in WEIGHTS:
+        argParser.error('the mode must be distance[d], hops[h] or traffic volume[t]')
+    pois = None
+    if options.poi_file:
+        pois = pd.read_csv(options.poi_file, dtype=str)['poi'].astype('int64').tolist()
+    #loading the graph and the junctions near to the points of interest only once
+    greeter = App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
+    candidates = greeter.read_poi_junctions(pois)
+    greeter.close()
+    candidates['poi'] = candidates['poi'].astype('int64')
+    candidates['junction'] = candidates['junction'].astype('int64')
+    if pois is not None and len(set(pois) - set(candidates.poi)) > 0:
+        print('points of interest not connected to the road network: {}'.format(sorted(set(pois) - set(candidates.poi))))
+    engine = routingEngine.App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
+    graph = routingEngine.load_graph(engine, options.graph_file)
+    engine.close()
+    builder = MatrixBuilder(graph, candidates, mode)
+    matrix = builder.build(options.output, options.workers)
+    print('{} x {} matrix saved in {}.npy'.format(len(builder), len(builder), options.output))
+    if options.npz:
+        np.savez_compressed(options.output + '.npz', matrix=np.asarray(matrix), pois=builder.pois, mode=mode)
+        print('matrix saved in ' + options.output + '.npz')
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Set-based construction of the dual graph (RoadOsm nodes and CONNECTED relationships).
+   The ROUTE relationships of the primal graph are read once and the streets and their connections
+   are computed with group-bys on the edge list, instead of matching again all the routes for every
+   street; the result is written in batches. A RoadOsm node is created for each street (osmid) with
+   at least an active route, with the average AADT, the total distance, the name and the traffic
+   (AADT / distance) of its active routes. A CONNECTED relationship goes from a street to another one
+   for each junction where a route of the first street ends and a route of the second one starts.
+   After a change of some streets (status or AADT) update recomputes only their RoadOsm nodes and
+   the CONNECTED relationships incident to them, in batches of streets, and increments the version
+   of the dual graph."""
+import pandas as pd
+import numpy as np
+import graphVersion
+
+ROUTE_COLUMNS = ['source', 'target', 'osmid', 'name', 'AADT', 'distance', 'status']
+
+
+def read_routes(tx, osmids=None):
+    """the ROUTE relationships as a DataFrame, only the ones of the given streets when osmids is not None"""
+    if osmids is None:
+        result = tx.run("""
+                    MATCH (m:RoadJunction)-[r:ROUTE]->(n:RoadJunction)
+                    RETURN m.id AS source, n.id AS target, r.osmid AS osmid, r.name AS name,
+                           r.AADT AS AADT, r.distance AS distance, r.status AS status""")
+    else:
+        result = tx.run("""
+                    UNWIND $osmids AS osmid
+                    MATCH (m:RoadJunction)-[r:ROUTE {osmid: osmid}]->(n:RoadJunction)
+                    RETURN m.id AS source, n.id AS target, r.osmid AS osmid, r.name AS name,
+                           r.AADT AS AADT, r.distance AS distance, r.status AS status""", osmids=list(osmids))
+    routes = pd.DataFrame(result.values(), columns=ROUTE_COLUMNS)
+    routes['AADT'] = pd.to_numeric(routes['AADT'], errors='coerce')
+    routes['distance'] = pd.to_numeric(routes['distance'], errors='coerce')
+    return routes[routes.osmid.notna()]
+
+
+def street_nodes(routes):
+    """a row for each street with an active route: osmid, AADT, distance, traffic and name"""
+    active = routes[routes.status == 'active']
+    streets = active.groupby('osmid', sort=True).agg(AADT=('AADT', 'mean'), distance=('distance', 'sum'),
+                                                     name=('name', 'first')).reset_index()
+    streets['traffic'] = streets['AADT'] / streets['distance'].replace(0, np.nan)
+    return streets
+
+
+def street_connections(routes, streets=None):
+    """a row (source street, target street, junction) for each junction where a route of the source street
+       ends and a route of the target street starts; only between the given streets when they are not None"""
+    incoming = routes[['target', 'osmid']].rename(columns={'target': 'junction', 'osmid': 'source'})
+    outgoing = routes[['source', 'osmid']].rename(columns={'source': 'junction', 'osmid': 'target'})
+    connections = incoming.drop_duplicates().merge(outgoing.drop_duplicates(), on='junction')
+    connections = connections[connections.source != connections.target]
+    if streets is not None:
+        connections = connections[connections.source.isin(streets) & connections.target.isin(streets)]
+    return connections[['source', 'target', 'junction']].reset_index(drop=True)
+
+
+def _rows(frame):
+    #null values instead of NaN, so the properties are not set
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+
+def write_streets(tx, rows):
+    tx.run("""
+                UNWIND $rows AS row
+                MERGE (d:RoadOsm {osmid: row.osmid})
+                SET d.AADT = row.AADT, d.distance = row.distance, d.traffic = row.traffic,
+                    d.name = row.name, d.status = 'active'
+                """, rows=rows).consume()
+
+
+def write_connections(tx, rows):
+    tx.run("""
+                UNWIND $rows AS row
+                MATCH (a:RoadOsm {osmid: row.source})
+                MATCH (b:RoadOsm {osmid: row.target})
+                MATCH (j:RoadJunction {id: row.junction})
+                CREATE (a)-[:CONNECTED {junction: j.id, location: j.location}]->(b)
+                """, rows=rows).consume()
+
+
+def _delete_streets(tx, batch_size):
+    result = tx.run("""
+                MATCH (d:RoadOsm)
+                WITH d LIMIT $batch_size
+                DETACH DELETE d
+                RETURN count(*)
+                """, batch_size=batch_size)
+    return result.single()[0]
+
+
+def write_batches(session, function, frame, batch_size, name, progress=print):
+    for start in range(0, len(frame), batch_size):
+        session.write_transaction(function, _rows(frame.iloc[start:start + batch_size]))
+        if progress is not None:
+            progress('{} of {} {} written'.format(min(start + batch_size, len(frame)), len(frame), name))
+
+
+def build(driver, batch_size=10000, progress=print):
+    """builds again the whole dual graph from the primal graph, returns the number of streets and connections.
+       The index on RoadOsm(osmid) must exist."""
+    with driver.session() as session:
+        while session.write_transaction(_delete_streets, batch_size) > 0:
+            pass
+        routes = session.read_transaction(read_routes)
+        streets = street_nodes(routes)
+        connections = street_connections(routes, set(streets.osmid))
+        write_batches(session, write_streets, streets, batch_size, 'streets', progress)
+        write_batches(session, write_connections, connections, batch_size, 'connections', progress)
+    return len(streets), len(connections)
+
+
+def _read_junction_routes(tx, osmids):
+    #the routes of the streets and all the other routes through their junctions
+    result = tx.run("""
+                UNWIND $osmids AS osmid
+                MATCH (m:RoadJunction)-[:ROUTE {osmid: osmid}]->(n:RoadJunction)
+                UNWIND [m, n] AS junction
+                WITH DISTINCT junction
+                MATCH (junction)-[r:ROUTE]-(:RoadJunction)
+                WITH DISTINCT r
+                RETURN startNode(r).id AS source, endNode(r).id AS target, r.osmid AS osmid, r.name AS name,
+                       r.AADT AS AADT, r.distance AS distance, r.status AS status""", osmids=osmids)
+    routes = pd.DataFrame(result.values(), columns=ROUTE_COLUMNS)
+    routes['AADT'] = pd.to_numeric(routes['AADT'], errors='coerce')
+    routes['distance'] = pd.to_numeric(routes['distance'], errors='coerce')
+    return routes[routes.osmid.notna()]
+
+
+def _existing_streets(tx, osmids):
+    result = tx.run("""
+                UNWIND $osmids AS osmid
+                MATCH (d:RoadOsm {osmid: osmid})
+                RETURN d.osmid""", osmids=osmids)
+    return {record[0] for record in result}
+
+
+def update_streets(tx, osmids):
+    """transaction function of update: recomputes the RoadOsm nodes of the given streets and the
+       CONNECTED relationships incident to them. A street without active routes keeps its node with
+       the status 'close'. Returns the number of streets and of connections written."""
+    osmids = sorted({str(osmid) for osmid in osmids})
+    if len(osmids) == 0 or tx.run("MATCH (d:RoadOsm) RETURN d LIMIT 1").single() is None:
+        #the dual graph has not been created
+        return 0, 0
+    routes = _read_junction_routes(tx, osmids)
+    routes['osmid'] = routes['osmid'].astype(str)
+    streets = street_nodes(routes[routes.osmid.isin(osmids)])
+    closed = sorted(set(osmids) - set(streets.osmid))
+    write_streets(tx, _rows(streets))
+    result = tx.run("""
+                UNWIND $osmids AS osmid
+                MATCH (d:RoadOsm {osmid: osmid})
+                SET d.status = 'close'
+                RETURN count(d)
+                """, osmids=closed)
+    closed_count = result.single()[0]
+    #the nodes of the dual graph: the other streets through the junctions with a node and the changed ones
+    others = sorted(set(routes.osmid) - set(osmids))
+    nodes = _existing_streets(tx, others + closed) | set(streets.osmid)
+    connections = street_connections(routes, nodes)
+    connections = connections[connections.source.isin(osmids) | connections.target.isin(osmids)]
+    tx.run("""
+                UNWIND $osmids AS osmid
+                MATCH (:RoadOsm {osmid: osmid})-[c:CONNECTED]-(:RoadOsm)
+                WITH DISTINCT c
+                DELETE c
+                """, osmids=osmids).consume()
+    write_connections(tx, _rows(connections))
+    return len(streets) + closed_count, len(connections)
+
+
+def _has_dual_graph(tx):
+    return tx.run("MATCH (d:RoadOsm) RETURN d LIMIT 1").single() is not None
+
+
+def update(driver, osmids, batch_size=10000, progress=print):
+    """incremental update of the dual graph after a change of the ROUTE relationships of the given
+       streets (osmids), in batches of batch_size streets, one transaction per batch, then the version
+       of the dual graph is incremented. Nothing is done when the dual graph has not been created.
+       Returns the number of streets and of connections written."""
+    osmids = sorted({str(osmid) for osmid in osmids})
+    streets = connections = 0
+    with driver.session() as session:
+        if len(osmids) == 0 or not session.read_transaction(_has_dual_graph):
+            return streets, connections
+        #the connections between streets of different batches are written again by the later batch
+        for start in range(0, len(osmids), batch_size):
+            written = session.write_transaction(update_streets, osmids[start:start + batch_size])
+            streets, connections = streets + written[0], connections + written[1]
+            if progress is not None:
+                progress('{} of {} streets of the dual graph updated'.format(min(start + batch_size, len(osmids)), len(osmids)))
+        session.write_transaction(graphVersion.bump_version, graphVersion.DUAL)
+    return streets, connections
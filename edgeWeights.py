@@ -0,0 +1,124 @@
+from neo4j import GraphDatabase
+import argparse
+import graphVersion
+
+
+class App:
+    """Materialization of the normalized traffic weight of the ROUTE relationships.
+       The weight mixes the AADT and the distance normalized on their range:
+       aadt_coefficient * (AADT - min AADT) / (max AADT - min AADT)
+       + distance_coefficient * (distance - min distance) / (max distance - min distance)
+       and it is stored in r.traffic, so the projections read it instead of aggregating
+       the minimum and the maximum of all the relationships every time.
+       The ranges and the coefficients are stored in the (:EdgeWeights {name: 'traffic'}) node:
+       when they do not change, only the relationships whose AADT changed since the last
+       materialization (r.traffic_AADT <> r.AADT) are written again."""
+
+    def __init__(self, uri, user, password):
+        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+
+    def close(self):
+        self.driver.close()
+
+    def materialize(self, aadt_coefficient=None, distance_coefficient=None, full=False):
+        """computes the traffic weight of the relationships that need it, all of them when the ranges
+           or the coefficients changed or full is True. The coefficients not given are the ones of the
+           last materialization (0.5 the first time). Returns the number of relationships written."""
+        with self.driver.session() as session:
+            return session.write_transaction(materialize_weights, aadt_coefficient, distance_coefficient, full)
+
+    def bump_versions(self):
+        #the projections built on the previous weights are no longer valid
+        with self.driver.session() as session:
+            session.write_transaction(graphVersion.bump_version, graphVersion.PRIMAL)
+
+
+def materialize_weights(tx, aadt_coefficient=None, distance_coefficient=None, full=False):
+    """transaction function of App.materialize, used also after the import of the traffic"""
+    stored = read_weights(tx)
+    if aadt_coefficient is None:
+        aadt_coefficient = stored['aadt_coefficient'] if stored else 0.5
+    if distance_coefficient is None:
+        distance_coefficient = stored['distance_coefficient'] if stored else 0.5
+    ranges = tx.run("""
+                MATCH (:RoadJunction)-[r:ROUTE]->(:RoadJunction)
+                RETURN min(r.AADT) AS min_AADT, max(r.AADT) AS max_AADT,
+                       min(r.distance) AS min_distance, max(r.distance) AS max_distance
+                """).single().data()
+    parameters = dict(ranges, aadt_coefficient=aadt_coefficient, distance_coefficient=distance_coefficient)
+    full = full or stored != parameters
+    result = tx.run("""
+                MATCH (:RoadJunction)-[r:ROUTE]->(:RoadJunction)
+                WHERE $full OR (r.AADT IS NOT NULL AND (r.traffic_AADT IS NULL OR r.traffic_AADT <> r.AADT))
+                SET r.traffic = $aadt_coefficient * toFloat(r.AADT - $min_AADT) / ($max_AADT - $min_AADT)
+                                + $distance_coefficient * toFloat(r.distance - $min_distance) / ($max_distance - $min_distance),
+                    r.traffic_AADT = r.AADT
+                RETURN count(r)
+                """, full=full, **parameters)
+    count = result.single()[0]
+    tx.run("""
+                MERGE (w:EdgeWeights {name: 'traffic'})
+                SET w += $parameters, w.updated = timestamp()
+                """, parameters=parameters).consume()
+    return count
+
+
+def changed_streets(tx):
+    """osmids of the streets with a route whose AADT changed since the last materialization"""
+    result = tx.run("""
+                MATCH (:RoadJunction)-[r:ROUTE]->(:RoadJunction)
+                WHERE r.AADT IS NOT NULL AND (r.traffic_AADT IS NULL OR r.traffic_AADT <> r.AADT)
+                RETURN DISTINCT r.osmid
+                """)
+    return [record[0] for record in result]
+
+
+def read_weights(tx):
+    """returns the ranges and the coefficients of the materialized traffic weight, None if it has never been computed"""
+    result = tx.run("""
+                OPTIONAL MATCH (w:EdgeWeights {name: 'traffic'})
+                RETURN w {.min_AADT, .max_AADT, .min_distance, .max_distance,
+                          .aadt_coefficient, .distance_coefficient} AS weights
+                """)
+    return result.single()[0]
+
+
+def add_options():
+    parser = argparse.ArgumentParser(description='Materialization of the normalized traffic weight of the primal graph.')
+    parser.add_argument('--neo4jURL', '-n', dest='neo4jURL', type=str,
+                        help="""Insert the address of the local neo4j instance. For example: neo4j://localhost:7687""",
+                        required=True)
+    parser.add_argument('--neo4juser', '-u', dest='neo4juser', type=str,
+                        help="""Insert the name of the user of the local neo4j instance.""",
+                        required=True)
+    parser.add_argument('--neo4jpwd', '-p', dest='neo4jpwd', type=str,
+                        help="""Insert the password of the local neo4j instance.""",
+                        required=True)
+    parser.add_argument('--aadtCoefficient', '-a', dest='aadt_coefficient', type=float,
+                        help="""Insert the coefficient of the normalized AADT in the traffic weight.
+                              By default the coefficient of the last materialization, 0.5 the first time.""",
+                        required=False, default=None)
+    parser.add_argument('--distanceCoefficient', '-d', dest='distance_coefficient', type=float,
+                        help="""Insert the coefficient of the normalized distance in the traffic weight.
+                              By default the coefficient of the last materialization, 0.5 the first time.""",
+                        required=False, default=None)
+    parser.add_argument('--full', dest='full', action='store_true',
+                        help="""Compute the weight of all the relationships, not only of the changed ones.""")
+    return parser
+
+
+def main(args=None):
+    argParser = add_options()
+    #retrieving arguments
+    options = argParser.parse_args(args=args)
+    greeter = App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
+    count = greeter.materialize(options.aadt_coefficient, options.distance_coefficient, options.full)
+    print('traffic weight written on {} routes'.format(count))
+    if count > 0:
+        greeter.bump_versions()
+    greeter.close()
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,35 @@
 from neo4j import GraphDatabase
+from functools import partial
 import folium as fo
 import argparse
+import projectionManager
+import graphVersion
 
 
 class App:
     def __init__(self, uri, user, password):
         self.driver = GraphDatabase.driver(uri, auth=(user, password))
+        self.projections = projectionManager.ProjectionManager(self.driver)
+        #name of the projection in use
+        self.graph = None
 
     def close(self):
         self.driver.close()
 
     def create_projected_graph(self,mode):
-        """This method creates a new graph as a projection of the existing nodes and relations. 
+        """This method gets from the projection manager a projection of the existing nodes and relations,
+           creating it if it does not exist for the current version of the graph.
            The mode parameter is set to 'r' for dual graph and 'j' for primal graph."""
-        with self.driver.session() as session:
-            path = session.read_transaction(self._projected_graph,mode)
+        graph = graphVersion.DUAL if mode == 'r' else graphVersion.PRIMAL
+        self.graph = self.projections.acquire(graph, 'analysis', partial(self._projected_graph, mode=mode))
+        return self.graph
 
     @staticmethod
-    def _projected_graph(tx,mode):
+    def _projected_graph(tx,name,mode):
         if(mode == 'r'):
             str = """
                 CALL gds.graph.create.cypher(
-                    "graph",
+                    $name,
                     "MATCH (n) where n:RoadOsm RETURN id(n) AS id",
                     "MATCH (n)-[r:CONNECTED]->(m) return id(n) as source,id(m) as target,type(r) as type,r.location as location,r.junction as junction"
                 )
@@ -29,26 +37,20 @@ class App:
         else:
             str = """
                 CALL gds.graph.create.cypher(
-                    "graph",
+                    $name,
                     "MATCH (n) where n:RoadJunction or n:OSMWayNode RETURN id(n) AS id, n.lat AS lat, n.lon AS lon",
-                    "MATCH ()-[r:ROUTE]->() with min(r.AADT) as min_AADT,max(r.AADT) as max_AADT,max(r.distance) as max_dist,min(r.distance) as min_dist MATCH (n)-[r:ROUTE]->(m) WHERE r.status = 'active' RETURN id(n) AS source, id(m) AS target, 0.5 * toFloat((r.AADT-min_AADT)/(max_AADT-min_AADT)) + 0.5 * toFloat((r.distance-min_dist)/(max_dist-min_dist)) as traffic, r.AADT as AADT, r.distance as distance, type(r) as type"
+                    "MATCH (n)-[r:ROUTE]->(m) WHERE r.status = 'active' RETURN id(n) AS source, id(m) AS target, r.traffic as traffic, r.AADT as AADT, r.distance as distance, type(r) as type"
                 )
                         """
-        result = tx.run(str)
-        return result
+        result = tx.run(str, name=name)
+        return result.consume()
 
     def delete_projected_graph(self):
-        """This method deletes an existing graph projection. 
-           The mode parameter is set to 'r' for dual graph and 'j' for primal graph."""
-        with self.driver.session() as session:
-            path = session.read_transaction(self._drop_projected_graph)
-
-    @staticmethod
-    def _drop_projected_graph(tx):
-        result = tx.run("""
-                CALL gds.graph.drop('graph')
-                        """)
-        return result
+        """This method releases the projection in use: the projection manager drops it
+           when it is no longer used by anyone."""
+        if self.graph is not None:
+            self.projections.release(self.graph)
+            self.graph = None
 
     def countNodes(self,mode):
         """the method counts the number of nodes of mode label"""
@@ -85,63 +87,63 @@ class App:
     def outgoingDegree(self):
         """the method counts the number of outgoing relationships from each node"""
         with self.driver.session() as session:
-            result = session.write_transaction(self._outgoingDegree)
+            result = session.write_transaction(self._outgoingDegree, self.graph)
         return result
     @staticmethod
-    def _outgoingDegree(tx):
+    def _outgoingDegree(tx, graph):
         result = tx.run("""CALL gds.degree.stream(
-        'graph',
+        $graph,
         { orientation: 'REVERSE' }
         )
         YIELD nodeId, score
-        RETURN round(avg(score),2) AS outgoing""")
+        RETURN round(avg(score),2) AS outgoing""", graph=graph)
         print('{} is the average outgoing degree'.format(result.values()[0][0]))
         return result
 
     def incomingDegree(self):
         """the method counts the number of incoming relationships from each node"""
         with self.driver.session() as session:
-            result = session.write_transaction(self._incomingDegree)
+            result = session.write_transaction(self._incomingDegree, self.graph)
         return result
     @staticmethod
-    def _incomingDegree(tx):
+    def _incomingDegree(tx, graph):
         result = tx.run("""
         CALL gds.degree.stream(
-        'graph'
+        $graph
         )
         YIELD nodeId, score
-        RETURN round(avg(score),2) AS incoming""")
+        RETURN round(avg(score),2) AS incoming""", graph=graph)
         print("{} is the average incoming degree of nodes".format(result.values()[0][0]))
         return result
 
     def undirectedDegree(self):
         """the method counts the number of incoming and outgoing relationships from each node"""
         with self.driver.session() as session:
-            result = session.write_transaction(self._undirectedDegree)
+            result = session.write_transaction(self._undirectedDegree, self.graph)
         return result
     @staticmethod
-    def _undirectedDegree(tx):
+    def _undirectedDegree(tx, graph):
         result = tx.run("""
         CALL gds.degree.stream(
-        'graph',
+        $graph,
         { orientation: 'undirected' }
         )
         YIELD nodeId, score
-        RETURN round(avg(score),2) AS undirected""")
+        RETURN round(avg(score),2) AS undirected""", graph=graph)
         print("{} is the average undirected degree of nodes".format(result.values()[0][0]))
         return result
 
     def summarize(self):
         """the method counts the total number of relationships, the total number of nodes and the density of the graph."""
         with self.driver.session() as session:
-            result = session.write_transaction(self._summarize)
+            result = session.write_transaction(self._summarize, self.graph)
         return result
     @staticmethod
-    def _summarize(tx):
+    def _summarize(tx, graph):
         result = tx.run("""
-        CALL gds.graph.list()
+        CALL gds.graph.list($graph)
         YIELD graphName, nodeCount, relationshipCount,density
-        RETURN graphName, nodeCount, relationshipCount,round(density,6)""")
+        RETURN graphName, nodeCount, relationshipCount,round(density,6)""", graph=graph)
         print("The density of the graph is {}.".format(result.values()[0][3]))
         return result
 
@@ -184,7 +186,7 @@ def main(args=None):
     greeter.undirectedDegree()
     #retrieving additional statistics (density)
     greeter.summarize()
-    #removing the projected graph
+    #releasing the projected graph
     greeter.delete_projected_graph()
     greeter.close()
     return 0
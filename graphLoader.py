@@ -0,0 +1,102 @@
+import os
+import numpy as np
+import pandas as pd
+
+#properties computed by the loader, the other attributes of osmnx are stored as strings as in the .graphml files
+NODE_COLUMNS = ['id', 'lat', 'lon', 'geometry']
+EDGE_COLUMNS = ['source', 'target', 'distance']
+
+
+def junction_frames(G):
+    """nodes and edges of an osmnx graph as two DataFrames ready to be written in the database.
+       The nodes have the osm id (id), lat, lon and the WKT geometry used by the spatial layer, the
+       edges the osm ids of their ends (source, target) and the distance in meters; all the other
+       attributes of osmnx are kept as strings, as apoc.import.graphml stores them."""
+    nodes = pd.DataFrame.from_dict(dict(G.nodes(data=True)), orient='index')
+    attributes = list(nodes.columns)
+    nodes = _stringify(nodes, attributes)
+    nodes['id'] = nodes.index.astype(str)
+    nodes['lat'] = nodes['y'].astype(np.float64)
+    nodes['lon'] = nodes['x'].astype(np.float64)
+    nodes['geometry'] = 'POINT(' + nodes['y'] + ' ' + nodes['x'] + ')'
+    nodes = nodes[NODE_COLUMNS + attributes].reset_index(drop=True)
+    edges = pd.DataFrame([dict(data, source=u, target=v) for u, v, data in G.edges(data=True)])
+    if len(edges) == 0:
+        return nodes, pd.DataFrame(columns=EDGE_COLUMNS)
+    attributes = [column for column in edges.columns if column not in ('source', 'target')]
+    edges = _stringify(edges, attributes)
+    edges['source'] = edges['source'].astype(str)
+    edges['target'] = edges['target'].astype(str)
+    edges['distance'] = edges['length'].astype(np.float64)
+    return nodes, edges[EDGE_COLUMNS + attributes]
+
+
+def _stringify(frame, columns):
+    """the attributes as strings, missing values stay null"""
+    for column in columns:
+        frame[column] = frame[column].map(str).where(frame[column].notna(), None)
+    return frame
+
+
+def _records(frame, columns):
+    """rows of the frame as parameters of the queries: the computed columns and a map of the
+       other attributes without the null ones, so that they are not set on the node or the relationship"""
+    attributes = [column for column in frame.columns if column not in columns]
+    values = frame[columns].to_dict('records')
+    for row, properties in zip(values, frame[attributes].to_dict('records')):
+        row['properties'] = {key: value for key, value in properties.items() if not pd.isna(value)}
+    return values
+
+
+def write_nodes(tx, rows):
+    tx.run("""
+                UNWIND $rows AS row
+                MERGE (n:RoadJunction {id: row.id})
+                SET n += row.properties,
+                    n.lat = row.lat, n.lon = row.lon,
+                    n.location = point({latitude: row.lat, longitude: row.lon}),
+                    n.geometry = row.geometry
+                """, rows=rows).consume()
+
+
+def write_edges(tx, rows):
+    tx.run("""
+                UNWIND $rows AS row
+                MATCH (a:RoadJunction {id: row.source})
+                MATCH (b:RoadJunction {id: row.target})
+                CREATE (a)-[r:ROUTE]->(b)
+                SET r += row.properties, r.distance = row.distance, r.status = 'active'
+                """, rows=rows).consume()
+
+
+def load_frames(driver, nodes, edges, batch_size=10000, progress=print):
+    """writes the nodes and then the edges in batches of batch_size rows, one transaction per batch,
+       so the memory used by the database does not grow with the size of the region.
+       The index on RoadJunction(id) must exist before the edges are written."""
+    with driver.session() as session:
+        for name, frame, columns, function in (('junctions', nodes, NODE_COLUMNS, write_nodes),
+                                               ('routes', edges, EDGE_COLUMNS, write_edges)):
+            for start in range(0, len(frame), batch_size):
+                rows = _records(frame.iloc[start:start + batch_size], columns)
+                session.write_transaction(function, rows)
+                if progress is not None:
+                    progress('{} of {} {} written'.format(min(start + batch_size, len(frame)), len(frame), name))
+
+
+def write_admin_csv(nodes, edges, directory):
+    """writes the nodes and the relationships in the format of neo4j-admin import, for the regions
+       too large to be written through the driver. Returns the paths of the two files."""
+    os.makedirs(directory, exist_ok=True)
+    header = {'id': 'id:ID', 'lat': 'lat:float', 'lon': 'lon:float'}
+    frame = nodes.rename(columns=header)
+    frame.insert(3, 'location:point{crs:WGS-84}',
+                 '{latitude:' + nodes['lat'].map(repr) + ',longitude:' + nodes['lon'].map(repr) + '}')
+    frame[':LABEL'] = 'RoadJunction'
+    nodes_path = os.path.join(directory, 'junctions.csv')
+    frame.to_csv(nodes_path, index=False)
+    frame = edges.rename(columns={'source': ':START_ID', 'target': ':END_ID', 'distance': 'distance:float'})
+    frame['status'] = 'active'
+    frame[':TYPE'] = 'ROUTE'
+    edges_path = os.path.join(directory, 'routes.csv')
+    frame.to_csv(edges_path, index=False)
+    return nodes_path, edges_path
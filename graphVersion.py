@@ -0,0 +1,29 @@
+"""Version counters of the graphs stored in the database.
+   Every script that changes the content of a graph (closing streets, importing traffic, updating
+   the road sections) increments the version of the graph, so that the projections, the caches and
+   the in-memory copies built on an older version are recognised as outdated.
+   The counters are stored in (:GraphVersion {name, version}) nodes, the names used are
+   'primal' for the RoadJunction/ROUTE graph, 'dual' for the RoadOsm/CONNECTED graph and 'cycleways'
+   and 'footways' for the subgraphs of the cycleways and of the footways."""
+
+PRIMAL = 'primal'
+DUAL = 'dual'
+CYCLEWAYS = 'cycleways'
+FOOTWAYS = 'footways'
+
+
+def get_version(tx, name):
+    """returns the current version of the graph, 0 if it has never been changed"""
+    result = tx.run("""
+                OPTIONAL MATCH (v:GraphVersion {name: $name})
+                RETURN coalesce(v.version, 0) AS version""", name=name)
+    return result.single()[0]
+
+
+def bump_version(tx, name):
+    """increments the version of the graph and returns the new value"""
+    result = tx.run("""
+                MERGE (v:GraphVersion {name: $name})
+                SET v.version = coalesce(v.version, 0) + 1, v.updated = timestamp()
+                RETURN v.version AS version""", name=name)
+    return result.single()[0]
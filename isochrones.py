@@ -0,0 +1,176 @@
+from neo4j import GraphDatabase
+from multiprocessing import Pool
+from shapely.geometry import MultiPoint, mapping
+from shapely.ops import triangulate, transform, unary_union
+import folium as fo
+import argparse
+import json
+import numpy as np
+import pandas as pd
+import routingEngine
+
+MODES = {'d': 'distance', 'h': 'hops', 't': 'traffic'}
+
+
+class App:
+    def __init__(self, uri, user, password):
+        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+
+    def close(self):
+        self.driver.close()
+
+    def read_poi_junctions(self, pois):
+        """returns the road junctions near to each point of interest with their distance"""
+        with self.driver.session() as session:
+            result = session.read_transaction(self._read_poi_junctions, pois)
+            return result
+
+    @staticmethod
+    def _read_poi_junctions(tx, pois):
+        result = tx.run("""
+                    UNWIND $pois AS poi
+                    MATCH (p:PointOfInterest {osm_id: poi})-[:MEMBER]->(:OSMWayNode)-[r:NEAR]->(j:RoadJunction)
+                    RETURN p.osm_id AS poi, j.id AS junction, min(r.distance) AS distance
+                    """, pois=pois)
+        return pd.DataFrame(result.values(), columns=['poi', 'junction', 'distance'])
+
+
+def concave_hull(lat, lon, max_edge=500.0):
+    """concave hull of the points as a GeoJSON geometry (longitude, latitude): the union of the
+       triangles of the Delaunay triangulation whose sides are not longer than max_edge meters.
+       Less than three points or a too small max_edge give the convex hull."""
+    if len(lat) == 0:
+        return None
+    lat0 = np.radians(np.mean(lat))
+    scale = np.pi / 180 * routingEngine.EARTH_RADIUS
+    #local equirectangular projection in meters around the points
+    points = MultiPoint(list(zip(np.asarray(lon) * scale * np.cos(lat0), np.asarray(lat) * scale)))
+    hull = points.convex_hull
+    if len(lat) >= 3:
+        triangles = [t for t in triangulate(points)
+                     if max(np.hypot(*np.diff(np.asarray(t.exterior.coords), axis=0).T)) <= max_edge]
+        if len(triangles) > 0:
+            hull = unary_union(triangles)
+    return mapping(transform(lambda x, y: (x / (scale * np.cos(lat0)), y / scale), hull))
+
+
+def isochrone(graph, candidates, poi, limit, mode='d', max_edge=500.0):
+    """junctions reachable from the point of interest within limit and their concave hull"""
+    near = candidates[candidates.poi == poi]
+    nodes, costs = graph.isochrone(dict(zip(near.junction, near.distance)), limit, mode)
+    return {'poi': poi, 'mode': MODES[mode[:1]], 'limit': limit,
+            'junctions': graph.junction_ids[nodes].tolist(), 'costs': costs.tolist(),
+            'coordinates': graph.coordinates(nodes),
+            'polygon': concave_hull(graph.lat[nodes], graph.lon[nodes], max_edge)}
+
+
+#graph and candidate junctions shared by the processes of the pool
+_pool_graph = None
+_pool_candidates = None
+
+
+def _init_worker(graph, candidates):
+    global _pool_graph, _pool_candidates
+    _pool_graph = graph
+    _pool_candidates = candidates
+
+
+def _isochrone_task(task):
+    return isochrone(_pool_graph, _pool_candidates, *task)
+
+
+def to_feature(result):
+    """the isochrone as a GeoJSON Feature with the hull as geometry"""
+    properties = {'poi': result['poi'], 'mode': result['mode'], 'limit': result['limit'],
+                  'junctions': len(result['junctions'])}
+    return {'type': 'Feature', 'geometry': result['polygon'], 'properties': properties}
+
+
+def add_options():
+    parser = argparse.ArgumentParser(description='Road junctions reachable from points of interest within a distance or a cost.')
+    parser.add_argument('--source', '-s', dest='sources', type=int, action='append',
+                        help="""Insert the OSM id of a point of interest. It can be repeated.""",
+                        required=False, default=[])
+    parser.add_argument('--batch', '-b', dest='batch', type=str,
+                        help="""Insert the path of a .csv file with the column source (OSM ids of the points of interest).""",
+                        required=False, default=None)
+    parser.add_argument('--mode', '-m', dest='mode', type=str,
+                        help="""Insert the cost: distance[d], hops[h] or traffic volume[t].""",
+                        required=False, default='d')
+    parser.add_argument('--limit', '-c', dest='limit', type=float,
+                        help="""Insert the maximum cost: meters for the distance, number of routes for the hops.""",
+                        required=True)
+    parser.add_argument('--maxEdge', '-e', dest='max_edge', type=float,
+                        help="""Insert the maximum length in meters of the sides of the triangles of the concave hull.""",
+                        required=False, default=500.0)
+    parser.add_argument('--neo4jURL', '-n', dest='neo4jURL', type=str,
+                        help="""Insert the address of the local neo4j instance. For example: neo4j://localhost:7687""",
+                        required=True)
+    parser.add_argument('--neo4juser', '-u', dest='neo4juser', type=str,
+                        help="""Insert the name of the user of the local neo4j instance.""",
+                        required=True)
+    parser.add_argument('--neo4jpwd', '-p', dest='neo4jpwd', type=str,
+                        help="""Insert the password of the local neo4j instance.""",
+                        required=True)
+    parser.add_argument('--graphFile', '-g', dest='graph_file', type=str,
+                        help="""Insert the path of the .npz file where the in-memory graph is cached.""",
+                        required=False, default=None)
+    parser.add_argument('--workers', '-w', dest='workers', type=int,
+                        help="""Insert the number of processes used to evaluate the isochrones.""",
+                        required=False, default=1)
+    parser.add_argument('--output', '-o', dest='output', type=str,
+                        help="""Insert the path of the output file: .geojson for the hulls only,
+                              .jsonl for the junctions, their costs and the hulls.""",
+                        required=False, default='isochrones.geojson')
+    parser.add_argument('--fileOutput', '-f', dest='mapName', type=str,
+                        help="""Insert the path of the file of the resulting map.""",
+                        required=False, default='isochrones.html')
+    return parser
+
+
+def main(args=None):
+    argParser = add_options()
+    #retrieving arguments
+    options = argParser.parse_args(args=args)
+    mode = options.mode.lower()[:1]
+    if mode not in MODES:
+        argParser.error('the mode must be distance[d], hops[h] or traffic volume[t]')
+    pois = list(options.sources)
+    if options.batch:
+        pois += pd.read_csv(options.batch, dtype=str)['source'].astype('int64').tolist()
+    if len(pois) == 0:
+        argParser.error('at least a source or a batch file is required')
+    #loading the graph and the junctions near to the points of interest only once
+    greeter = App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
+    candidates = greeter.read_poi_junctions(pois)
+    greeter.close()
+    candidates['junction'] = candidates['junction'].astype('int64')
+    engine = routingEngine.App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
+    graph = routingEngine.load_graph(engine, options.graph_file)
+    engine.close()
+    tasks = [(poi, options.limit, mode, options.max_edge) for poi in pois]
+    with Pool(processes=max(options.workers, 1), initializer=_init_worker,
+              initargs=(graph, candidates)) as pool:
+        results = pool.map(_isochrone_task, tasks, chunksize=4)
+    with open(options.output, 'w') as f:
+        if options.output.endswith('.jsonl'):
+            for result in results:
+                f.write(json.dumps(result) + '\n')
+        else:
+            json.dump({'type': 'FeatureCollection', 'features': [to_feature(result) for result in results]}, f)
+    for result in results:
+        print('{}: {} junctions reachable within {} ({})'.format(result['poi'], len(result['junctions']),
+                                                                 result['limit'], result['mode']))
+    print('results saved in ' + options.output)
+    #add the hulls to the map
+    reached = [result for result in results if result['polygon'] is not None]
+    if len(reached) > 0:
+        m = fo.Map(location=reached[0]['coordinates'][0], zoom_start=13)
+        for result in reached:
+            fo.GeoJson(to_feature(result), tooltip=str(result['poi'])).add_to(m)
+        m.save(options.mapName)
+    return 0
+
+
+if __name__ == "__main__":
+    main()
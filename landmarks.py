@@ -0,0 +1,140 @@
+import argparse
+import time
+import numpy as np
+import routingEngine
+
+
+class Landmarks:
+    """Landmark distance tables of the in-memory primal graph for one weight (distance or traffic),
+       used as A* heuristic with the triangle inequality (ALT).
+       For a landmark L the cost from v to t is at least d(L, t) - d(L, v) and d(v, L) - d(t, L):
+       the bounds stay admissible also after closing streets in memory, because removing relationships
+       can only increase the cost of the shortest paths. They are not admissible any more when the
+       weights change (a new import of the traffic) or when streets are opened in the database, so the
+       tables keep the fingerprint of the graph they were computed on and refuse any other graph."""
+
+    def __init__(self, weight, junction_ids, landmarks, from_landmark, to_landmark, fingerprint=None):
+        self.weight = str(weight)
+        #osm ids of the junctions of the graph, used to check that the tables match the graph
+        self.junction_ids = np.asarray(junction_ids, dtype=np.int64)
+        #RoadGraph.fingerprint of the weight when the tables were computed
+        self.fingerprint = None if fingerprint is None else str(fingerprint)
+        self.landmarks = np.asarray(landmarks, dtype=np.int32)
+        #from_landmark[i, v] = d(landmark i, v), to_landmark[i, v] = d(v, landmark i)
+        self.from_landmark = np.asarray(from_landmark, dtype=np.float64)
+        self.to_landmark = np.asarray(to_landmark, dtype=np.float64)
+
+    @property
+    def count(self):
+        return len(self.landmarks)
+
+    @classmethod
+    def build(cls, graph, weight='distance', count=16, seed=0, verbose=True):
+        """selects the landmarks of a routingEngine.RoadGraph with the farthest strategy and computes
+           their distance tables: each new landmark is the node whose cost from the landmarks already
+           selected is the highest, so that the landmarks lie on the border of the road network."""
+        if not np.isfinite(graph.weights[weight]).any():
+            raise ValueError('No relationship has a value for the weight ' + weight)
+        n = graph.node_count
+        count = min(count, n)
+        #the first landmark is the farthest node from a random start
+        start = int(np.random.default_rng(seed).integers(n))
+        candidate = cls._farthest(graph.distances(start, weight))
+        landmarks, from_landmark, to_landmark = [], [], []
+        closest = np.full(n, np.inf)
+        while len(landmarks) < count and candidate not in landmarks:
+            landmarks.append(candidate)
+            from_landmark.append(graph.distances(candidate, weight))
+            to_landmark.append(graph.distances(candidate, weight, reverse=True))
+            np.fmin(closest, np.where(np.isfinite(from_landmark[-1]), from_landmark[-1], np.nan), out=closest)
+            candidate = cls._farthest(closest)
+            if verbose:
+                print('{} landmark {} of {} selected'.format(weight, len(landmarks), count))
+        return cls(weight, graph.junction_ids, landmarks, np.array(from_landmark), np.array(to_landmark),
+                   graph.fingerprint(weight))
+
+    @staticmethod
+    def _farthest(dist):
+        #node with the highest finite cost, unreachable nodes are ignored
+        return int(np.nanargmax(np.where(np.isfinite(dist), dist, np.nan)))
+
+    def check(self, graph):
+        """raises ValueError if the tables were computed on a different graph or on different weights"""
+        if not np.array_equal(self.junction_ids, graph.junction_ids):
+            raise ValueError('The landmarks were computed on a different graph, build them again.')
+        if self.fingerprint is None or self.fingerprint != graph.fingerprint(self.weight):
+            raise ValueError('The landmarks of the {} weight were computed before the last change of the routes '
+                             'or of their weights, build them again.'.format(self.weight))
+
+    def lower_bounds(self, target):
+        """admissible lower bound of the cost from every node to the target node index"""
+        with np.errstate(invalid='ignore'):
+            forward = self.from_landmark[:, [target]] - self.from_landmark
+            backward = self.to_landmark - self.to_landmark[:, [target]]
+        #inf - inf means that the landmark gives no information on the pair of nodes
+        bounds = np.fmax.reduce(np.fmax(forward, backward), axis=0)
+        return np.maximum(np.nan_to_num(bounds, nan=0.0, posinf=np.inf, neginf=0.0), 0.0)
+
+    def save(self, path):
+        """store the tables in a compressed .npz file"""
+        np.savez_compressed(path, weight=self.weight, junction_ids=self.junction_ids, landmarks=self.landmarks,
+                            from_landmark=self.from_landmark, to_landmark=self.to_landmark,
+                            **({} if self.fingerprint is None else {'fingerprint': self.fingerprint}))
+
+    @classmethod
+    def load(cls, path):
+        """load the tables previously stored with save"""
+        data = np.load(path)
+        return cls(data['weight'], data['junction_ids'], data['landmarks'],
+                   data['from_landmark'], data['to_landmark'],
+                   data['fingerprint'] if 'fingerprint' in data.files else None)
+
+
+def add_options():
+    parser = argparse.ArgumentParser(description='Selection of the landmarks of the primal graph and computation of their distance tables.')
+    parser.add_argument('--neo4jURL', '-n', dest='neo4jURL', type=str,
+                        help="""Insert the address of the local neo4j instance. For example: neo4j://localhost:7687""",
+                        required=True)
+    parser.add_argument('--neo4juser', '-u', dest='neo4juser', type=str,
+                        help="""Insert the name of the user of the local neo4j instance.""",
+                        required=True)
+    parser.add_argument('--neo4jpwd', '-p', dest='neo4jpwd', type=str,
+                        help="""Insert the password of the local neo4j instance.""",
+                        required=True)
+    parser.add_argument('--weight', '-w', dest='weight', type=str,
+                        help="""Insert the weight of the tables: distance, traffic or both.""",
+                        choices=['distance', 'traffic', 'both'],
+                        required=False, default='both')
+    parser.add_argument('--landmarks', '-k', dest='count', type=int,
+                        help="""Insert the number of landmarks.""",
+                        required=False, default=16)
+    parser.add_argument('--fileOutput', '-f', dest='file_name', type=str,
+                        help="""Insert the prefix of the .npz files where the tables are saved,
+                              the name of the weight is added as suffix.""",
+                        required=False, default='landmarks')
+    parser.add_argument('--graphFile', '-g', dest='graph_file', type=str,
+                        help="""Insert the path of the .npz file where the in-memory graph is cached.""",
+                        required=False, default=None)
+    return parser
+
+
+def main(args=None):
+    argParser = add_options()
+    #retrieving arguments
+    options = argParser.parse_args(args=args)
+    #connecting to the neo4j instance and loading the graph in memory
+    greeter = routingEngine.App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
+    graph = routingEngine.load_graph(greeter, options.graph_file)
+    greeter.close()
+    weights = ['distance', 'traffic'] if options.weight == 'both' else [options.weight]
+    for weight in weights:
+        start = time.time()
+        table = Landmarks.build(graph, weight, options.count)
+        table.save(options.file_name + '_' + weight + '.npz')
+        print('{} landmarks of the {} weight computed in {:.1f}s, saved in {}'.format(
+            table.count, weight, time.time() - start, options.file_name + '_' + weight + '.npz'))
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import numpy as np
+import graphVersion
+
+
+class NodeStore:
+    """Client-side copy of the attributes used in the path results: for each node the internal
+       neo4j id, the osm id and the coordinates, stored in arrays sorted by internal id.
+       The path queries return only the internal ids of the nodes and the attributes are resolved
+       locally, instead of calling gds.util.asNode for every node of every path.
+       The arrays are loaded once and read again when the version of the graph changes."""
+
+    def __init__(self, driver, labels=None, graph=graphVersion.PRIMAL):
+        self.driver = driver
+        #labels of the nodes to load, all the nodes with coordinates when None
+        self.labels = labels
+        self.graph = graph
+        self.version = None
+        self.node_ids = np.empty(0, dtype=np.int64)
+        self.osm_ids = np.empty(0, dtype=np.int64)
+        self.lat = np.empty(0, dtype=np.float64)
+        self.lon = np.empty(0, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def refresh(self):
+        """reads the nodes again if the version of the graph has changed since the last load"""
+        with self.driver.session() as session:
+            version = session.read_transaction(graphVersion.get_version, self.graph)
+            if version != self.version:
+                self._load(session)
+                self.version = version
+        return self
+
+    def _load(self, session):
+        rows = []
+        for label in (self.labels or [None]):
+            rows.extend(session.read_transaction(self._read_nodes, label))
+        if len(rows) == 0:
+            return
+        node_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        node_ids, first = np.unique(node_ids, return_index=True)
+        self.node_ids = node_ids
+        self.osm_ids = np.array([rows[i][1] for i in first])
+        self.lat = np.array([rows[i][2] for i in first], dtype=np.float64)
+        self.lon = np.array([rows[i][3] for i in first], dtype=np.float64)
+
+    @staticmethod
+    def _read_nodes(tx, label):
+        if label is None:
+            query = """MATCH (n) WHERE n.lat IS NOT NULL AND n.lon IS NOT NULL
+                       RETURN id(n) AS node_id, n.id AS osm_id, n.lat AS lat, n.lon AS lon"""
+        else:
+            query = """MATCH (n:`""" + label + """`)
+                       RETURN id(n) AS node_id, n.id AS osm_id, n.lat AS lat, n.lon AS lon"""
+        result = tx.run(query)
+        return result.values()
+
+    def positions(self, node_ids):
+        """positions in the arrays of the given internal ids. The nodes created after the last load
+           (for example new points of interest) are read from the database on the first miss."""
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        for attempt in range(2):
+            positions = np.searchsorted(self.node_ids, node_ids)
+            found = positions < len(self.node_ids)
+            found[found] = self.node_ids[positions[found]] == node_ids[found]
+            if found.all():
+                return positions
+            if attempt == 0:
+                with self.driver.session() as session:
+                    self._load(session)
+        raise KeyError('Nodes not found: {}'.format(node_ids[~found].tolist()))
+
+    def coordinates(self, node_ids):
+        """list of [lat, lon] pairs of the nodes with the given internal ids"""
+        if len(node_ids) == 0:
+            return []
+        positions = self.positions(node_ids)
+        return np.column_stack((self.lat[positions], self.lon[positions])).tolist()
+
+    def ids(self, node_ids):
+        """list of the osm ids of the nodes with the given internal ids"""
+        if len(node_ids) == 0:
+            return []
+        positions = self.positions(node_ids)
+        return self.osm_ids[positions].tolist()
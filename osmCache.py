@@ -0,0 +1,74 @@
+"""Local cache of the data downloaded from OpenStreetMap, shared by the importers.
+   Every download is stored once under a key computed from its kind and its parameters (the text
+   of the Overpass query, or the center, the distance and the filters of the osmnx graph), so running
+   again a script on the same area reads the data from the disk. The Overpass responses are stored as
+   compressed json files and the osmnx graphs as compressed pickles, in one directory per kind.
+   The directory is given by the environment variable OSM_CACHE (~/.cache/roadRouting/osm by default);
+   with OSM_OFFLINE=1 nothing is downloaded and a missing entry raises OfflineError."""
+import gzip
+import hashlib
+import json
+import os
+import pickle
+import requests
+
+OVERPASS_URL = 'http://overpass-api.de/api/interpreter'
+
+
+class OfflineError(LookupError):
+    """the data is not in the cache and the downloads are disabled"""
+
+
+class OsmCache:
+    def __init__(self, directory=None, offline=None):
+        if directory is None:
+            directory = os.environ.get('OSM_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'roadRouting', 'osm'))
+        if offline is None:
+            offline = os.environ.get('OSM_OFFLINE', '').lower() in ('1', 'true', 'yes')
+        self.directory = directory
+        self.offline = offline
+
+    @staticmethod
+    def key(kind, **parameters):
+        """content address of a download: the hash of its kind and of its parameters"""
+        text = json.dumps({'kind': kind, 'parameters': parameters}, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def path(self, kind, key, extension):
+        return os.path.join(self.directory, kind, key + extension)
+
+    def _cached(self, kind, parameters, extension, read, write, download):
+        path = self.path(kind, self.key(kind, **parameters), extension)
+        if os.path.exists(path):
+            with gzip.open(path, 'rb') as f:
+                return read(f)
+        if self.offline:
+            raise OfflineError('{} {} is not in the cache {}'.format(kind, parameters, self.directory))
+        data = download()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        #written under another name and renamed, an interrupted run does not leave a broken entry
+        temporary = path + '.tmp'
+        with gzip.open(temporary, 'wb') as f:
+            write(data, f)
+        os.replace(temporary, path)
+        return data
+
+    def overpass(self, query, url=OVERPASS_URL):
+        """the json response of the Overpass API to the query (the query must ask for [out:json])"""
+        def download():
+            result = requests.get(url, params={'data': query})
+            result.raise_for_status()
+            return result.json()
+        return self._cached('overpass', {'query': query}, '.json.gz',
+                            lambda f: json.loads(f.read().decode('utf-8')),
+                            lambda data, f: f.write(json.dumps(data).encode('utf-8')),
+                            download)
+
+    def graph_from_point(self, center_point, **parameters):
+        """the osmnx graph returned by ox.graph_from_point(center_point, **parameters)"""
+        def download():
+            import osmnx as ox
+            return ox.graph_from_point(center_point, **parameters)
+        return self._cached('graph_from_point', dict(parameters, center_point=list(center_point)), '.pickle.gz',
+                            pickle.load, lambda data, f: pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL),
+                            download)
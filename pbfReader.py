@@ -0,0 +1,130 @@
+"""Extraction of the OSM data from a local .osm.pbf (or .osm) file, as an alternative to the Overpass API.
+   A single streaming pass over the file selects the cycleways, the footways, the crossings mapped as
+   ways and as nodes and the amenities around a point, with the same filters of the Overpass queries of
+   Data_Extraction (createQueryCycleways, createQueryFootways, createQueryCrossingWays and
+   createQueryCrossingNodes) and of amenity.py. The elements are returned in the format of the
+   json responses of Overpass (out geom for the ways, out body for the nodes), so the scripts build
+   the same GeoDataFrames and the same files from them.
+   A way is around the point when one of its nodes is within the distance."""
+import math
+import re
+import osmium
+
+EARTH_RADIUS = 6371008.8
+
+#highways where the bicycles are allowed unless bicycle=no or bicycle=dismount (createQueryCycleways)
+BICYCLE_HIGHWAYS = {'residential', 'track', 'service', 'primary', 'primary_link', 'secondary', 'secondary_link',
+                    'tertiary', 'tertiary_link', 'road', 'unclassified', 'living_street', 'path', 'padestrian'}
+FOOT_HIGHWAYS = {'footway', 'path', 'steps', 'pedestrian'}
+SIDEWALKS = {'left', 'both', 'right'}
+KINDS = ['cycleways', 'footways', 'crossing_ways', 'crossing_nodes', 'amenity_ways', 'amenity_nodes']
+
+
+def _not_matching(tags, key, pattern):
+    #the overpass filter [key!~"pattern"] is true also when the key is missing
+    return key not in tags or re.search(pattern, tags[key]) is None
+
+
+def is_cycleway(tags):
+    highway = tags.get('highway')
+    if highway == 'cycleway':
+        return True
+    if highway in BICYCLE_HIGHWAYS and _not_matching(tags, 'bicycle', 'no') and _not_matching(tags, 'bicycle', 'dismount'):
+        return True
+    return 'cycleway' in tags and _not_matching(tags, 'cycleway', 'no')
+
+
+def is_footway(tags):
+    return (tags.get('highway') in FOOT_HIGHWAYS or tags.get('footway') == 'sidewalk'
+            or tags.get('foot') in ('yes', 'designated') or ('highway' in tags and tags.get('sidewalk') in SIDEWALKS))
+
+
+def is_crossing_way(tags):
+    return ('crossing' in tags or tags.get('highway') == 'crossing' or tags.get('footway') == 'crossing'
+            or tags.get('cycleway') == 'crossing')
+
+
+def is_crossing_node(tags):
+    return 'crossing' in tags or tags.get('footway') == 'crossing' or tags.get('cycleway') == 'crossing'
+
+
+WAY_FILTERS = {'cycleways': is_cycleway, 'footways': is_footway, 'crossing_ways': is_crossing_way,
+               'amenity_ways': lambda tags: 'amenity' in tags}
+NODE_FILTERS = {'crossing_nodes': is_crossing_node, 'amenity_nodes': lambda tags: 'amenity' in tags}
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """great circle distance in meters"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+class _AroundHandler(osmium.SimpleHandler):
+    def __init__(self, lat, lon, dist):
+        super().__init__()
+        self.lat, self.lon, self.dist = lat, lon, dist
+        #bounding box of the circle, to skip the distance of the elements far away
+        self.dlat = math.degrees(dist / EARTH_RADIUS)
+        self.dlon = self.dlat / max(math.cos(math.radians(lat)), 1e-6)
+        self.elements = {kind: [] for kind in KINDS}
+        #tags of the tagged nodes near to the area, for the nodes of the amenity ways (out body)
+        self.node_tags = {}
+
+    def around(self, lat, lon, scale=1.0):
+        if abs(lat - self.lat) > self.dlat * scale or abs(lon - self.lon) > self.dlon * scale:
+            return False
+        return distance(self.lat, self.lon, lat, lon) <= self.dist * scale
+
+    def node(self, n):
+        if len(n.tags) == 0 or not n.location.valid():
+            return
+        lat, lon = n.location.lat, n.location.lon
+        if not self.around(lat, lon, 2.0):
+            return
+        tags = {tag.k: tag.v for tag in n.tags}
+        self.node_tags[n.id] = tags
+        if not self.around(lat, lon):
+            return
+        for kind, accept in NODE_FILTERS.items():
+            if accept(tags):
+                self.elements[kind].append({'type': 'node', 'id': n.id, 'lat': lat, 'lon': lon, 'tags': tags})
+
+    def way(self, w):
+        if len(w.tags) == 0:
+            return
+        tags = {tag.k: tag.v for tag in w.tags}
+        kinds = [kind for kind, accept in WAY_FILTERS.items() if accept(tags)]
+        if len(kinds) == 0:
+            return
+        nodes = [(node.ref, node.location.lat, node.location.lon) for node in w.nodes if node.location.valid()]
+        if not any(self.around(lat, lon) for _, lat, lon in nodes):
+            return
+        for kind in kinds:
+            if kind == 'amenity_ways':
+                self.elements[kind].append({'type': 'way', 'id': w.id, 'nodes': [ref for ref, _, _ in nodes], 'tags': tags})
+                #the nodes of the ways, as the recursion (._;>;) of the query of amenity.py
+                self.elements[kind].extend({'type': 'node', 'id': ref, 'lat': lat, 'lon': lon,
+                                            'tags': self.node_tags.get(ref, {})} for ref, lat, lon in nodes)
+            else:
+                self.elements[kind].append({'type': 'way', 'id': w.id, 'tags': tags,
+                                            'nodes': [ref for ref, _, _ in nodes],
+                                            'geometry': [{'lat': lat, 'lon': lon} for _, lat, lon in nodes]})
+
+
+def read_pbf(path, lat, lon, dist):
+    """elements of each kind (see KINDS) around the point within dist meters, read in a single pass.
+       The ways have the coordinates of their nodes from the node locations of the same file."""
+    handler = _AroundHandler(lat, lon, dist)
+    handler.apply_file(path, locations=True)
+    elements = {}
+    for kind, found in handler.elements.items():
+        #one element for each id, the nodes before the ways as in the responses of Overpass
+        unique = {(element['type'], element['id']): element for element in found}
+        elements[kind] = sorted(unique.values(), key=lambda element: (element['type'] != 'node', element['id']))
+    return elements
+
+
+def response(elements):
+    """the elements as the json response of the Overpass API (for overpy.Result.from_json)"""
+    return {'version': 0.6, 'generator': 'pbfReader', 'elements': elements}
@@ -0,0 +1,146 @@
+from contextlib import contextmanager
+import re
+import graphVersion
+
+
+class ProjectionManager:
+    """Shared lifecycle of the GDS projections.
+       The projections are named after their content (graph, weight and version of the graph),
+       so the scripts reuse the projections already in the catalog instead of creating them again
+       and different users never collide on the same name. Each user holds a lease on the
+       projection, stored in a (:ProjectionLease {name, refs, last_used}) node; the projections
+       without users are dropped when they are not used for ttl seconds or when there are more
+       than max_projections of them (least recently used first)."""
+
+    def __init__(self, driver, max_projections=4, ttl=3600, lease_timeout=86400):
+        self.driver = driver
+        self.max_projections = max_projections
+        self.ttl = ttl
+        #leases held for more than lease_timeout seconds belong to crashed processes
+        self.lease_timeout = lease_timeout
+        self._constraint = False
+
+    @staticmethod
+    def projection_name(graph, weight, version):
+        """name of the projection of the given graph, weight and version"""
+        return re.sub(r'[^A-Za-z0-9_]', '_', '{}_{}_v{}'.format(graph, weight, version))
+
+    def current_name(self, graph, weight):
+        """name of the projection of the current version of the graph with the given weight"""
+        with self.driver.session() as session:
+            version = session.read_transaction(graphVersion.get_version, graph)
+        return self.projection_name(graph, weight, version)
+
+    def acquire(self, graph, weight, create):
+        """returns the name of the projection of the current version of the graph with the given weight,
+           creating it when it does not exist. create(tx, name) is the transaction function that
+           creates the projection with the given name. Each acquire must be followed by a release."""
+        with self.driver.session() as session:
+            if not self._constraint:
+                session.run("""CREATE CONSTRAINT projection_lease IF NOT EXISTS
+                               FOR (l:ProjectionLease) REQUIRE l.name IS UNIQUE""").consume()
+                self._constraint = True
+            name = session.write_transaction(self._lease, graph, weight)
+            #the projection is created after the lease is committed, so a projection always has a lease
+            #that lets the eviction drop it, even when its creation fails or is rolled back
+            try:
+                session.write_transaction(self._create, name, create)
+            except Exception:
+                session.write_transaction(self._release, name)
+                raise
+        self.evict()
+        return name
+
+    def _lease(self, tx, graph, weight):
+        name = self.projection_name(graph, weight, graphVersion.get_version(tx, graph))
+        tx.run("""
+                MERGE (l:ProjectionLease {name: $name})
+                ON CREATE SET l.refs = 0, l.graph = $graph
+                SET l.refs = l.refs + 1, l.last_used = timestamp()
+                """, name=name, graph=graph).consume()
+        return name
+
+    @staticmethod
+    def _create(tx, name, create):
+        #the lease node is locked until the end of the transaction,
+        #so concurrent users of the same projection wait for its creation
+        tx.run("""
+                MATCH (l:ProjectionLease {name: $name})
+                SET l.last_used = timestamp()
+                """, name=name).consume()
+        exists = tx.run("CALL gds.graph.exists($name) YIELD exists RETURN exists", name=name).single()[0]
+        if not exists:
+            create(tx, name)
+
+    def release(self, name):
+        """releases the lease on the projection, that can be evicted when it has no more users"""
+        with self.driver.session() as session:
+            session.write_transaction(self._release, name)
+        self.evict()
+
+    @staticmethod
+    def _release(tx, name):
+        tx.run("""
+                MATCH (l:ProjectionLease {name: $name})
+                SET l.refs = CASE WHEN l.refs > 0 THEN l.refs - 1 ELSE 0 END, l.last_used = timestamp()
+                """, name=name).consume()
+
+    def renew(self, names):
+        """heartbeat of the users that hold their leases for a long time (for example the routing service):
+           the leases not used for lease_timeout seconds are considered abandoned and can be evicted.
+           Returns the names of the leases that no longer exist."""
+        with self.driver.session() as session:
+            return session.write_transaction(self._renew, list(names))
+
+    @staticmethod
+    def _renew(tx, names):
+        result = tx.run("""
+                UNWIND $names AS name
+                OPTIONAL MATCH (l:ProjectionLease {name: name})
+                SET l.last_used = timestamp()
+                WITH name, l
+                WHERE l IS NULL
+                RETURN collect(name)
+                """, names=names)
+        return result.single()[0]
+
+    @contextmanager
+    def projection(self, graph, weight, create):
+        """context manager that acquires the projection and releases it at the end of the block"""
+        name = self.acquire(graph, weight, create)
+        try:
+            yield name
+        finally:
+            self.release(name)
+
+    def evict(self):
+        """drops the projections without users that expired or exceed the maximum number of projections.
+           Returns the names of the dropped projections."""
+        with self.driver.session() as session:
+            return session.write_transaction(self._evict, self.max_projections, self.ttl, self.lease_timeout)
+
+    @staticmethod
+    def _evict(tx, max_projections, ttl, lease_timeout):
+        result = tx.run("""
+                MATCH (l:ProjectionLease)
+                WHERE l.last_used < timestamp() - $lease_timeout * 1000
+                SET l.refs = 0
+                WITH count(*) AS abandoned
+                MATCH (l:ProjectionLease)
+                WITH l ORDER BY l.refs DESC, l.last_used DESC
+                WITH collect(l) AS leases
+                UNWIND range(0, size(leases) - 1) AS position
+                WITH leases[position] AS l, position
+                WHERE l.refs = 0 AND (position >= $max_projections OR l.last_used < timestamp() - $ttl * 1000)
+                WITH l, l.name AS name
+                DETACH DELETE l
+                WITH name
+                CALL gds.graph.drop(name, false) YIELD graphName
+                RETURN collect(graphName) AS dropped
+                """, max_projections=max_projections, ttl=ttl, lease_timeout=lease_timeout)
+        return result.single()[0]
+
+    def drop_all(self):
+        """drops all the projections without users, for example after changing the graph"""
+        with self.driver.session() as session:
+            return session.write_transaction(self._evict, -1, 0, self.lease_timeout)
@@ -0,0 +1,97 @@
+from collections import OrderedDict
+import threading
+import sqlite3
+import json
+
+#returned by get when the route is not in the cache (None is a valid result: no path exists)
+MISSING = object()
+
+
+class RouteCache:
+    """Cache of the routing results keyed by (source, target, mode, graph version).
+       The results are kept in an in-process LRU of capacity entries and, when a path is given,
+       in a SQLite file shared by the scripts and the runs. The version of the graph is part of
+       the key, so closing or opening a street (changeStreetStatus.py) or importing the traffic
+       (traffic.py) makes the previous results unreachable; the entries of the older versions
+       are deleted the first time a newer version of the same graph is seen."""
+
+    def __init__(self, capacity=1024, path=None):
+        self.capacity = capacity
+        self.path = path
+        self.entries = OrderedDict()
+        #latest version seen for each graph
+        self.versions = {}
+        self.hits = 0
+        self.misses = 0
+        #the service reads the cache from the event loop and the batch from the main thread only,
+        #the lock protects the LRU and the connection when it is shared with other threads
+        self.lock = threading.Lock()
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("""CREATE TABLE IF NOT EXISTS routes (
+                                   graph TEXT, version INTEGER, source INTEGER, target INTEGER, mode TEXT,
+                                   route TEXT, PRIMARY KEY (graph, version, source, target, mode))""")
+            self.db.commit()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    @staticmethod
+    def key(graph, version, source, target, mode):
+        return graph, int(version), int(source), int(target), str(mode).lower()[:1]
+
+    def get(self, graph, version, source, target, mode):
+        """returns the cached route, MISSING if the route has not been evaluated on this version of the graph"""
+        key = self.key(graph, version, source, target, mode)
+        with self.lock:
+            self._check_version(graph, key[1])
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            if self.db is not None:
+                row = self.db.execute("""SELECT route FROM routes
+                                         WHERE graph = ? AND version = ? AND source = ? AND target = ? AND mode = ?""",
+                                      key).fetchone()
+                if row is not None:
+                    self.hits += 1
+                    route = json.loads(row[0])
+                    self._store(key, route)
+                    return route
+            self.misses += 1
+            return MISSING
+
+    def put(self, graph, version, source, target, mode, route):
+        """stores the route (a json serializable value, None when no path exists)"""
+        key = self.key(graph, version, source, target, mode)
+        with self.lock:
+            self._check_version(graph, key[1])
+            if key[1] < self.versions[graph]:
+                #evaluated on a version replaced in the meantime
+                return
+            self._store(key, route)
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO routes VALUES (?, ?, ?, ?, ?, ?)", key + (json.dumps(route),))
+                self.db.commit()
+
+    def _store(self, key, route):
+        self.entries[key] = route
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def _check_version(self, graph, version):
+        if version <= self.versions.get(graph, -1):
+            return
+        self.versions[graph] = version
+        for key in [key for key in self.entries if key[0] == graph and key[1] < version]:
+            del self.entries[key]
+        if self.db is not None:
+            self.db.execute("DELETE FROM routes WHERE graph = ? AND version < ?", (graph, version))
+            self.db.commit()
@@ -1,8 +1,15 @@
 from neo4j import GraphDatabase
+from multiprocessing import Pool
+from collections import Counter
 import folium as fo
 import argparse
+import itertools
+import json
+import csv
 import pandas as pd
-
+import routingEngine
+import graphVersion
+import routeCache
 
 class App:
     def __init__(self, uri, user, password):
@@ -11,134 +18,39 @@ class App:
     def close(self):
         self.driver.close()
 
-    def create_projected_graph(self):
-        """This method creates a new graph as a projection of the existing nodes and relations. 
-           The mode parameter is set to 'r' for dual graph and 'j' for primal graph."""
-        with self.driver.session() as session:
-            path = session.read_transaction(self._projected_graph)
-
-    @staticmethod
-    def _projected_graph(tx):
-        result = tx.run("""
-                CALL gds.graph.create.cypher(
-                    "graph",
-                    "MATCH (n:RoadJunction) RETURN id(n) AS id, n.lat AS lat, n.lon AS lon",
-                    "MATCH (:RoadJunction)-[r:ROUTE]->(:RoadJunction) with min(r.AADT) as min_AADT,max(r.AADT) as max_AADT,
-                    max(r.distance) as max_dist,min(r.distance) as min_dist
-                    MATCH (n:RoadJunction)-[r:ROUTE]->(m:RoadJunction) WHERE r.status = 'active' 
-                    RETURN id(n) AS source, id(m) AS target, 
-                    0.5 * toFloat((r.AADT-min_AADT)/(max_AADT-min_AADT)) + 0.5 * toFloat((r.distance-min_dist)/(max_dist-min_dist)) as traffic, 
-                    r.AADT as AADT, r.distance as distance, type(r) as type"
-                )""")
-        return result
-
-    def delete_projected_graph(self):
-        """This method deletes an existing graph projection. 
-           The mode parameter is set to 'r' for dual graph and 'j' for primal graph."""
+    def read_graph_version(self):
+        """returns the current version of the primal graph, part of the key of the cached routes"""
         with self.driver.session() as session:
-            path = session.read_transaction(self._drop_projected_graph)
+            return session.read_transaction(graphVersion.get_version, graphVersion.PRIMAL)
 
-    @staticmethod
-    def _drop_projected_graph(tx):
-        result = tx.run("""
-                CALL gds.graph.drop('graph')
-                        """)
-        return result
-    
-    def generate_possible_combinations(self, source, target):
-        """generate_possible_combinations of road junctions from POI"""
+    def read_poi_junctions(self, pois):
+        """returns the road junctions near to each point of interest with their distance"""
         with self.driver.session() as session:
-            result = session.write_transaction(self._generate_possible_combinations, source, target)
+            result = session.read_transaction(self._read_poi_junctions, pois)
             return result
-    
-    @staticmethod
-    def _generate_possible_combinations(tx, source, target):
-        result = tx.run("""
-                    MATCH (p:PointOfInterest{osm_id: $source})-[:MEMBER]->(:OSMWayNode)-[r:NEAR]->(wns:RoadJunction)-[:ROUTE{status: 'active'}]->(:RoadJunction)
-                        match (p1:PointOfInterest{osm_id: $target})-[:MEMBER]->(:OSMWayNode)<-[rt:NEAR]-(wnt:RoadJunction)<-[:ROUTE{status: 'active'}]-(:RoadJunction)
-                    return distinct p.osm_id as POI_source,
-                                    p1.osm_id as POI_target,
-                                    r.distance as distance_source, 
-                                    wns.id as junction_source,
-                                    rt.distance as distance_target,
-                                    wnt.id as junction_target
-                    order by distance_source,distance_target
-                    """, source=source, target=target)
-        return result.values()
-
-    def read_distance_path(self, source, target):
-        """Finds the shortest path based on distance between the soruce and the target.(A*)"""
-        with self.driver.session() as session:
-            path = session.read_transaction(self._search_path_a_star, source, target)
-            return path
 
     @staticmethod
-    def _search_path_a_star(tx, source, target):
+    def _read_poi_junctions(tx, pois):
         result = tx.run("""
-        match (sWn:RoadJunction {id: $source})
-        match(tWn:RoadJunction {id: $target})
-                    CALL gds.shortestPath.dijkstra.stream('graph', {
-                        relationshipTypes: ['ROUTE'],
-                        sourceNode: id(sWn),
-                        targetNode: id(tWn),
-                        relationshipWeightProperty: 'distance'
-                    })
-                    YIELD sourceNode, targetNode, totalCost, costs, nodeIds
-                    return sourceNode as source, targetNode as target, totalCost as total_cost, 
-                            [nodeId IN nodeIds | [gds.util.asNode(nodeId).lat,gds.util.asNode(nodeId).lon]] AS cords
-                    """, source=source, target=target)
-        return result.values()
-
-    def read_shortest_path(self, source, target):
-        """Finds the shortest path based on hops between the soruce and the target."""
-        with self.driver.session() as session:
-            path = session.read_transaction(self._search_path_shortest_path, source, target)
-            return path
-
-    @staticmethod
-    def _search_path_shortest_path(tx, source, target):
-        result = tx.run("""
-                    MATCH (wns:RoadJunction {id: $source})
-                        match (wnt:RoadJunction {id: $target})
-                    WITH wns as sWn, wnt as tWn
-                    MATCH path = shortestPath((sWn)-[:ROUTE*]->(tWn)) 
-                    return sWn.id,tWn.id, length(path) as totalCost, [n in nodes(path)| [n.lat,n.lon]] AS cords""", source=source, target=target)
-        return result.values()
-
-    def read_traffic_path(self, source, target):
-        """Finds the shortest path based on traffic between the soruce and the target.(A*)"""
-        with self.driver.session() as session:
-            path = session.read_transaction(self._search_path_astar_traffic, source, target)
-            return path
-
-    @staticmethod
-    def _search_path_astar_traffic(tx, source, target):
-        result = tx.run("""
-        match (sWn:RoadJunction {id: $source})
-        match(tWn:RoadJunction {id: $target})
-                    CALL gds.shortestPath.astar.stream('graph', {
-                        relationshipTypes: ['ROUTE'],
-                        sourceNode: id(sWn),
-                        targetNode: id(tWn),
-                        longitudeProperty: 'lon',
-                        latitudeProperty:'lat',
-                        relationshipWeightProperty: 'traffic'
-                    })
-                    YIELD sourceNode, targetNode, totalCost, costs, nodeIds
-                    return sourceNode as source, targetNode as target, totalCost as total_cost,
-                            [nodeId IN nodeIds | [gds.util.asNode(nodeId).lat,gds.util.asNode(nodeId).lon]] AS cords
-                    """, source=source, target=target)
-        return result.values()
+                    UNWIND $pois AS poi
+                    MATCH (p:PointOfInterest {osm_id: poi})-[:MEMBER]->(:OSMWayNode)-[r:NEAR]->(j:RoadJunction)
+                    RETURN p.osm_id AS poi, j.id AS junction, min(r.distance) AS distance
+                    """, pois=pois)
+        return pd.DataFrame(result.values(), columns=['poi', 'junction', 'distance'])
 
 
 def addOptions():
     parser = argparse.ArgumentParser(description='Routing between two point of interest nodes in OSM.')
     parser.add_argument('--source', '-s', dest='source', type=str,
                         help="""Insert the name of the point of interest in OSM where the route starts.""",
-                        required=True)
+                        required=False)
     parser.add_argument('--destination', '-d', dest='destination', type=str,
                         help="""Insert the name of the point of interest point in OSM where the route ends.""",
-                        required=True)
+                        required=False)
+    parser.add_argument('--mode', '-m', dest='mode', type=str,
+                        help="""Insert the routing mode: distance[d], hops[h] or traffic volume[t].
+                              If it is not provided it is asked to the user.""",
+                        required=False)
     parser.add_argument('--neo4jURL', '-n', dest='neo4jURL', type=str,
                         help="""Insert the address of the local neo4j instance. For example: neo4j://localhost:7687""",
                         required=True)
@@ -152,75 +64,217 @@ def addOptions():
                         help="""Insert the path of the file of the resulting map.""",
                         required=False,
                         default='map.html')
+    parser.add_argument('--batch', '-b', dest='batch', type=str,
+                        help="""Insert the path of a .csv or .jsonl file with the columns source, target and (optionally) mode.
+                              All the routes are evaluated on the same in-memory graph.""",
+                        required=False)
+    parser.add_argument('--batchOutput', '-o', dest='batch_output', type=str,
+                        help="""Insert the path of the .csv or .jsonl file where the results of the batch are written.""",
+                        required=False, default='routes.csv')
+    parser.add_argument('--workers', '-w', dest='workers', type=int,
+                        help="""Insert the number of processes used to evaluate the batch.""",
+                        required=False, default=1)
+    parser.add_argument('--graphFile', '-g', dest='graph_file', type=str,
+                        help="""Insert the path of the .npz file where the in-memory graph is cached.""",
+                        required=False, default=None)
+    parser.add_argument('--landmarkFile', '-l', dest='landmark_files', type=str, action='append',
+                        help="""Insert the path of a .npz file of landmarks generated by landmarks.py,
+                              used by the A* searches. It can be repeated for both the weights.""",
+                        required=False, default=[])
+    parser.add_argument('--cacheFile', '-k', dest='cache_file', type=str,
+                        help="""Insert the path of the SQLite file where the routes are cached.
+                              The cached routes are used until the primal graph changes.""",
+                        required=False, default=None)
+    parser.add_argument('--cacheSize', dest='cache_size', type=int,
+                        help="""Insert the number of routes kept in memory during the batch.""",
+                        required=False, default=10000)
+    parser.add_argument('--close', dest='close_streets', type=str, action='append',
+                        help="""Insert the name of a street closed only for the routes of this execution (what-if),
+                              without changing the database. It can be repeated.""",
+                        required=False, default=[])
+    parser.add_argument('--closeOsmid', dest='close_osmids', type=str, action='append',
+                        help="""Insert the OSM id of a street closed only for the routes of this execution (what-if).
+                              It can be repeated.""",
+                        required=False, default=[])
     return parser
 
 
+def read_batch_file(path, mode):
+    """reads the origin-destination pairs of a batch from a .csv or .jsonl file"""
+    if path.endswith('.jsonl'):
+        df = pd.read_json(path, lines=True, dtype=False)
+    else:
+        df = pd.read_csv(path, dtype=str)
+    if 'mode' not in df.columns:
+        df['mode'] = mode
+    df['mode'] = df['mode'].fillna(mode).str.lower()
+    df['source'] = df['source'].astype('int64')
+    df['target'] = df['target'].astype('int64')
+    return df[['source', 'target', 'mode']]
+
+
+def route_record(source, target, mode, route):
+    """the row of the batch output of the route [junction_source, junction_target, cost, path]"""
+    dic = {'source': source, 'target': target, 'mode': mode, 'cost': None, 'hops': None,
+           'junction_source': None, 'junction_target': None, 'path': []}
+    if route is not None:
+        dic['junction_source'], dic['junction_target'], dic['cost'], dic['path'] = route
+        dic['hops'] = len(dic['path']) - 1
+    return dic
+
+
+def route_pair(graph, candidates, source, target, mode):
+    """evaluates the route between two POI on the in-memory graph with a single search
+       from all the road junctions near to the source to all the ones near to the target"""
+    df_source = candidates[candidates.poi == source]
+    df_target = candidates[candidates.poi == target]
+    result = graph.route_between(dict(zip(df_source.junction, df_source.distance)),
+                                 dict(zip(df_target.junction, df_target.distance)), mode)
+    return route_record(source, target, mode, result[0] if len(result) > 0 else None)
+
+
+#graph and candidate junctions shared by the processes of the pool
+_batch_graph = None
+_batch_candidates = None
+
+
+def _init_batch_worker(graph, candidates):
+    global _batch_graph, _batch_candidates
+    _batch_graph = graph
+    _batch_candidates = candidates
+
+
+def _route_batch_row(row):
+    return route_pair(_batch_graph, _batch_candidates, *row)
+
+
+def load_routing_graph(options):
+    """the in-memory graph with the landmarks and the what-if closures of the options"""
+    engine = routingEngine.App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
+    graph = routingEngine.load_graph(engine, options.graph_file)
+    engine.close()
+    routingEngine.load_landmarks(graph, options.landmark_files)
+    if options.close_streets or options.close_osmids:
+        graph = graph.with_closures(options.close_streets, options.close_osmids)
+        print('{} routes closed'.format(int(graph.closed.sum())))
+    return graph
+
+
+def read_candidates(greeter, pois):
+    """the road junctions near to the points of interest, with the distance of the NEAR relationships"""
+    candidates = greeter.read_poi_junctions(pois)
+    candidates['junction'] = candidates['junction'].astype('int64')
+    return candidates
+
+
+def run_batch(greeter, options):
+    """evaluates all the routes of the batch file reusing the same in-memory graph
+       and streams the results in the output file. The routes already in the cache
+       and the repeated pairs are not evaluated again."""
+    rows = read_batch_file(options.batch, (options.mode or 'd').lower())
+    closures = options.close_streets or options.close_osmids
+    #the routes of a what-if scenario are not stored in the shared cache file
+    cache = routeCache.RouteCache(options.cache_size, None if closures else options.cache_file)
+    #loading the graph and the junctions near to the POI only once
+    graph = load_routing_graph(options)
+    #the routes are cached under the version the graph has been read from
+    version = graph.version
+    pois = pd.unique(pd.concat([rows.source, rows.target])).tolist()
+    candidates = read_candidates(greeter, pois)
+    fields = ['source', 'target', 'mode', 'cost', 'hops', 'junction_source', 'junction_target', 'path']
+    jsonl = options.batch_output.endswith('.jsonl')
+    #each distinct pair is evaluated once and written as many times as it appears in the batch
+    repeats = Counter((int(s), int(t), m) for s, t, m in rows.itertuples(index=False, name=None))
+    tasks = []
+    cached = []
+    for s, t, m in repeats:
+        route = cache.get(graphVersion.PRIMAL, version, s, t, m)
+        if route is routeCache.MISSING:
+            tasks.append((s, t, m))
+        else:
+            cached.append(route_record(s, t, m, route))
+    print('{} routes to evaluate, {} found in the cache'.format(len(tasks), len(cached)))
+    with open(options.batch_output, 'w', newline='') as f:
+        writer = None if jsonl else csv.DictWriter(f, fieldnames=fields)
+        if writer:
+            writer.writeheader()
+        with Pool(processes=max(options.workers, 1), initializer=_init_batch_worker,
+                  initargs=(graph, candidates)) as pool:
+            results = itertools.chain(cached, pool.imap_unordered(_route_batch_row, tasks, chunksize=16))
+            for count, dic in enumerate(results, 1):
+                if count > len(cached):
+                    route = None if dic['cost'] is None else [dic['junction_source'], dic['junction_target'],
+                                                              dic['cost'], dic['path']]
+                    cache.put(graphVersion.PRIMAL, version, dic['source'], dic['target'], dic['mode'], route)
+                for _ in range(repeats[(dic['source'], dic['target'], dic['mode'])]):
+                    if jsonl:
+                        f.write(json.dumps(dic) + '\n')
+                    else:
+                        writer.writerow({**dic, 'path': json.dumps(dic['path'])})
+                if count % 1000 == 0:
+                    f.flush()
+                    print('{} of {} routes evaluated'.format(count, len(tasks) + len(cached)))
+    cache.close()
+    print('results saved in ' + options.batch_output)
+
+
 def main(args=None):
     argParser = addOptions()
     #retrieving arguments
     options = argParser.parse_args(args=args)
     sourceNode = options.source
     targetNode = options.destination
+    if options.batch is None and (sourceNode is None or targetNode is None):
+        argParser.error('the source and the destination are required when no batch file is provided')
     #connecting to the neo4j instance
     greeter = App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
+    if options.batch:
+        #non interactive evaluation of many routes on the same in-memory graph
+        run_batch(greeter, options)
+        greeter.close()
+        return 0
  
     #asking the user what type of shortest path he needs
-    mode = input('Select shortest path for distance[d], hops[h] or traffic volume[t] ')
+    mode = options.mode
+    if mode is None:
+        mode = input('Select shortest path for distance[d], hops[h] or traffic volume[t] ')
     mode = mode.lower()
-    #creating the projected graph
-    greeter.create_projected_graph()
-    ris = []
-    result = greeter.generate_possible_combinations(int(sourceNode),int(targetNode))
-    df = pd.DataFrame(result, columns=['POI_source','POI_target','distance_source','junction_source','distance_target','junction_target'])
-    df['distance_target_normalized']=(df['distance_target'] - df['distance_target'].min())/(df['distance_target'].max() - df['distance_target'].min())
-    df['distance_source_normalized']=(df['distance_source'] - df['distance_source'].min())/(df['distance_source'].max() - df['distance_source'].min())
-    df['sum_distance']=df['distance_target_normalized'] + df['distance_source_normalized']
-    min_dist = df.groupby(['junction_source','junction_target']).min()['sum_distance'].reset_index(level=0).reset_index(level=0)
-    df = df.reset_index(level=0).reset_index(level=0).set_index(['junction_source','junction_target','sum_distance']).join(min_dist.set_index(['junction_source','junction_target','sum_distance']),how = 'inner')
-    df = df.reset_index(level=0).reset_index(level=0).reset_index(level=0)[['junction_source','junction_target','distance_target_normalized','distance_source_normalized','sum_distance']]
-    #evaluate the paths of the combination pair in the 10% nearest points to the POI
-    r2 = list()
-    for i,row in df[df.sum_distance < 0.1].sort_values(by=['sum_distance']).iterrows():
-            dic = {}
-            if mode.startswith('d'):
-                result = greeter.read_distance_path(str(row.junction_source),str(row.junction_target))
-            elif mode.startswith('h'):
-                result = greeter.read_shortest_path(str(row.junction_source),str(row.junction_target))
-            elif mode.startswith('t'):
-                result = greeter.read_traffic_path(str(row.junction_source), str(row.junction_target))
-            if len(result)>0:
-                cost = result[0][2]
-                total_cost = row['distance_source_normalized'] + cost + row['distance_target_normalized']
-                dic['cost'] = cost
-                dic['length'] = len(result[0][3])
-                dic['path'] = result[0][3]
-                dic['junction_source'] = row.junction_source
-                dic['junction_target'] = row.junction_target
-                r2.append(dic)
-    print(r2)
+    #the route is read from the cache if it has already been evaluated on the current version of the graph,
+    #the routes of a what-if scenario are not cached
+    closures = options.close_streets or options.close_osmids
+    cache = routeCache.RouteCache(path=options.cache_file) if options.cache_file and not closures else None
+    version = greeter.read_graph_version() if cache else None
+    route = cache.get(graphVersion.PRIMAL, version, sourceNode, targetNode, mode) if cache else routeCache.MISSING
+    if route is routeCache.MISSING:
+        graph = load_routing_graph(options)
+        #a single search from all the road junctions near to the source POI to all the ones near to the target
+        source, target = int(sourceNode), int(targetNode)
+        dic = route_pair(graph, read_candidates(greeter, [source, target]), source, target, mode)
+        route = None if dic['cost'] is None else [dic['junction_source'], dic['junction_target'], dic['cost'], dic['path']]
+        if cache:
+            #cached under the version the graph has been read from
+            cache.put(graphVersion.PRIMAL, graph.version, sourceNode, targetNode, mode, route)
+    if cache:
+        cache.close()
+    print(route)
     #add the path to the map
-    if len(r2) == 0:
+    if route is None:
         print('\nNo path exists')
-        greeter.delete_projected_graph()
-        exit(0)
-    min_cost = r2[0]['cost']
-    for x in r2:
-        if (x['cost'] < min_cost):
-            min_cost = x['cost']
-    for x in r2:
-        if (x['cost']==min_cost):
-            print(x['junction_source'])
-            print(x['junction_target'])
-            print(x['length'])
-            m = fo.Map(location=[x['path'][0][0], x['path'][0][1]], zoom_start=13)
-            if len(x['path']) == 0:
-                print('\nNo result for query')
-            else:
-                fo.PolyLine(x['path'], color="green", weight=5).add_to(m)
-                m.save(options.mapName)
-    greeter.delete_projected_graph()
+        greeter.close()
+        return 0
+    junction_source, junction_target, cost, path = route
+    print(junction_source)
+    print(junction_target)
+    print(len(path))
+    m = fo.Map(location=[path[0][0], path[0][1]], zoom_start=13)
+    if len(path) == 0:
+        print('\nNo result for query')
+    else:
+        fo.PolyLine(path, color="green", weight=5).add_to(m)
+        m.save(options.mapName)
     greeter.close()
     return 0
 
 
-main()
+if __name__ == "__main__":
+    main()
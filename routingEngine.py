@@ -0,0 +1,764 @@
+from neo4j import GraphDatabase
+from collections import deque
+from scipy.spatial import cKDTree
+import folium as fo
+import argparse
+import heapq
+import copy
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+import edgeWeights
+import graphVersion
+import snapIndex
+
+#earth radius used by osmnx to evaluate the length of the edges, the same of the snapping index
+EARTH_RADIUS = snapIndex.EARTH_RADIUS
+
+
+class App:
+    def __init__(self, uri, user, password):
+        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+
+    def close(self):
+        self.driver.close()
+
+    def read_junctions(self):
+        """returns the internal id, the osm id and the coordinates of every road junction"""
+        with self.driver.session() as session:
+            result = session.read_transaction(self._read_junctions)
+            return result
+
+    @staticmethod
+    def _read_junctions(tx):
+        result = tx.run("""
+                    MATCH (n:RoadJunction)
+                    RETURN id(n) AS node_id, n.id AS junction_id, n.lat AS lat, n.lon AS lon
+                    """)
+        return pd.DataFrame(result.values(), columns=result.keys())
+
+    def read_routes(self):
+        """returns every ROUTE relationship between road junctions with its weights and status"""
+        with self.driver.session() as session:
+            result = session.read_transaction(self._read_routes)
+            return result
+
+    @staticmethod
+    def _read_routes(tx):
+        result = tx.run("""
+                    MATCH (n:RoadJunction)-[r:ROUTE]->(m:RoadJunction)
+                    RETURN id(n) AS source, id(m) AS target, r.distance AS distance,
+                           r.AADT AS AADT, r.traffic AS traffic, r.status AS status, r.name AS name, r.osmid AS osmid
+                    """)
+        return pd.DataFrame(result.values(), columns=result.keys())
+
+    def read_weights(self):
+        """returns the ranges and the coefficients of the traffic weight materialized by edgeWeights.py"""
+        with self.driver.session() as session:
+            return session.read_transaction(edgeWeights.read_weights)
+
+    def read_graph_version(self):
+        """returns the current version of the primal graph, stored with the cached graph"""
+        with self.driver.session() as session:
+            return session.read_transaction(graphVersion.get_version, graphVersion.PRIMAL)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """great circle distance in meters, works both on scalars and numpy arrays"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def traffic_weight(AADT, distance, aadt_coefficient=0.5, distance_coefficient=0.5):
+    """normalized traffic weight, the same materialized by edgeWeights.py:
+       aadt_coefficient * normalized AADT + distance_coefficient * normalized distance"""
+    AADT = np.asarray(AADT, dtype=np.float64)
+    distance = np.asarray(distance, dtype=np.float64)
+    if not np.isfinite(AADT).any():
+        #no traffic information imported yet
+        return np.full(len(AADT), np.nan)
+    min_AADT, max_AADT = np.nanmin(AADT), np.nanmax(AADT)
+    min_dist, max_dist = np.nanmin(distance), np.nanmax(distance)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (aadt_coefficient * (AADT - min_AADT) / (max_AADT - min_AADT)
+                + distance_coefficient * (distance - min_dist) / (max_dist - min_dist))
+
+
+class RoadGraph:
+    """In-memory representation of the primal graph (RoadJunction nodes and active ROUTE relationships)
+       stored as compressed sparse row arrays. The graph is loaded once and answers routing queries
+       based on distance, hops and traffic without any projection on the database.
+       The name and the osmid of each relationship are kept to close streets in memory (with_closures)."""
+
+    WEIGHTS = ('distance', 'AADT', 'traffic')
+
+    def __init__(self, node_ids, junction_ids, lat, lon, offsets, targets, weights, distance_range=np.nan,
+                 names=None, osmids=None, distance_coefficient=0.5, version=None):
+        self.node_ids = np.asarray(node_ids, dtype=np.int64)
+        self.junction_ids = np.asarray(junction_ids, dtype=np.int64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.targets = np.asarray(targets, dtype=np.int32)
+        self.weights = {name: np.asarray(values, dtype=np.float64) for name, values in weights.items()}
+        #max(r.distance) - min(r.distance) used to normalize the distance in the traffic weight
+        self.distance_range = float(distance_range)
+        #coefficient of the normalized distance in the traffic weight
+        self.distance_coefficient = float(distance_coefficient)
+        #street name and osmid of each relationship, as the properties used by changeStreetStatus.py
+        self.names = None if names is None else np.asarray(names, dtype=str)
+        self.osmids = None if osmids is None else np.asarray(osmids, dtype=str)
+        #version of the primal graph the arrays were read from, None when it is not known
+        self.version = None if version is None else int(version)
+        #relationships closed by the what-if overlay, None when all the loaded relationships are open
+        self.closed = None
+        self._index = {junction: i for i, junction in enumerate(self.junction_ids.tolist())}
+        self._lists = {}
+        #landmark distance tables (landmarks.Landmarks) used by A*, by weight
+        self.landmarks = {}
+        #spatial index of the relationships used to snap points to the roads, built on the first use
+        self._segments = None
+
+    @property
+    def node_count(self):
+        return len(self.node_ids)
+
+    @property
+    def edge_count(self):
+        return len(self.targets)
+
+    @classmethod
+    def from_frames(cls, nodes, edges, coefficients=None):
+        """build the graph from the dataframes returned by App.read_junctions and App.read_routes.
+           coefficients are the ones of the traffic weight returned by App.read_weights:
+           the traffic weight materialized in the database is used when it exists."""
+        nodes = nodes.sort_values('node_id').reset_index(drop=True)
+        edges = edges.copy()
+        for column in ('distance', 'AADT', 'traffic'):
+            if column in edges.columns:
+                edges[column] = pd.to_numeric(edges[column], errors='coerce')
+        aadt_coefficient = coefficients['aadt_coefficient'] if coefficients else 0.5
+        distance_coefficient = coefficients['distance_coefficient'] if coefficients else 0.5
+        if 'traffic' not in edges.columns or edges['traffic'].isna().all():
+            #the normalization considers every ROUTE, as in edgeWeights.py
+            edges['traffic'] = traffic_weight(edges['AADT'], edges['distance'], aadt_coefficient, distance_coefficient)
+        distance_range = edges['distance'].max() - edges['distance'].min()
+        edges = edges[edges.status == 'active']
+        source = np.searchsorted(nodes.node_id.values, edges.source.values)
+        target = np.searchsorted(nodes.node_id.values, edges.target.values)
+        order = np.argsort(source, kind='stable')
+        offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(source, minlength=len(nodes)), out=offsets[1:])
+        weights = {name: edges[name].values[order] for name in cls.WEIGHTS}
+        names = osmids = None
+        if 'name' in edges.columns and 'osmid' in edges.columns:
+            names = edges['name'].fillna('').astype(str).values[order]
+            osmids = edges['osmid'].fillna('').astype(str).values[order]
+        return cls(nodes.node_id.values, nodes.junction_id.astype('int64').values,
+                   nodes.lat.values, nodes.lon.values, offsets, target[order], weights, distance_range,
+                   names, osmids, distance_coefficient)
+
+    @classmethod
+    def from_neo4j(cls, app):
+        """load the graph from the neo4j instance through an App object. The version is read first:
+           a change during the load makes the graph look older than it is, never more recent."""
+        version = app.read_graph_version()
+        graph = cls.from_frames(app.read_junctions(), app.read_routes(), app.read_weights())
+        graph.version = version
+        return graph
+
+    def _arrays(self):
+        return dict(node_ids=self.node_ids, junction_ids=self.junction_ids,
+                    lat=self.lat, lon=self.lon, offsets=self.offsets, targets=self.targets,
+                    distance_range=self.distance_range, distance_coefficient=self.distance_coefficient,
+                    **({} if self.names is None else {'names': self.names, 'osmids': self.osmids}),
+                    **({} if self.version is None else {'version': self.version}),
+                    **{'weight_' + name: values for name, values in self.weights.items()})
+
+    @classmethod
+    def _from_arrays(cls, data, files):
+        weights = {name[len('weight_'):]: data[name] for name in files if name.startswith('weight_')}
+        return cls(data['node_ids'], data['junction_ids'], data['lat'], data['lon'],
+                   data['offsets'], data['targets'], weights, data['distance_range'],
+                   data['names'] if 'names' in files else None,
+                   data['osmids'] if 'osmids' in files else None,
+                   data['distance_coefficient'] if 'distance_coefficient' in files else 0.5,
+                   data['version'] if 'version' in files else None)
+
+    def save(self, path):
+        """store the arrays of the graph in a compressed .npz file"""
+        np.savez_compressed(path, **self._arrays())
+
+    @classmethod
+    def load(cls, path):
+        """load a graph previously stored with save"""
+        data = np.load(path)
+        return cls._from_arrays(data, data.files)
+
+    def save_arrays(self, directory):
+        """store the arrays of the graph as uncompressed .npy files in directory, which load_arrays maps
+           in memory: the processes that map the same files share their pages instead of a copy each"""
+        os.makedirs(directory, exist_ok=True)
+        for name, values in self._arrays().items():
+            np.save(os.path.join(directory, name + '.npy'), values)
+
+    @classmethod
+    def load_arrays(cls, directory):
+        """load a graph stored with save_arrays, with the arrays mapped read-only in memory"""
+        files = [name[:-len('.npy')] for name in os.listdir(directory) if name.endswith('.npy')]
+        data = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r') for name in files}
+        return cls._from_arrays(data, files)
+
+    def fingerprint(self, weight):
+        """hash of the junctions, of the relationships and of the values of the weight, used to recognise the
+           tables precomputed on another version of the graph. It is meant for the graph loaded from the
+           database, not for the views with closures."""
+        digest = hashlib.sha256()
+        for values in (self.junction_ids, self.offsets, self.targets, self.weights[weight]):
+            digest.update(np.ascontiguousarray(values).tobytes())
+        return digest.hexdigest()
+
+    def index_of(self, junction_id):
+        """returns the position in the arrays of the junction with the given osm id"""
+        return self._index[int(junction_id)]
+
+    def closure_mask(self, streets=(), osmids=()):
+        """boolean array of the relationships with one of the given street names or osmids"""
+        if self.names is None:
+            raise ValueError('The graph has been stored without street names and osmids: load it again from neo4j')
+        mask = np.zeros(self.edge_count, dtype=bool)
+        if len(streets) > 0:
+            mask |= np.isin(self.names, [str(street) for street in streets])
+        if len(osmids) > 0:
+            mask |= np.isin(self.osmids, [str(osmid) for osmid in osmids])
+        return mask
+
+    def with_closures(self, streets=(), osmids=(), mask=None):
+        """what-if view of the graph where the given streets (names or osmids) are closed, without
+           changing the database. The view shares the arrays, the index and the landmarks of the graph
+           (the landmark lower bounds are still admissible when relationships are removed): only the
+           costs of the closed relationships are replaced by NaN, that the searches ignore."""
+        if mask is None:
+            mask = self.closure_mask(streets, osmids)
+        if self.closed is not None:
+            mask = mask | self.closed
+        view = copy.copy(self)
+        view.closed = mask
+        #the closed relationships cannot be snapped to
+        view._segments = None
+        view.weights = {name: np.where(mask, np.nan, values) for name, values in self.weights.items()}
+        #the structure of the graph does not change
+        self._adjacency('hops')
+        view._lists = {'offsets': self._lists['offsets'], 'targets': self._lists['targets']}
+        return view
+
+    def _costs(self, weight):
+        if weight != 'hops':
+            return self.weights[weight]
+        if self.closed is None:
+            return np.ones(self.edge_count)
+        return np.where(self.closed, np.nan, 1.0)
+
+    def _adjacency(self, weight):
+        #python lists are much faster than numpy scalars inside the search loops
+        if weight not in self._lists:
+            if 'offsets' not in self._lists:
+                self._lists['offsets'] = self.offsets.tolist()
+                self._lists['targets'] = self.targets.tolist()
+            self._lists[weight] = self._costs(weight).tolist()
+        return self._lists['offsets'], self._lists['targets'], self._lists[weight]
+
+    def _reverse_adjacency(self, weight):
+        #incoming relationships of each node, used by the searches on the reversed graph
+        key = 'reverse_' + weight
+        if key not in self._lists:
+            source = np.repeat(np.arange(self.node_count, dtype=np.int32), np.diff(self.offsets))
+            order = np.argsort(self.targets, kind='stable')
+            offsets = np.zeros(self.node_count + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.targets, minlength=self.node_count), out=offsets[1:])
+            costs = self._costs(weight)
+            self._lists[key] = (offsets.tolist(), source[order].tolist(), costs[order].tolist())
+        return self._lists[key]
+
+    def distances(self, source, weight='distance', reverse=False):
+        """cost of the shortest paths from a node index to all the nodes of the graph
+           (from all the nodes to the node index when reverse is True).
+           Unreachable nodes have an infinite cost."""
+        offsets, targets, costs = self._reverse_adjacency(weight) if reverse else self._adjacency(weight)
+        dist = [float('inf')] * self.node_count
+        dist[source] = 0.0
+        queue = [(0.0, source)]
+        while queue:
+            du, u = heapq.heappop(queue)
+            if du > dist[u]:
+                continue
+            for e in range(offsets[u], offsets[u + 1]):
+                w = costs[e]
+                if w != w:
+                    continue
+                v = targets[e]
+                dv = du + w
+                if dv < dist[v]:
+                    dist[v] = dv
+                    heapq.heappush(queue, (dv, v))
+        return np.array(dist)
+
+    def reachable(self, sources, weight='distance', limit=float('inf')):
+        """costs of all the nodes reachable within limit from a set of sources (bounded Dijkstra).
+           sources is a dictionary node index -> initial cost. Returns a dictionary node index -> cost."""
+        offsets, targets, costs = self._adjacency(weight)
+        dist = {}
+        queue = []
+        for u, cost in sources.items():
+            if cost <= limit and cost < dist.get(u, float('inf')):
+                dist[u] = cost
+                queue.append((cost, u))
+        heapq.heapify(queue)
+        settled = {}
+        while queue:
+            du, u = heapq.heappop(queue)
+            if u in settled:
+                continue
+            settled[u] = du
+            for e in range(offsets[u], offsets[u + 1]):
+                w = costs[e]
+                if w != w:
+                    continue
+                v = targets[e]
+                dv = du + w
+                if dv <= limit and dv < dist.get(v, float('inf')):
+                    dist[v] = dv
+                    heapq.heappush(queue, (dv, v))
+        return settled
+
+    def isochrone(self, junctions, limit, mode='d'):
+        """road junctions reachable within limit (meters, hops or traffic cost depending on the mode)
+           from a set of junctions, a dictionary junction osm id -> distance in meters from the origin
+           (for example the NEAR distance from a point of interest).
+           Returns the arrays of the node indexes and of their costs, sorted by cost."""
+        weight = {'d': 'distance', 'h': 'hops', 't': 'traffic'}.get(mode[:1])
+        if weight is None:
+            raise ValueError('Unknown routing mode: ' + mode)
+        costs = self.reachable(self.virtual_edges(junctions, mode), weight, limit)
+        nodes = np.fromiter(costs.keys(), dtype=np.int64, count=len(costs))
+        values = np.fromiter(costs.values(), dtype=np.float64, count=len(costs))
+        order = np.argsort(values, kind='stable')
+        return nodes[order], values[order]
+
+    def heuristic(self, target, weight='distance'):
+        """lower bound of the cost from every node to the target node index: the best between
+           the landmark lower bounds (when landmarks are loaded for the weight) and,
+           for the distance, the great circle distance. None if no lower bound is available."""
+        bounds = []
+        if weight == 'distance':
+            bounds.append(haversine(self.lat, self.lon, self.lat[target], self.lon[target]))
+        if weight in self.landmarks:
+            bounds.append(self.landmarks[weight].lower_bounds(target))
+        if len(bounds) == 0:
+            return None
+        return np.maximum.reduce(bounds) if len(bounds) > 1 else bounds[0]
+
+    def dijkstra(self, source, target, weight='distance', heuristic=None):
+        """shortest path between two node indexes (A* when a heuristic array is given).
+           Relationships without a value for the weight are ignored.
+           Returns the total cost and the list of node indexes or None if no path exists."""
+        result = self.search({source: 0.0}, {target: 0.0}, weight, heuristic)
+        if result is None:
+            return None
+        return result[0], result[1]
+
+    def search(self, sources, targets, weight='distance', heuristic=None):
+        """single search from a virtual super-source to a virtual super-sink.
+           sources and targets are dictionaries node index -> cost of the virtual edge that
+           connects the node to the super-source (or to the super-sink).
+           Returns the total cost, the list of node indexes of the path and the cost of the path
+           without the virtual edges, or None if no path exists."""
+        offsets, targets_list, costs = self._adjacency(weight)
+        h = heuristic.tolist() if heuristic is not None else None
+        dist = {}
+        parent = {}
+        queue = []
+        for u, cost in sources.items():
+            if cost < dist.get(u, float('inf')):
+                dist[u] = cost
+                parent[u] = -1
+                queue.append((cost + h[u] if h else cost, u))
+        heapq.heapify(queue)
+        best, best_target = float('inf'), -1
+        settled = set()
+        while queue:
+            key, u = heapq.heappop(queue)
+            #no node in the queue can improve the best path found so far
+            if key >= best:
+                break
+            if u in settled:
+                continue
+            settled.add(u)
+            du = dist[u]
+            if u in targets and du + targets[u] < best:
+                best, best_target = du + targets[u], u
+            for e in range(offsets[u], offsets[u + 1]):
+                w = costs[e]
+                if w != w:
+                    continue
+                v = targets_list[e]
+                dv = du + w
+                if dv < dist.get(v, float('inf')):
+                    dist[v] = dv
+                    parent[v] = u
+                    heapq.heappush(queue, (dv + h[v] if h else dv, v))
+        if best_target == -1:
+            return None
+        path = self._build_path(parent, best_target)
+        return best, path, dist[best_target] - sources[path[0]]
+
+    def astar(self, source, target, weight='distance'):
+        """A* search using the lower bounds of the heuristic method: the great circle distance
+           for the distance weight and the landmark lower bounds (ALT) for the weights with landmarks.
+           When no admissible heuristic exists for the weight the search falls back to Dijkstra."""
+        return self.dijkstra(source, target, weight, self.heuristic(target, weight))
+
+    def hops(self, source, target):
+        """path with the minimum number of hops between two node indexes (breadth first search)"""
+        offsets, targets, costs = self._adjacency('hops')
+        parent = {source: -1}
+        queue = deque([source])
+        while queue:
+            u = queue.popleft()
+            if u == target:
+                path = self._build_path(parent, target)
+                return float(len(path) - 1), path
+            for e in range(offsets[u], offsets[u + 1]):
+                v = targets[e]
+                #closed relationships
+                if costs[e] != costs[e]:
+                    continue
+                if v not in parent:
+                    parent[v] = u
+                    queue.append(v)
+        return None
+
+    @staticmethod
+    def _build_path(parent, target):
+        path = []
+        while target != -1:
+            path.append(target)
+            target = parent[target]
+        return path[::-1]
+
+    def coordinates(self, path):
+        """list of [lat, lon] pairs of the nodes of a path"""
+        path = np.asarray(path, dtype=np.int64)
+        return np.column_stack((self.lat[path], self.lon[path])).tolist()
+
+    def shortest_path(self, source, target, mode='d'):
+        """route between two junctions (osm ids) with the modes of routing.py:
+           distance [d], hops [h] or traffic volume [t].
+           Returns the same values of the read_*_path methods of routing.py."""
+        s = self.index_of(source)
+        t = self.index_of(target)
+        if mode.startswith('d'):
+            result = self.astar(s, t, 'distance')
+        elif mode.startswith('h'):
+            result = self.hops(s, t)
+        elif mode.startswith('t'):
+            result = self.astar(s, t, 'traffic')
+        else:
+            raise ValueError('Unknown routing mode: ' + mode)
+        if result is None:
+            return []
+        cost, path = result
+        return [[source, target, cost, self.coordinates(path)]]
+
+    def connector_cost(self, distance, mode='d'):
+        """cost of a virtual edge of the given length in meters (for example the NEAR relationship
+           between a point of interest and a road junction) in the unit of the routing mode"""
+        if mode.startswith('d'):
+            return float(distance)
+        if mode.startswith('t'):
+            #the same normalization of the distance used in the traffic weight
+            return self.distance_coefficient * float(distance) / self.distance_range
+        return 0.0
+
+    def virtual_edges(self, junctions, mode):
+        """virtual edges that connect an origin (or a destination) to the given junctions, a dictionary
+           junction osm id -> distance in meters: dictionary node index -> cost in the unit of the mode.
+           The junctions not loaded in the graph are ignored."""
+        edges = {}
+        for junction, distance in junctions.items():
+            i = self._index.get(int(junction))
+            if i is not None:
+                edges[i] = min(self.connector_cost(distance, mode), edges.get(i, float('inf')))
+        return edges
+
+    def _search_virtual(self, s, t, mode):
+        #single search between the virtual source and target edges with the weight of the mode
+        if mode.startswith('d') or mode.startswith('t'):
+            weight = 'distance' if mode.startswith('d') else 'traffic'
+            #the minimum over the targets of the lower bound plus the cost to reach the destination is still admissible
+            heuristic = None
+            for v, cost in t.items():
+                bound = self.heuristic(v, weight)
+                if bound is None:
+                    break
+                heuristic = bound + cost if heuristic is None else np.minimum(heuristic, bound + cost)
+            return self.search(s, t, weight, heuristic)
+        if mode.startswith('h'):
+            return self.search(s, t, 'hops')
+        raise ValueError('Unknown routing mode: ' + mode)
+
+    def route_between(self, sources, targets, mode='d'):
+        """best route between a set of source junctions and a set of target junctions with a single search.
+           sources and targets are dictionaries junction osm id -> distance in meters from the origin
+           (or from the destination), for example the NEAR distance from a point of interest.
+           Returns the source junction, the target junction, the total cost and the coordinates of the path."""
+        s = self.virtual_edges(sources, mode)
+        t = self.virtual_edges(targets, mode)
+        if len(s) == 0 or len(t) == 0:
+            return []
+        result = self._search_virtual(s, t, mode)
+        if result is None:
+            return []
+        cost, path, _ = result
+        return [[int(self.junction_ids[path[0]]), int(self.junction_ids[path[-1]]), cost, self.coordinates(path)]]
+
+    def _segment_index(self):
+        if self._segments is None:
+            edges = np.arange(self.edge_count) if self.closed is None else np.flatnonzero(~self.closed)
+            source = np.repeat(np.arange(self.node_count), np.diff(self.offsets))[edges]
+            a = snapIndex.to_cartesian(self.lat[source], self.lon[source])
+            b = snapIndex.to_cartesian(self.lat[self.targets[edges]], self.lon[self.targets[edges]])
+            half = float(np.linalg.norm(b - a, axis=1).max() / 2) if len(edges) > 0 else 0.0
+            self._segments = (edges, source, a, b, cKDTree((a + b) / 2) if len(edges) > 0 else None, half)
+        return self._segments
+
+    def snap_to_edge(self, lat, lon, radius=float('inf')):
+        """projects the point on the nearest open relationship within radius meters.
+           Returns the index of the relationship, the fraction of its length before the projected point,
+           the distance in meters of the point from the relationship and the coordinates of the
+           projected point, or None if no relationship is near enough."""
+        edges, source, a, b, tree, half = self._segment_index()
+        if tree is None:
+            return None
+        p = snapIndex.to_cartesian([lat], [lon])[0]
+        #the nearest relationship has a midpoint within the distance of the nearest midpoint plus half of the longest one
+        nearest, _ = tree.query(p)
+        candidates = np.array(tree.query_ball_point(p, nearest + half + 1e-6), dtype=np.int64)
+        ab = b[candidates] - a[candidates]
+        length = np.einsum('ij,ij->i', ab, ab)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.clip(np.einsum('ij,ij->i', p - a[candidates], ab) / length, 0.0, 1.0)
+        fraction[length == 0] = 0.0
+        distances = np.linalg.norm(a[candidates] + fraction[:, None] * ab - p, axis=1)
+        best = int(np.argmin(distances))
+        if distances[best] > radius:
+            return None
+        i = candidates[best]
+        u, v = source[i], self.targets[edges[i]]
+        f = float(fraction[best])
+        point = [float(self.lat[u] + f * (self.lat[v] - self.lat[u])), float(self.lon[u] + f * (self.lon[v] - self.lon[u]))]
+        return int(edges[i]), f, float(distances[best]), point
+
+    def _split_edges(self, edge, fraction, mode):
+        #relationships between the two junctions of the snapped relationship, in both the directions,
+        #with the fraction of their length before the projected point
+        weight = {'d': 'distance', 'h': 'hops', 't': 'traffic'}[mode[:1]]
+        costs = self._costs(weight)
+        u = int(np.searchsorted(self.offsets, edge, side='right') - 1)
+        v = int(self.targets[edge])
+        split = []
+        for a, b, f in ((u, v, fraction), (v, u, 1.0 - fraction)):
+            for e in range(self.offsets[a], self.offsets[a + 1]):
+                if self.targets[e] == b and costs[e] == costs[e]:
+                    split.append((a, b, f, float(costs[e])))
+        return split, weight
+
+    def route_points(self, origin, destination, mode='d', radius=float('inf')):
+        """route between two points (lat, lon) projected on the nearest relationships: a virtual node
+           splits each snapped relationship and the partial costs of the two pieces connect it to the
+           junctions at the ends, so a single search runs from one source to one target.
+           The distance of the points from the roads is added as for the NEAR relationships.
+           Returns the source junction, the target junction, the total cost and the coordinates
+           of the path from the projected origin to the projected destination."""
+        snapped = [self.snap_to_edge(lat, lon, radius) for lat, lon in (origin, destination)]
+        if snapped[0] is None or snapped[1] is None:
+            return []
+        (source_edge, source_fraction, source_offset, source_point), \
+            (target_edge, target_fraction, target_offset, target_point) = snapped
+        source_split, weight = self._split_edges(source_edge, source_fraction, mode)
+        target_split, _ = self._split_edges(target_edge, target_fraction, mode)
+        connectors = self.connector_cost(source_offset, mode) + self.connector_cost(target_offset, mode)
+
+        def partial(cost, fraction):
+            #a piece of a relationship is one hop
+            return cost if weight == 'hops' else cost * fraction
+        #from the origin to the end of the snapped relationships, from their start to the destination
+        s, t = {}, {}
+        for a, b, f, cost in source_split:
+            s[b] = min(s.get(b, float('inf')), partial(cost, 1.0 - f) + self.connector_cost(source_offset, mode))
+        for a, b, f, cost in target_split:
+            t[a] = min(t.get(a, float('inf')), partial(cost, f) + self.connector_cost(target_offset, mode))
+        result = self._search_virtual(s, t, mode) if len(s) > 0 and len(t) > 0 else None
+        best = None
+        if result is not None:
+            cost, path, _ = result
+            best = [int(self.junction_ids[path[0]]), int(self.junction_ids[path[-1]]), cost,
+                    [source_point] + self.coordinates(path) + [target_point]]
+        #both the points on the same relationship, the destination after the origin
+        for a, b, f, cost in source_split:
+            for c, d, g, _ in target_split:
+                if (a, b) == (c, d) and g >= f:
+                    direct = partial(cost, g - f) + connectors
+                    if best is None or direct < best[2]:
+                        best = [int(self.junction_ids[a]), int(self.junction_ids[b]), direct, [source_point, target_point]]
+        return [] if best is None else [best]
+
+
+def load_graph(app, cache_file=None):
+    """returns the in-memory graph, reading it from the cache file when it exists and it has been stored
+       on the current version of the primal graph. Otherwise the graph is read from neo4j and the cache
+       file is written again, so the routes are never evaluated (and cached) on an outdated graph."""
+    if cache_file and os.path.exists(cache_file):
+        graph = RoadGraph.load(cache_file)
+        version = app.read_graph_version()
+        if graph.version == version:
+            return graph
+        print('{} has been stored on the version {} of the primal graph, the current one is {}: reading the graph again'.format(
+            cache_file, graph.version, version))
+    graph = RoadGraph.from_neo4j(app)
+    if cache_file:
+        graph.save(cache_file)
+    return graph
+
+
+def load_landmarks(graph, paths):
+    """attaches to the graph the landmark tables stored in the given .npz files.
+       The tables computed on another version of the graph are not used, their bounds could be too high."""
+    if len(paths) == 0:
+        return
+    import landmarks
+    for path in paths:
+        table = landmarks.Landmarks.load(path)
+        try:
+            table.check(graph)
+        except ValueError as e:
+            print('{} ignored: {}'.format(path, e))
+            continue
+        graph.landmarks[table.weight] = table
+
+
+def add_options():
+    parser = argparse.ArgumentParser(description='Routing between two road junctions on the in-memory primal graph.')
+    parser.add_argument('--source', '-s', dest='source', type=str,
+                        help="""Insert the OSM id of the road junction where the route starts.""",
+                        required=False)
+    parser.add_argument('--destination', '-d', dest='destination', type=str,
+                        help="""Insert the OSM id of the road junction where the route ends.""",
+                        required=False)
+    parser.add_argument('--sourcePoint', dest='source_point', type=str,
+                        help="""Insert the coordinates lat,lon where the route starts, instead of a junction.
+                              The point is projected on the nearest road.""",
+                        required=False)
+    parser.add_argument('--destinationPoint', dest='destination_point', type=str,
+                        help="""Insert the coordinates lat,lon where the route ends, instead of a junction.
+                              The point is projected on the nearest road.""",
+                        required=False)
+    parser.add_argument('--mode', '-m', dest='mode', type=str,
+                        help="""Insert the routing mode: distance[d], hops[h] or traffic volume[t].""",
+                        required=False, default='d')
+    parser.add_argument('--neo4jURL', '-n', dest='neo4jURL', type=str,
+                        help="""Insert the address of the local neo4j instance. For example: neo4j://localhost:7687""",
+                        required=True)
+    parser.add_argument('--neo4juser', '-u', dest='neo4juser', type=str,
+                        help="""Insert the name of the user of the local neo4j instance.""",
+                        required=True)
+    parser.add_argument('--neo4jpwd', '-p', dest='neo4jpwd', type=str,
+                        help="""Insert the password of the local neo4j instance.""",
+                        required=True)
+    parser.add_argument('--graphFile', '-g', dest='graph_file', type=str,
+                        help="""Insert the path of the .npz file where the in-memory graph is cached.""",
+                        required=False, default=None)
+    parser.add_argument('--chFile', '-c', dest='ch_file', type=str,
+                        help="""Insert the path of the .npz file of the Contraction Hierarchies generated by contractionHierarchies.py
+                              for the weight of the routing mode (distance or traffic). The query is answered on the hierarchy.""",
+                        required=False, default=None)
+    parser.add_argument('--landmarkFile', '-l', dest='landmark_files', type=str, action='append',
+                        help="""Insert the path of a .npz file of landmarks generated by landmarks.py.
+                              It can be repeated to load the landmarks of both the weights.""",
+                        required=False, default=[])
+    parser.add_argument('--fileOutput', '-f', dest='mapName', type=str,
+                        help="""Insert the path of the file of the resulting map.""",
+                        required=False, default='map.html')
+    parser.add_argument('--close', dest='close_streets', type=str, action='append',
+                        help="""Insert the name of a street closed only for this route (what-if), without changing the database.
+                              It can be repeated.""",
+                        required=False, default=[])
+    parser.add_argument('--closeOsmid', dest='close_osmids', type=str, action='append',
+                        help="""Insert the OSM id of a street closed only for this route (what-if). It can be repeated.""",
+                        required=False, default=[])
+    return parser
+
+
+def main(args=None):
+    argParser = add_options()
+    #retrieving arguments
+    options = argParser.parse_args(args=args)
+    points = options.source_point is not None or options.destination_point is not None
+    if points and (options.source_point is None or options.destination_point is None):
+        argParser.error('both the source and the destination points are required')
+    if not points and (options.source is None or options.destination is None):
+        argParser.error('the source and the destination junctions (or points) are required')
+    if options.ch_file and points:
+        argParser.error('the points are not supported by the Contraction Hierarchies, use the junctions')
+    if options.ch_file and (options.close_streets or options.close_osmids):
+        argParser.error('the closures are not supported by the Contraction Hierarchies, that are built on the whole graph')
+    if options.ch_file:
+        #bidirectional query on the precomputed hierarchy
+        import contractionHierarchies
+        ch = contractionHierarchies.ContractionHierarchy.load(options.ch_file)
+        mode = {'d': 'distance', 't': 'traffic'}.get(options.mode.lower()[:1])
+        if mode != ch.weight:
+            argParser.error('the hierarchy {} is built on the {} weight, it cannot answer the routing mode {}'.format(
+                options.ch_file, ch.weight, options.mode))
+        #the streets closed or the traffic imported after the hierarchy was built are not in its shortcuts
+        greeter = App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
+        version = greeter.read_graph_version()
+        greeter.close()
+        try:
+            ch.check(version)
+        except ValueError as e:
+            argParser.error('{}: {}'.format(options.ch_file, e))
+        result = ch.shortest_path(options.source, options.destination)
+    else:
+        #connecting to the neo4j instance
+        greeter = App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
+        #loading the graph in memory
+        graph = load_graph(greeter, options.graph_file)
+        greeter.close()
+        print('{} junctions and {} routes loaded'.format(graph.node_count, graph.edge_count))
+        load_landmarks(graph, options.landmark_files)
+        if options.close_streets or options.close_osmids:
+            graph = graph.with_closures(options.close_streets, options.close_osmids)
+            print('{} routes closed'.format(int(graph.closed.sum())))
+        if points:
+            origin, destination = [[float(value) for value in point.split(',')]
+                                   for point in (options.source_point, options.destination_point)]
+            result = graph.route_points(origin, destination, options.mode.lower())
+        else:
+            result = graph.shortest_path(options.source, options.destination, options.mode.lower())
+    if len(result) == 0:
+        print('\nNo path exists')
+        return 0
+    print('cost: {}'.format(result[0][2]))
+    print('number of hops: {}'.format(len(result[0][3]) - 1))
+    #add the path to the map
+    m = fo.Map(location=result[0][3][0], zoom_start=13)
+    fo.PolyLine(result[0][3], color="green", weight=5).add_to(m)
+    m.save(options.mapName)
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,515 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from functools import partial
+from neo4j import GraphDatabase
+import importlib.util
+import multiprocessing
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import routingEngine
+import projectionManager
+import graphVersion
+import nodeStore
+import routeCache
+import snapIndex
+try:
+    from neo4j import AsyncGraphDatabase
+except ImportError:
+    #the asynchronous API is available from the version 5 of the neo4j driver
+    AsyncGraphDatabase = None
+
+#the projections of cycleways and footways are defined with the routing on the subgraphs
+SUBGRAPH_ROUTING = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'Cycleways_and_Footways', 'Routing', 'Routing_on_subgraphs', 'Routing.py')
+
+#routing profiles of the subgraphs with the name of their version counter and their weights
+PROFILES = {'cycleway': 'cycleways', 'footway': 'footways'}
+SUBGRAPH_WEIGHTS = ('cost', 'travel_time')
+#labels of the junctions of the footways, as in the routing on the subgraphs
+FOOT_LABELS = ['FootCross', 'JunctionFootCross', 'RoadFootJunction']
+#labels of the nodes of the subgraphs, as in the routing on the subgraphs
+SUBGRAPH_LABELS = ['BikeCross', 'JunctionBikeCross', 'RoadBikeJunction', 'BikeNode'] + FOOT_LABELS
+MODES = {'d': 'distance', 'h': 'hops', 't': 'traffic'}
+
+#in-memory graph of the processes that evaluate the road routes, mapped from the files written by the service
+_worker_graph = None
+
+
+def _init_worker(directory, landmark_files):
+    global _worker_graph
+    _worker_graph = routingEngine.RoadGraph.load_arrays(directory)
+    routingEngine.load_landmarks(_worker_graph, landmark_files)
+
+
+def _closed_graph(streets, osmids):
+    return _worker_graph.with_closures(streets, osmids) if streets or osmids else _worker_graph
+
+
+def _route_between(sources, targets, mode, streets=(), osmids=()):
+    return _closed_graph(streets, osmids).route_between(sources, targets, mode)
+
+
+def _route_points(origin, destination, mode, streets=(), osmids=()):
+    return _closed_graph(streets, osmids).route_points(origin, destination, mode)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class RoutingService:
+    """Long running routing service. The queries run on a bounded pool of asynchronous neo4j sessions,
+       the road routes are evaluated on the in-memory primal graph by a pool of worker processes (the
+       searches are pure python and would be serialized by the GIL in threads) and the cycleway and
+       footway routes on the GDS projections acquired during the warm-up and kept until the service stops.
+       Identical requests in progress share the same evaluation and the requests beyond max_pending
+       are refused with 503 instead of queueing without limits."""
+
+    def __init__(self, uri, user, password, pool_size=50, max_pending=1000, workers=4,
+                 graph_file=None, landmark_files=(), refresh=30, cache_size=10000, cache_file=None):
+        if AsyncGraphDatabase is None:
+            raise RuntimeError('The routing service requires the version 5 of the neo4j python driver (pip install "neo4j>=5").')
+        self.credentials = (uri, user, password)
+        self.driver = AsyncGraphDatabase.driver(uri, auth=(user, password), max_connection_pool_size=pool_size)
+        #the projection manager and the node store use the blocking driver in the executor
+        self.sync_driver = GraphDatabase.driver(uri, auth=(user, password), max_connection_pool_size=4)
+        self.projections = projectionManager.ProjectionManager(self.sync_driver)
+        self.subgraph_nodes = nodeStore.NodeStore(self.sync_driver, SUBGRAPH_LABELS, graph=graphVersion.CYCLEWAYS)
+        #junctions near to the points of interest, resolved locally instead of querying at every request
+        self.road_snap = snapIndex.SnapIndex(self.sync_driver, ['RoadJunction'])
+        self.subgraph_snap = snapIndex.SnapIndex(self.sync_driver, ['Junction'] + FOOT_LABELS,
+                                                 graph=graphVersion.CYCLEWAYS)
+        self.sessions = asyncio.Semaphore(pool_size)
+        self.max_pending = max_pending
+        self.pending = 0
+        #blocking calls of the neo4j driver
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        #processes of the searches, created again with every version of the in-memory graph
+        self.workers = max(workers, 1)
+        self.searches = None
+        #directories of the arrays mapped by the processes of the searches, the last one is the current graph
+        self.graph_directories = []
+        self.graph_file = graph_file
+        self.landmark_files = list(landmark_files)
+        self.refresh = refresh
+        self.graph = None
+        self.graph_version = None
+        #name of the projection of each (profile, weight)
+        self.subgraph_projections = {}
+        #requests in progress by key, shared by the identical requests
+        self.inflight = {}
+        #road routes already evaluated on the current version of the primal graph
+        self.cache = routeCache.RouteCache(cache_size, cache_file)
+        self.stats = {'requests': 0, 'cached': 0, 'coalesced': 0, 'rejected': 0}
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(function, *args))
+
+    async def _search(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.searches, partial(function, *args))
+
+    def _start_searches(self, graph):
+        #the service already runs the event loop, the threads of the executor and the ones of the driver:
+        #a fork would copy their locks in whatever state they are. The processes are started by the
+        #forkserver (spawn where it does not exist) and map the arrays of the graph from uncompressed
+        #files, so they share the same pages instead of receiving a copy each
+        directory = tempfile.mkdtemp(prefix='routingService-graph-')
+        graph.save_arrays(directory)
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        searches = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(method),
+                                       initializer=_init_worker, initargs=(directory, self.landmark_files))
+        previous, self.searches = self.searches, searches
+        self.graph_directories.append(directory)
+        if previous is not None:
+            #the searches in progress end on the previous graph, whose files are removed with the next reload
+            previous.shutdown(wait=False)
+        for old in self.graph_directories[:-2]:
+            shutil.rmtree(old, ignore_errors=True)
+        del self.graph_directories[:-2]
+
+    async def _read(self, query, **parameters):
+        #the semaphore bounds the sessions used at the same time to the size of the pool
+        async with self.sessions:
+            async with self.driver.session() as session:
+                return await session.execute_read(self._read_values, query, parameters)
+
+    @staticmethod
+    async def _read_values(tx, query, parameters):
+        result = await tx.run(query, parameters)
+        return await result.values()
+
+    async def warm_up(self):
+        """loads the in-memory primal graph, the nodes of the subgraphs and the projections
+           of cycleways and footways before accepting requests"""
+        start = time.time()
+        await self._reload_graph()
+        for profile, graph in PROFILES.items():
+            for weight in SUBGRAPH_WEIGHTS:
+                try:
+                    self.subgraph_projections[profile, weight] = await self._run(self._acquire_subgraph, graph, weight)
+                except Exception as e:
+                    #the subgraphs are optional: the road routing works without them
+                    print('{} projection on {} not available: {}'.format(profile, weight, e))
+        if self.subgraph_projections:
+            await self._run(self.subgraph_nodes.refresh)
+            await self._run(self.subgraph_snap.refresh)
+        print('warm-up completed in {:.1f}s'.format(time.time() - start))
+
+    def _acquire_subgraph(self, graph, weight):
+        #loaded from its path: on case insensitive file systems Routing.py and routing.py have the same module name
+        spec = importlib.util.spec_from_file_location('subgraphRouting', SUBGRAPH_ROUTING)
+        subgraphRouting = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(subgraphRouting)
+        return self.projections.acquire(graph, weight, partial(subgraphRouting.App._create_projection, mode=graph, weight=weight))
+
+    async def _reload_graph(self):
+        version = (await self._read("""OPTIONAL MATCH (v:GraphVersion {name: $name})
+                                       RETURN coalesce(v.version, 0)""", name=graphVersion.PRIMAL))[0][0]
+        if version == self.graph_version:
+            return
+        #the cache file is read again from neo4j when it has been stored on another version
+        graph = await self._run(self._load_graph, self.graph_file)
+        await self._run(self.road_snap.refresh)
+        self._start_searches(graph)
+        #the routes are cached under the version the graph has been read from
+        self.graph, self.graph_version = graph, graph.version
+        print('primal graph version {} loaded: {} junctions, {} routes'.format(graph.version, graph.node_count, graph.edge_count))
+
+    def _load_graph(self, graph_file):
+        app = routingEngine.App(*self.credentials)
+        graph = routingEngine.load_graph(app, graph_file)
+        app.close()
+        routingEngine.load_landmarks(graph, self.landmark_files)
+        return graph
+
+    async def _refresh_subgraphs(self):
+        #the leases are renewed, otherwise after the lease timeout they look abandoned and other users evict them
+        lost = await self._run(self.projections.renew, list(self.subgraph_projections.values()))
+        changed = False
+        for (profile, weight), name in list(self.subgraph_projections.items()):
+            current = await self._run(self.projections.current_name, PROFILES[profile], weight)
+            if current != name or name in lost:
+                #the projection of the new version is acquired before releasing the previous one,
+                #a lost lease has nothing to release
+                self.subgraph_projections[profile, weight] = await self._run(self._acquire_subgraph,
+                                                                             PROFILES[profile], weight)
+                if name not in lost:
+                    await self._run(self.projections.release, name)
+                changed = True
+                print('{} projection on {} moved to {}'.format(profile, weight, self.subgraph_projections[profile, weight]))
+        if changed:
+            await self._run(self.subgraph_nodes.refresh)
+            await self._run(self.subgraph_snap.refresh)
+
+    async def refresh_graph(self):
+        """reloads the in-memory graph when the version of the primal graph changes, renews the leases of the
+           projections of cycleways and footways and acquires them again when their subgraphs change"""
+        while True:
+            await asyncio.sleep(self.refresh)
+            try:
+                await self._reload_graph()
+            except Exception as e:
+                print('refresh of the primal graph failed: {}'.format(e))
+            try:
+                await self._refresh_subgraphs()
+            except Exception as e:
+                print('refresh of the subgraph projections failed: {}'.format(e))
+
+    async def close(self):
+        for projection in self.subgraph_projections.values():
+            await self._run(self.projections.release, projection)
+        await self.driver.close()
+        self.sync_driver.close()
+        self.executor.shutdown(wait=False)
+        if self.searches is not None:
+            self.searches.shutdown(wait=False)
+        for directory in self.graph_directories:
+            shutil.rmtree(directory, ignore_errors=True)
+        self.cache.close()
+
+    async def coalesce(self, key, factory):
+        """evaluates the request once for all the identical requests in progress"""
+        if key in self.inflight:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(self.inflight[key])
+        if self.pending >= self.max_pending:
+            self.stats['rejected'] += 1
+            raise HTTPError(503, 'Too many requests in progress', {'Retry-After': '1'})
+        self.pending += 1
+        task = asyncio.ensure_future(factory())
+        self.inflight[key] = task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self.pending -= 1
+            self.inflight.pop(key, None)
+
+    async def road_route(self, source, target, mode, streets=(), osmids=()):
+        """route between two points of interest on the road network (distance, hops or traffic),
+           read from the cache when it has already been evaluated on the loaded version of the graph.
+           The given streets (names or osmids) are closed only for this request (what-if)."""
+        version = self.graph_version
+        if streets or osmids:
+            try:
+                route = await self._road_route(source, target, mode, streets, osmids)
+            except ValueError as e:
+                raise HTTPError(400, str(e))
+        else:
+            route = self.cache.get(graphVersion.PRIMAL, version, source, target, mode)
+            if route is routeCache.MISSING:
+                route = await self._road_route(source, target, mode)
+                self.cache.put(graphVersion.PRIMAL, version, source, target, mode, route)
+            else:
+                self.stats['cached'] += 1
+        if route is None:
+            return None
+        junction_source, junction_target, cost, path = route
+        route = {'source': source, 'target': target, 'mode': MODES[mode], 'cost': cost,
+                 'junction_source': junction_source, 'junction_target': junction_target, 'path': path}
+        if streets or osmids:
+            route['closed'] = {'streets': list(streets), 'osmids': list(osmids)}
+        return route
+
+    async def point_route(self, origin, destination, mode, streets=(), osmids=()):
+        """route between two coordinates on the road network: each point is projected on the nearest
+           open road and the route starts and ends in the middle of the roads (not cached)"""
+        try:
+            result = await self._search(_route_points, origin, destination, mode, streets, osmids)
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        if len(result) == 0:
+            return None
+        junction_source, junction_target, cost, path = result[0]
+        route = {'from': list(origin), 'to': list(destination), 'mode': MODES[mode], 'cost': cost,
+                 'junction_source': junction_source, 'junction_target': junction_target, 'path': path}
+        if streets or osmids:
+            route['closed'] = {'streets': list(streets), 'osmids': list(osmids)}
+        return route
+
+    async def _road_route(self, source, target, mode, streets=(), osmids=()):
+        #the junctions within 100 meters, as the NEAR relationships created by amenity.py
+        sources = {int(junction): distance for junction, distance in self.road_snap.poi_junctions(source, 100).items()}
+        targets = {int(junction): distance for junction, distance in self.road_snap.poi_junctions(target, 100).items()}
+        result = await self._search(_route_between, sources, targets, mode, streets, osmids)
+        return result[0] if len(result) > 0 else None
+
+    async def subgraph_route(self, profile, source, target, weight):
+        """route between two points of interest on the cycleways or on the footways"""
+        projection = self.subgraph_projections.get((profile, weight))
+        if projection is None:
+            raise HTTPError(404, 'The {} routing on {} is not available'.format(profile, weight))
+        labels = FOOT_LABELS if profile == 'footway' else ['Junction']
+        ends = [list(self.subgraph_snap.poi_junctions(poi, np.inf, k=1, labels=labels)) for poi in (source, target)]
+        if len(ends[0]) == 0 or len(ends[1]) == 0:
+            return None
+        rows = await self._read("""
+                    match (source:Junction {id: $source})
+                    match (target:Junction {id: $target})
+                    CALL gds.shortestPath.dijkstra.stream($projection, {
+                        sourceNode: source,
+                        targetNode: target,
+                        relationshipWeightProperty: $weight
+                    })
+                    YIELD totalCost, nodeIds
+                    RETURN totalCost, nodeIds""", source=ends[0][0], target=ends[1][0],
+                                projection=projection, weight=weight)
+        if len(rows) == 0:
+            return None
+        cost, node_ids = rows[0]
+        path = await self._run(self.subgraph_nodes.coordinates, node_ids)
+        return {'source': source, 'target': target, 'mode': profile, 'weight': weight, 'cost': cost,
+                'junction_source': ends[0][0], 'junction_target': ends[1][0], 'path': path}
+
+    async def handle(self, method, target):
+        """returns the status and the body of the response to a request"""
+        if method != 'GET':
+            raise HTTPError(405, 'Only GET requests are supported')
+        url = urlsplit(target)
+        lists = parse_qs(url.query)
+        parameters = {key: values[-1] for key, values in lists.items()}
+        if url.path == '/health':
+            return {'status': 'ok', 'graph_version': self.graph_version, 'pending': self.pending, **self.stats}
+        if not url.path.startswith('/route/'):
+            raise HTTPError(404, 'Unknown endpoint ' + url.path)
+        profile = url.path[len('/route/'):]
+        #coordinates instead of points of interest, only on the road network
+        points = profile == 'road' and 'from' in parameters and 'to' in parameters
+        if points:
+            try:
+                origin, destination = [tuple(float(value) for value in parameters[name].split(','))
+                                       for name in ('from', 'to')]
+                if len(origin) != 2 or len(destination) != 2:
+                    raise ValueError
+            except ValueError:
+                raise HTTPError(400, 'The parameters from and to must be two coordinates lat,lon')
+        else:
+            try:
+                source = int(parameters['source'])
+                target = int(parameters['target'])
+            except (KeyError, ValueError):
+                raise HTTPError(400, 'The parameters source and target must be the OSM ids of two points of interest')
+        self.stats['requests'] += 1
+        if profile == 'road':
+            mode = parameters.get('mode', 'd').lower()[:1]
+            if mode not in MODES:
+                raise HTTPError(400, 'The mode must be distance[d], hops[h] or traffic volume[t]')
+            #streets closed only for this request
+            streets = tuple(sorted(set(lists.get('close', []))))
+            osmids = tuple(sorted(set(lists.get('closeOsmid', []))))
+            if points:
+                key = (profile, origin, destination, mode, self.graph_version, streets, osmids)
+                route = await self.coalesce(key, partial(self.point_route, origin, destination, mode, streets, osmids))
+            else:
+                key = (profile, source, target, mode, self.graph_version, streets, osmids)
+                route = await self.coalesce(key, partial(self.road_route, source, target, mode, streets, osmids))
+        elif profile in PROFILES:
+            weight = parameters.get('weight', 'cost')
+            if weight not in SUBGRAPH_WEIGHTS:
+                raise HTTPError(400, 'The weight must be cost or travel_time')
+            key = (profile, source, target, weight)
+            route = await self.coalesce(key, partial(self.subgraph_route, profile, source, target, weight))
+        else:
+            raise HTTPError(404, 'Unknown routing profile ' + profile)
+        if route is None:
+            raise HTTPError(404, 'No path exists')
+        if parameters.get('format', 'json') == 'geojson':
+            return to_geojson(route)
+        return route
+
+
+def to_geojson(route):
+    """the route as a GeoJSON Feature with a LineString geometry (longitude, latitude)"""
+    properties = {key: value for key, value in route.items() if key != 'path'}
+    properties['hops'] = len(route['path']) - 1
+    return {'type': 'Feature', 'properties': properties,
+            'geometry': {'type': 'LineString', 'coordinates': [[lon, lat] for lat, lon in route['path']]}}
+
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+async def serve_connection(service, reader, writer):
+    """minimal HTTP/1.1 handler with keep-alive: GET requests with the parameters in the query string"""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, target, version = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            if int(headers.get('content-length', 0)) > 0:
+                await reader.readexactly(int(headers['content-length']))
+            extra = {}
+            try:
+                status, body = 200, await service.handle(method, target)
+            except HTTPError as e:
+                status, body, extra = e.status, {'error': str(e)}, e.headers
+            except Exception as e:
+                status, body = 500, {'error': str(e)}
+            keep_alive = headers.get('connection', '').lower() != 'close' and version.strip() == 'HTTP/1.1'
+            payload = json.dumps(body).encode()
+            head = ['HTTP/1.1 {} {}'.format(status, REASONS.get(status, '')),
+                    'Content-Type: application/{}'.format('geo+json' if body.get('type') == 'Feature' else 'json'),
+                    'Content-Length: {}'.format(len(payload)),
+                    'Connection: {}'.format('keep-alive' if keep_alive else 'close')]
+            head += ['{}: {}'.format(name, value) for name, value in extra.items()]
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + payload)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def run(options):
+    service = RoutingService(options.neo4jURL, options.neo4juser, options.neo4jpwd, options.pool_size,
+                             options.max_pending, options.workers, options.graph_file, options.landmark_files,
+                             options.refresh, options.cache_size, options.cache_file)
+    await service.warm_up()
+    refresh = asyncio.ensure_future(service.refresh_graph())
+    server = await asyncio.start_server(partial(serve_connection, service), options.host, options.port,
+                                        backlog=options.max_pending)
+    print('routing service listening on http://{}:{}'.format(options.host, options.port))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        refresh.cancel()
+        await service.close()
+
+
+def add_options():
+    parser = argparse.ArgumentParser(description='HTTP service for the routing on roads, cycleways and footways.')
+    parser.add_argument('--neo4jURL', '-n', dest='neo4jURL', type=str,
+                        help="""Insert the address of the local neo4j instance. For example: neo4j://localhost:7687""",
+                        required=True)
+    parser.add_argument('--neo4juser', '-u', dest='neo4juser', type=str,
+                        help="""Insert the name of the user of the local neo4j instance.""",
+                        required=True)
+    parser.add_argument('--neo4jpwd', '-p', dest='neo4jpwd', type=str,
+                        help="""Insert the password of the local neo4j instance.""",
+                        required=True)
+    parser.add_argument('--host', dest='host', type=str,
+                        help="""Insert the address where the service listens.""",
+                        required=False, default='127.0.0.1')
+    parser.add_argument('--port', dest='port', type=int,
+                        help="""Insert the port where the service listens.""",
+                        required=False, default=8080)
+    parser.add_argument('--poolSize', '-c', dest='pool_size', type=int,
+                        help="""Insert the maximum number of connections to the neo4j instance.""",
+                        required=False, default=50)
+    parser.add_argument('--maxPending', '-q', dest='max_pending', type=int,
+                        help="""Insert the maximum number of requests in progress, the others are refused with 503.""",
+                        required=False, default=1000)
+    parser.add_argument('--workers', '-w', dest='workers', type=int,
+                        help="""Insert the number of processes that evaluate the routes on the in-memory graph.""",
+                        required=False, default=4)
+    parser.add_argument('--graphFile', '-g', dest='graph_file', type=str,
+                        help="""Insert the path of the .npz file where the in-memory graph is cached.""",
+                        required=False, default=None)
+    parser.add_argument('--landmarkFile', '-l', dest='landmark_files', type=str, action='append',
+                        help="""Insert the path of a .npz file of landmarks generated by landmarks.py.""",
+                        required=False, default=[])
+    parser.add_argument('--refresh', '-r', dest='refresh', type=int,
+                        help="""Insert every how many seconds the version of the primal graph is checked.""",
+                        required=False, default=30)
+    parser.add_argument('--cacheSize', dest='cache_size', type=int,
+                        help="""Insert the number of road routes kept in memory.""",
+                        required=False, default=10000)
+    parser.add_argument('--cacheFile', '-k', dest='cache_file', type=str,
+                        help="""Insert the path of the SQLite file where the road routes are cached.""",
+                        required=False, default=None)
+    return parser
+
+
+def main(args=None):
+    argParser = add_options()
+    #retrieving arguments
+    options = argParser.parse_args(args=args)
+    try:
+        asyncio.run(run(options))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    main()
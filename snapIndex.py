@@ -0,0 +1,136 @@
+from scipy.spatial import cKDTree
+import numpy as np
+import graphVersion
+
+#earth radius used by osmnx to evaluate the length of the edges
+EARTH_RADIUS = 6371009
+
+
+def to_cartesian(lat, lon):
+    """points on the sphere in meters: the euclidean distance between them (the chord) is
+       monotone in the great circle distance, so the nearest points are the same"""
+    lat, lon = np.radians(np.asarray(lat, dtype=np.float64)), np.radians(np.asarray(lon, dtype=np.float64))
+    return EARTH_RADIUS * np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def chord_to_arc(chord):
+    return 2 * EARTH_RADIUS * np.arcsin(np.minimum(np.asarray(chord) / (2 * EARTH_RADIUS), 1.0))
+
+
+def arc_to_chord(arc):
+    return 2 * EARTH_RADIUS * np.sin(np.minimum(np.asarray(arc, dtype=np.float64) / (2 * EARTH_RADIUS), np.pi / 2))
+
+
+class SnapIndex:
+    """Client-side spatial index of the junctions, used to snap points of interest and coordinates
+       to their nearest junctions without traversing NEAR relationships or calling spatial.withinDistance
+       at every query. There is one KD-tree for each label (for example RoadJunction, Junction,
+       FootCross), built on the coordinates of the nodes; the points of interest are resolved through
+       the coordinates of their OSMWayNode members. The trees are built once and again only when
+       the version of the graph changes."""
+
+    def __init__(self, driver, labels, graph=graphVersion.PRIMAL):
+        self.driver = driver
+        self.labels = list(labels)
+        self.graph = graph
+        self.version = None
+        #osm ids, coordinates and tree of the nodes of each label
+        self.partitions = {}
+        #coordinates of the OSMWayNode members of each point of interest, by osm id as a string
+        self.pois = {}
+
+    def refresh(self):
+        """builds the trees again if the version of the graph has changed since the last load"""
+        with self.driver.session() as session:
+            version = session.read_transaction(graphVersion.get_version, self.graph)
+            if version != self.version:
+                self._load(session)
+                self.version = version
+        return self
+
+    def _load(self, session):
+        partitions = {}
+        for label in self.labels:
+            rows = session.read_transaction(self._read_nodes, label)
+            ids = np.array([row[0] for row in rows], dtype=object)
+            lat = np.array([row[1] for row in rows], dtype=np.float64)
+            lon = np.array([row[2] for row in rows], dtype=np.float64)
+            partitions[label] = (ids, lat, lon, cKDTree(to_cartesian(lat, lon)) if len(rows) > 0 else None)
+        pois = {}
+        for osm_id, lat, lon in session.read_transaction(self._read_pois):
+            pois.setdefault(str(osm_id), []).append((lat, lon))
+        self.partitions = partitions
+        self.pois = {osm_id: np.array(points, dtype=np.float64) for osm_id, points in pois.items()}
+
+    @staticmethod
+    def _read_nodes(tx, label):
+        result = tx.run("""
+                    MATCH (n:`""" + label + """`)
+                    WITH n, toFloat(coalesce(n.lat, n.location.latitude)) AS lat,
+                         toFloat(coalesce(n.lon, n.location.longitude)) AS lon
+                    WHERE lat IS NOT NULL AND lon IS NOT NULL
+                    RETURN n.id AS osm_id, lat, lon""")
+        return result.values()
+
+    @staticmethod
+    def _read_pois(tx):
+        result = tx.run("""
+                    MATCH (p:PointOfInterest)-[:MEMBER]->(w:OSMWayNode)
+                    RETURN p.osm_id AS osm_id, toFloat(w.lat) AS lat, toFloat(w.lon) AS lon""")
+        return result.values()
+
+    def _partitions(self, labels):
+        return [(label, self.partitions[label]) for label in (labels or self.labels)
+                if self.partitions.get(label) is not None and self.partitions[label][3] is not None]
+
+    def nearest(self, lat, lon, k=1, labels=None, radius=np.inf):
+        """the k junctions (of the given labels, all the labels when None) nearest to the coordinates
+           within radius meters, as a list of (distance in meters, osm id, label) sorted by distance"""
+        point = to_cartesian([lat], [lon])[0]
+        found = []
+        for label, (ids, _, _, tree) in self._partitions(labels):
+            distances, positions = tree.query(point, k=min(k, len(ids)),
+                                              distance_upper_bound=arc_to_chord(radius) if np.isfinite(radius) else np.inf)
+            for distance, position in zip(np.atleast_1d(distances), np.atleast_1d(positions)):
+                if np.isfinite(distance):
+                    found.append((float(chord_to_arc(distance)), ids[position], label))
+        found.sort(key=lambda item: item[0])
+        #the same junction can have more labels
+        unique = []
+        for item in found:
+            if all(item[1] != other[1] for other in unique):
+                unique.append(item)
+        return unique[:k]
+
+    def within(self, lat, lon, radius, labels=None):
+        """all the junctions (of the given labels) within radius meters from the coordinates,
+           as a list of (distance in meters, osm id, label) sorted by distance"""
+        point = to_cartesian([lat], [lon])[0]
+        found = {}
+        for label, (ids, _, _, tree) in self._partitions(labels):
+            positions = tree.query_ball_point(point, arc_to_chord(radius))
+            if len(positions) == 0:
+                continue
+            distances = chord_to_arc(np.linalg.norm(tree.data[positions] - point, axis=1))
+            for distance, position in zip(distances, positions):
+                if ids[position] not in found or distance < found[ids[position]][0]:
+                    found[ids[position]] = (float(distance), ids[position], label)
+        return sorted(found.values(), key=lambda item: item[0])
+
+    def poi_junctions(self, osm_id, radius=100.0, k=None, labels=None):
+        """junctions near to the point of interest: the ones within radius meters from one of its
+           OSMWayNode members (as the NEAR relationships created by amenity.py) or, when k is given,
+           the k nearest ones. Returns a dictionary osm id of the junction -> distance in meters."""
+        if str(osm_id) not in self.pois:
+            return {}
+        junctions = {}
+        for lat, lon in self.pois[str(osm_id)]:
+            if k is None:
+                found = self.within(lat, lon, radius, labels)
+            else:
+                found = self.nearest(lat, lon, k, labels, radius)
+            for distance, junction, _ in found:
+                junctions[junction] = min(distance, junctions.get(junction, np.inf))
+        if k is not None:
+            junctions = dict(sorted(junctions.items(), key=lambda item: item[1])[:k])
+        return junctions
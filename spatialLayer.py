@@ -0,0 +1,55 @@
+"""Registration of the nodes in the neo4j spatial layer, shared by all the importers.
+   The nodes are added with spatial.addNodes in batches of batch_size nodes, one transaction
+   for each batch, instead of calling spatial.addNode node by node in a single transaction.
+   The nodes already in the layer (referenced by the RTREE_REFERENCE relationships of the index)
+   are skipped, so an interrupted registration can be run again."""
+
+LAYER = 'spatial'
+
+
+def generate_layer(tx, layer=LAYER, geometry='geometry'):
+    """creates the WKT layer when it does not exist"""
+    result = tx.run("""
+                call spatial.layers() yield name
+                where name = $layer
+                return name
+                """, layer=layer)
+    if len(result.values()) == 0:
+        tx.run("""
+                call spatial.addWKTLayer($layer, $geometry)
+                """, layer=layer, geometry=geometry).consume()
+
+
+def _missing_nodes(tx, label, exclude):
+    result = tx.run("""
+                match (n:`""" + label + """`)
+                where n.geometry is not null and not (n)<-[:RTREE_REFERENCE]-()
+                      and ($exclude is null or not $exclude in labels(n))
+                return id(n)
+                """, exclude=exclude)
+    return [record[0] for record in result]
+
+
+def _add_nodes(tx, layer, ids):
+    result = tx.run("""
+                match (n) where id(n) in $ids
+                with collect(n) as nodes
+                call spatial.addNodes($layer, nodes) yield count
+                return count
+                """, layer=layer, ids=ids)
+    return result.single()[0]
+
+
+def add_to_layer(driver, label, layer=LAYER, batch_size=1000, exclude=None, progress=print):
+    """adds the nodes with the label (and a geometry) that are not yet in the layer, without the ones
+       that have also the label exclude, and returns the number of nodes added"""
+    with driver.session() as session:
+        session.write_transaction(generate_layer, layer)
+        ids = session.read_transaction(_missing_nodes, label, exclude)
+        added = 0
+        for start in range(0, len(ids), batch_size):
+            added += session.write_transaction(_add_nodes, layer, ids[start:start + batch_size])
+            if progress is not None:
+                progress('{} of {} {} nodes added to the layer {}'.format(min(start + batch_size, len(ids)),
+                                                                          len(ids), label, layer))
+    return added
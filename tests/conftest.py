@@ -0,0 +1,67 @@
+"""Small deterministic road graphs shared by the tests of the in-memory routing engines.
+   The scripts of the repository are modules in its root folder."""
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import shortest_path
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import routingEngine
+
+
+def grid_frames(size=6, seed=0, closed=4):
+    """junctions and routes of a size x size grid: two routes in opposite directions between the
+       neighbours, a street (osmid) for each row and each column and some closed routes.
+       The distances are longer than the great circle distances, as the real roads."""
+    rng = np.random.default_rng(seed)
+    count = size * size
+    row, column = np.divmod(np.arange(count), size)
+    nodes = pd.DataFrame({'node_id': np.arange(count) * 2 + 5, 'junction_id': 1000 + np.arange(count),
+                          'lat': 44.64 + row * 0.001 + rng.random(count) * 1e-4,
+                          'lon': 10.92 + column * 0.001 + rng.random(count) * 1e-4})
+    edges = []
+    for a in range(count):
+        r, c = divmod(a, size)
+        neighbours = []
+        if c + 1 < size:
+            neighbours.append((a + 1, str(100 + r), 'Via Riga {}'.format(r)))
+        if r + 1 < size:
+            neighbours.append((a + size, str(200 + c), 'Via Colonna {}'.format(c)))
+        for b, osmid, name in neighbours:
+            for u, v in ((a, b), (b, a)):
+                edges.append([u, v, osmid, name])
+    edges = pd.DataFrame(edges, columns=['source', 'target', 'osmid', 'name'])
+    straight = routingEngine.haversine(nodes.lat.values[edges.source], nodes.lon.values[edges.source],
+                                       nodes.lat.values[edges.target], nodes.lon.values[edges.target])
+    edges['distance'] = straight * (1.0 + rng.random(len(edges)) * 0.5)
+    edges['AADT'] = 100.0 + rng.random(len(edges)) * 900.0
+    edges['status'] = 'active'
+    edges.loc[rng.choice(len(edges), closed, replace=False), 'status'] = 'close'
+    edges['source'] = nodes.node_id.values[edges.source]
+    edges['target'] = nodes.node_id.values[edges.target]
+    return nodes, edges
+
+
+def reference_costs(nodes, edges, weight='distance'):
+    """all pairs shortest path costs of scipy on the active routes, indexed as the junctions"""
+    edges = edges.copy()
+    edges['traffic'] = routingEngine.traffic_weight(edges['AADT'], edges['distance'])
+    edges['hops'] = 1.0
+    active = edges[edges.status == 'active']
+    source = np.searchsorted(nodes.node_id.values, active.source.values)
+    target = np.searchsorted(nodes.node_id.values, active.target.values)
+    matrix = csr_matrix((active[weight].values, (source, target)), shape=(len(nodes), len(nodes)))
+    return shortest_path(matrix, directed=True)
+
+
+@pytest.fixture
+def grid():
+    return grid_frames()
+
+
+@pytest.fixture
+def graph(grid):
+    return routingEngine.RoadGraph.from_frames(*grid)
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+import aadtImputation
+
+
+def routes(rows):
+    return pd.DataFrame(rows, columns=aadtImputation.ROUTE_COLUMNS)
+
+
+def test_missing_values_are_interpolated_along_the_road():
+    #four routes in a row, 1 -> 2 -> 3 -> 4 -> 5, measured only at the ends
+    estimates = aadtImputation.estimate(routes([[10, 1, 2, 100.0, 'primary'], [11, 2, 3, np.nan, 'primary'],
+                                                [12, 3, 4, np.nan, 'primary'], [13, 4, 5, 200.0, 'primary']]),
+                                        tolerance=1e-6)
+    assert estimates.id.tolist() == [11, 12]
+    assert estimates.AADT.tolist() == pytest.approx([400 / 3, 500 / 3])
+
+
+def test_isolated_routes_take_the_average_of_their_highway():
+    estimates = aadtImputation.estimate(routes([[10, 1, 2, 100.0, 'primary'], [11, 2, 3, np.nan, 'primary'],
+                                                [12, 3, 4, 200.0, 'primary'], [13, 7, 8, np.nan, 'primary'],
+                                                [14, 8, 9, np.nan, 'residential']]), tolerance=1e-6)
+    estimates = dict(zip(estimates.id, estimates.AADT))
+    assert estimates[11] == pytest.approx(150.0)
+    assert estimates[13] == pytest.approx(150.0)
+    #no measured residential road: the estimate does not exist
+    assert 14 not in estimates
+
+
+def test_neighbours_share_a_junction_once():
+    #two routes between the same junctions in opposite directions and one crossing route
+    neighbours = aadtImputation.adjacency(routes([[10, 1, 2, 1.0, 'primary'], [11, 2, 1, 1.0, 'primary'],
+                                                  [12, 2, 3, 1.0, 'primary'], [13, 5, 6, 1.0, 'primary']])).toarray()
+    assert neighbours.tolist() == [[0, 1, 1, 0], [1, 0, 1, 0], [1, 1, 0, 0], [0, 0, 0, 0]]
+
+
+def test_nothing_to_estimate():
+    estimates = aadtImputation.estimate(routes([[10, 1, 2, 100.0, 'primary'], [11, 2, 3, 50.0, 'primary']]))
+    assert len(estimates) == 0
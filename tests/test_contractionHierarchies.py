@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+import contractionHierarchies
+import routingEngine
+from conftest import reference_costs
+
+
+@pytest.mark.parametrize('weight', ['distance', 'traffic'])
+def test_queries_match_scipy(grid, graph, weight):
+    ch = contractionHierarchies.ContractionHierarchy.build(graph, weight, verbose=False)
+    expected = reference_costs(*grid, weight=weight)
+    costs = graph.weights[weight]
+    for s in range(graph.node_count):
+        for t in range(graph.node_count):
+            result = ch.query(s, t)
+            if np.isinf(expected[s, t]):
+                assert result is None
+                continue
+            cost, path = result
+            assert cost == pytest.approx(expected[s, t])
+            #the shortcuts are unpacked in relationships of the graph with the same total cost
+            assert path[0] == s and path[-1] == t
+            total = 0.0
+            for u, v in zip(path[:-1], path[1:]):
+                edges = [e for e in range(graph.offsets[u], graph.offsets[u + 1]) if graph.targets[e] == v]
+                assert len(edges) > 0
+                total += min(costs[e] for e in edges)
+            assert total == pytest.approx(cost)
+
+
+def test_save_and_load(graph, tmp_path):
+    ch = contractionHierarchies.ContractionHierarchy.build(graph, 'distance', verbose=False)
+    path = str(tmp_path / 'ch_distance.npz')
+    ch.save(path)
+    loaded = contractionHierarchies.ContractionHierarchy.load(path)
+    assert loaded.weight == 'distance' and loaded.shortcut_count == ch.shortcut_count
+    assert loaded.shortest_path(1000, 1035) == ch.shortest_path(1000, 1035)
+
+
+def test_mode_of_another_weight_is_rejected(graph, tmp_path, capsys):
+    path = str(tmp_path / 'ch_distance.npz')
+    contractionHierarchies.ContractionHierarchy.build(graph, 'distance', verbose=False).save(path)
+    with pytest.raises(SystemExit) as error:
+        routingEngine.main(['-s', '1000', '-d', '1035', '-m', 't', '-c', path,
+                            '-n', 'neo4j://localhost:7687', '-u', 'neo4j', '-p', 'passwd'])
+    assert error.value.code == 2
+    assert 'built on the distance weight' in capsys.readouterr().err
+
+
+def test_only_distance_and_traffic_can_be_built():
+    parser = contractionHierarchies.add_options()
+    with pytest.raises(SystemExit):
+        parser.parse_args(['-n', 'neo4j://localhost:7687', '-u', 'neo4j', '-p', 'passwd', '-w', 'hops'])
+
+
+def test_hierarchy_of_another_version_is_refused(grid, graph, tmp_path, monkeypatch, capsys):
+    graph.version = 3
+    path = str(tmp_path / 'ch_distance.npz')
+    contractionHierarchies.ContractionHierarchy.build(graph, 'distance', verbose=False).save(path)
+    ch = contractionHierarchies.ContractionHierarchy.load(path)
+    ch.check(3, graph)
+    with pytest.raises(ValueError):
+        ch.check(4)
+    #a closed street changes the routes but the version is the same in this test
+    nodes, edges = grid
+    edges = edges.copy()
+    edges.loc[edges.osmid == '102', 'status'] = 'close'
+    with pytest.raises(ValueError):
+        ch.check(3, routingEngine.RoadGraph.from_frames(nodes, edges))
+    #routingEngine refuses the hierarchy after a change of the primal graph
+    monkeypatch.setattr(routingEngine.App, 'read_graph_version', lambda self: 4)
+    with pytest.raises(SystemExit) as error:
+        routingEngine.main(['-s', '1000', '-d', '1035', '-m', 'd', '-c', path,
+                            '-n', 'neo4j://localhost:7687', '-u', 'neo4j', '-p', 'passwd'])
+    assert error.value.code == 2
+    assert 'version 3' in capsys.readouterr().err
+
+
+def test_hierarchy_without_version_is_refused(graph):
+    ch = contractionHierarchies.ContractionHierarchy.build(graph, 'distance', verbose=False)
+    with pytest.raises(ValueError):
+        ch.check(0)
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+import distanceMatrix
+from conftest import reference_costs
+
+JUNCTIONS = [1000, 1007, 1021, 1035]
+
+
+@pytest.fixture
+def candidates():
+    #a point of interest on each of the junctions
+    return pd.DataFrame({'poi': [1, 2, 3, 4], 'junction': JUNCTIONS, 'distance': [0.0] * 4})
+
+
+def test_rows_match_scipy(grid, graph, candidates, tmp_path):
+    graph.version = 3
+    matrix = distanceMatrix.MatrixBuilder(graph, candidates).build(str(tmp_path / 'matrix'))
+    expected = reference_costs(*grid)[np.ix_([j - 1000 for j in JUNCTIONS], [j - 1000 for j in JUNCTIONS])]
+    assert np.allclose(matrix, expected)
+
+
+def test_resume_only_on_the_same_version(graph, candidates, tmp_path, capsys):
+    prefix = str(tmp_path / 'matrix')
+    graph.version = 3
+    builder = distanceMatrix.MatrixBuilder(graph, candidates)
+    expected = np.array(builder.build(prefix))
+    #an interrupted run: the last row has not been evaluated
+    matrix, done = builder.open(prefix)
+    matrix[3] = np.nan
+    done[3] = False
+    matrix.flush()
+    done.flush()
+    capsys.readouterr()
+    assert np.allclose(builder.build(prefix), expected)
+    assert '1 of 4 rows to evaluate' in capsys.readouterr().out
+    #the rows of the previous version of the graph are evaluated again
+    graph.version = 4
+    assert np.allclose(distanceMatrix.MatrixBuilder(graph, candidates).build(prefix), expected)
+    assert '4 of 4 rows to evaluate' in capsys.readouterr().out
+    assert int(np.load(prefix + '_index.npz')['version']) == 4
+
+
+def test_unknown_version_is_not_resumed(graph, candidates, tmp_path, capsys):
+    prefix = str(tmp_path / 'matrix')
+    builder = distanceMatrix.MatrixBuilder(graph, candidates)
+    builder.build(prefix)
+    builder.build(prefix)
+    assert capsys.readouterr().out.count('4 of 4 rows to evaluate') == 2
@@ -0,0 +1,107 @@
+import pandas as pd
+import pytest
+import dualGraph
+
+#street 1 reaches the junction 2 twice and goes on to 3, street 3 goes back and forth between 2 and 5,
+#street 2 has only a closed route
+ROUTES = [(1, 2, '1', 'Via A', 100.0, 10.0, 'active'), (6, 2, '1', 'Via A', 300.0, 30.0, 'active'),
+          (2, 3, '1', 'Via A', 200.0, 20.0, 'active'), (2, 5, '3', 'Via C', 50.0, 5.0, 'active'),
+          (5, 2, '3', 'Via C', 50.0, 5.0, 'active'), (3, 4, '2', 'Via B', 10.0, 1.0, 'close'),
+          (7, 8, '4', 'Via D', 20.0, 2.0, 'active')]
+
+
+def routes(rows=ROUTES):
+    return pd.DataFrame(rows, columns=dualGraph.ROUTE_COLUMNS)
+
+
+class Result:
+    def __init__(self, records):
+        self.records = records
+
+    def single(self):
+        return self.records[0] if self.records else None
+
+    def values(self):
+        return self.records
+
+    def consume(self):
+        pass
+
+    def __iter__(self):
+        return iter(self.records)
+
+
+class FakeTx:
+    """stands for a neo4j transaction on a dual graph with the streets in streets: answers the queries of
+       update_streets on the edge list and records what is written"""
+
+    def __init__(self, rows, streets):
+        self.rows = rows
+        self.streets = set(streets)
+        self.read_osmids = None
+        self.written_streets = []
+        self.written_connections = []
+        self.deleted_for = None
+
+    def run(self, query, **parameters):
+        if 'UNWIND [m, n] AS junction' in query:
+            self.read_osmids = parameters['osmids']
+            junctions = {j for r in self.rows if r[2] in parameters['osmids'] for j in r[:2]}
+            return Result([list(r) for r in self.rows if r[0] in junctions or r[1] in junctions])
+        if 'MERGE (d:RoadOsm' in query:
+            self.written_streets += parameters['rows']
+            return Result([])
+        if "SET d.status = 'close'" in query:
+            return Result([[len(self.streets & set(parameters['osmids']))]])
+        if 'RETURN d.osmid' in query:
+            return Result([[osmid] for osmid in parameters['osmids'] if osmid in self.streets])
+        if 'DELETE c' in query:
+            self.deleted_for = parameters['osmids']
+            return Result([])
+        if 'CREATE (a)-[:CONNECTED' in query:
+            self.written_connections += parameters['rows']
+            return Result([])
+        assert 'RETURN d LIMIT 1' in query
+        return Result([[osmid] for osmid in self.streets][:1])
+
+
+def test_streets_have_only_active_routes():
+    streets = dualGraph.street_nodes(routes())
+    assert streets.osmid.tolist() == ['1', '3', '4']
+    street = streets.set_index('osmid').loc['1']
+    assert (street.AADT, street.distance, street['name']) == (200.0, 60.0, 'Via A')
+    assert street.traffic == pytest.approx(200 / 60)
+
+
+def test_one_connection_for_each_junction():
+    connections = dualGraph.street_connections(routes())
+    #no connection of a street with itself, the two routes of street 1 into the junction 2 count once
+    assert sorted(map(tuple, connections.values.tolist())) == [('1', '2', 3), ('1', '3', 2), ('3', '1', 2)]
+    #the street without a node is not connected
+    connections = dualGraph.street_connections(routes(), {'1', '3', '4'})
+    assert sorted(map(tuple, connections.values.tolist())) == [('1', '3', 2), ('3', '1', 2)]
+
+
+def test_update_is_restricted_to_the_given_streets():
+    tx = FakeTx(ROUTES, ['1', '3', '4'])
+    streets, connections = dualGraph.update_streets(tx, [3])
+    assert tx.read_osmids == ['3'] and tx.deleted_for == ['3']
+    assert [row['osmid'] for row in tx.written_streets] == ['3']
+    assert sorted((row['source'], row['target'], row['junction']) for row in tx.written_connections) == \
+        [('1', '3', 2), ('3', '1', 2)]
+    assert (streets, connections) == (1, 2)
+
+
+def test_closed_street_keeps_its_node():
+    rows = [r[:6] + ('close',) if r[2] == '3' else r for r in ROUTES]
+    tx = FakeTx(rows, ['1', '3', '4'])
+    streets, connections = dualGraph.update_streets(tx, ['3'])
+    #the node is not written again but closed, its connections are written again
+    assert tx.written_streets == [] and tx.deleted_for == ['3']
+    assert len(tx.written_connections) == 2 and (streets, connections) == (1, 2)
+
+
+def test_nothing_to_update_without_dual_graph():
+    tx = FakeTx(ROUTES, [])
+    assert dualGraph.update_streets(tx, ['3']) == (0, 0)
+    assert tx.read_osmids is None
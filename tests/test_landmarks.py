@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+import landmarks
+import routingEngine
+from conftest import reference_costs
+
+
+@pytest.mark.parametrize('weight', ['distance', 'traffic'])
+def test_lower_bounds_are_admissible(grid, graph, weight):
+    table = landmarks.Landmarks.build(graph, weight, count=4, verbose=False)
+    expected = reference_costs(*grid, weight=weight)
+    for target in range(graph.node_count):
+        bounds = table.lower_bounds(target)
+        reachable = np.isfinite(expected[:, target])
+        assert np.all(bounds[reachable] <= expected[reachable, target] + 1e-9)
+
+
+def test_astar_with_landmarks_matches_scipy(grid, graph):
+    graph.landmarks['traffic'] = landmarks.Landmarks.build(graph, 'traffic', count=4, verbose=False)
+    expected = reference_costs(*grid, weight='traffic')
+    for s in range(graph.node_count):
+        for t in range(graph.node_count):
+            result = graph.astar(s, t, 'traffic')
+            assert (result is None) if np.isinf(expected[s, t]) else result[0] == pytest.approx(expected[s, t])
+
+
+def test_tables_of_other_weights_are_refused(grid, graph, tmp_path, capsys):
+    path = str(tmp_path / 'landmarks_traffic.npz')
+    landmarks.Landmarks.build(graph, 'traffic', count=4, verbose=False).save(path)
+    landmarks.Landmarks.load(path).check(graph)
+    #a new import of the traffic changes the weights but not the junctions
+    nodes, edges = grid
+    edges = edges.copy()
+    edges.loc[0, 'AADT'] = edges.loc[0, 'AADT'] * 10
+    changed = routingEngine.RoadGraph.from_frames(nodes, edges)
+    with pytest.raises(ValueError):
+        landmarks.Landmarks.load(path).check(changed)
+    routingEngine.load_landmarks(changed, [path])
+    assert changed.landmarks == {}
+    assert 'ignored' in capsys.readouterr().out
+
+
+def test_tables_without_fingerprint_are_refused(graph):
+    table = landmarks.Landmarks.build(graph, 'distance', count=2, verbose=False)
+    table.fingerprint = None
+    with pytest.raises(ValueError):
+        table.check(graph)
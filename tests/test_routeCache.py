@@ -0,0 +1,74 @@
+import sqlite3
+import routeCache
+
+ROUTE = [[1000, 1035, 1171.7, [[44.64, 10.92], [44.65, 10.93]]]]
+
+
+def rows(path):
+    with sqlite3.connect(path) as db:
+        return db.execute('SELECT graph, version, source, target, mode FROM routes ORDER BY version').fetchall()
+
+
+def test_keys_are_normalized():
+    cache = routeCache.RouteCache()
+    cache.put('primal', 3, '1000', '1035', 'distance', ROUTE)
+    assert cache.get('primal', '3', 1000, 1035, 'd') == ROUTE
+    assert cache.get('primal', 3, 1000, 1035, 'D') == ROUTE
+    assert cache.get('primal', 3, 1000, 1035, 't') is routeCache.MISSING
+    assert cache.get('primal', 3, 1035, 1000, 'd') is routeCache.MISSING
+    assert len(cache) == 1 and cache.hits == 2 and cache.misses == 2
+
+
+def test_no_path_is_not_missing(tmp_path):
+    path = str(tmp_path / 'routes.sqlite')
+    cache = routeCache.RouteCache(path=path)
+    assert cache.get('primal', 3, 1000, 1035, 'd') is routeCache.MISSING
+    cache.put('primal', 3, 1000, 1035, 'd', None)
+    assert cache.get('primal', 3, 1000, 1035, 'd') is None
+    cache.close()
+    #None is stored in the file as well
+    cache = routeCache.RouteCache(path=path)
+    assert cache.get('primal', 3, 1000, 1035, 'd') is None
+    cache.close()
+
+
+def test_newer_version_evicts_the_older_ones(tmp_path):
+    path = str(tmp_path / 'routes.sqlite')
+    cache = routeCache.RouteCache(path=path)
+    cache.put('primal', 3, 1000, 1035, 'd', ROUTE)
+    cache.put('dual', 1, 1000, 1035, 'd', ROUTE)
+    cache.put('primal', 4, 1000, 1028, 'd', ROUTE)
+    assert sorted(key[:2] for key in cache.entries) == [('dual', 1), ('primal', 4)]
+    assert rows(path) == [('dual', 1, 1000, 1035, 'd'), ('primal', 4, 1000, 1028, 'd')]
+    assert cache.get('primal', 3, 1000, 1035, 'd') is routeCache.MISSING
+    cache.close()
+    #another run that sees a newer version deletes the rows of the file
+    cache = routeCache.RouteCache(path=path)
+    assert cache.get('primal', 5, 1000, 1028, 'd') is routeCache.MISSING
+    assert rows(path) == [('dual', 1, 1000, 1035, 'd')]
+    cache.close()
+
+
+def test_older_version_is_not_stored(tmp_path):
+    path = str(tmp_path / 'routes.sqlite')
+    cache = routeCache.RouteCache(path=path)
+    cache.get('primal', 4, 1000, 1035, 'd')
+    #a route evaluated on the version replaced in the meantime
+    cache.put('primal', 3, 1000, 1035, 'd', ROUTE)
+    assert len(cache) == 0 and rows(path) == []
+    assert cache.get('primal', 3, 1000, 1035, 'd') is routeCache.MISSING
+    cache.close()
+
+
+def test_least_recently_used_is_evicted(tmp_path):
+    path = str(tmp_path / 'routes.sqlite')
+    cache = routeCache.RouteCache(capacity=2, path=path)
+    cache.put('primal', 3, 1000, 1001, 'd', ROUTE)
+    cache.put('primal', 3, 1000, 1002, 'd', ROUTE)
+    cache.get('primal', 3, 1000, 1001, 'd')
+    cache.put('primal', 3, 1000, 1003, 'd', ROUTE)
+    assert [key[3] for key in cache.entries] == [1001, 1003]
+    #the file keeps the route evicted from memory
+    assert cache.get('primal', 3, 1000, 1002, 'd') == ROUTE
+    assert [key[3] for key in cache.entries] == [1003, 1002]
+    cache.close()
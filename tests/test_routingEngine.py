@@ -0,0 +1,86 @@
+import os
+import numpy as np
+import pytest
+import routingEngine
+from conftest import reference_costs
+
+MODES = {'d': 'distance', 'h': 'hops', 't': 'traffic'}
+
+
+@pytest.mark.parametrize('mode', ['d', 'h', 't'])
+def test_shortest_path_matches_scipy(grid, graph, mode):
+    expected = reference_costs(*grid, weight=MODES[mode])
+    junctions = graph.junction_ids.tolist()
+    for s, source in enumerate(junctions):
+        for t, target in enumerate(junctions):
+            result = graph.shortest_path(source, target, mode)
+            if np.isinf(expected[s, t]):
+                assert result == []
+            else:
+                assert result[0][2] == pytest.approx(expected[s, t])
+                #the path starts and ends at the two junctions
+                assert result[0][3][0] == [graph.lat[s], graph.lon[s]]
+                assert result[0][3][-1] == [graph.lat[t], graph.lon[t]]
+
+
+def test_route_between_is_the_best_pair(grid, graph):
+    expected = reference_costs(*grid)
+    sources = {1000: 30.0, 1007: 5.0}
+    targets = {1035: 0.0, 1028: 40.0}
+    best = min(sources[a] + expected[a - 1000, b - 1000] + targets[b] for a in sources for b in targets)
+    assert graph.route_between(sources, targets, 'd')[0][2] == pytest.approx(best)
+
+
+def test_closures_remove_the_street(grid, graph):
+    nodes, edges = grid
+    closed = graph.with_closures(osmids=['102'])
+    edges = edges.copy()
+    edges.loc[edges.osmid == '102', 'status'] = 'close'
+    expected = reference_costs(nodes, edges)
+    for target in range(len(nodes)):
+        result = closed.shortest_path(1000, 1000 + target, 'd')
+        assert (result == []) if np.isinf(expected[0, target]) else result[0][2] == pytest.approx(expected[0, target])
+
+
+class VersionApp:
+    """stands for routingEngine.App: the graph of the grid with the given version of the primal graph"""
+
+    def __init__(self, grid, version):
+        self.grid = grid
+        self.version = version
+        self.reads = 0
+
+    def read_graph_version(self):
+        return self.version
+
+    def read_junctions(self):
+        self.reads += 1
+        return self.grid[0]
+
+    def read_routes(self):
+        return self.grid[1]
+
+    def read_weights(self):
+        return None
+
+
+def test_cache_file_is_read_again_on_another_version(grid, tmp_path):
+    path = str(tmp_path / 'junctions.npz')
+    app = VersionApp(grid, 3)
+    graph = routingEngine.load_graph(app, path)
+    assert os.path.exists(path) and graph.version == 3 and app.reads == 1
+    graph = routingEngine.load_graph(app, path)
+    assert graph.version == 3 and app.reads == 1
+    app.version = 4
+    graph = routingEngine.load_graph(app, path)
+    assert graph.version == 4 and app.reads == 2
+    assert routingEngine.RoadGraph.load(path).version == 4
+
+
+def test_arrays_are_mapped_from_the_directory(graph, tmp_path):
+    graph.version = 3
+    graph.save_arrays(str(tmp_path))
+    mapped = routingEngine.RoadGraph.load_arrays(str(tmp_path))
+    assert isinstance(mapped.targets.base, np.memmap) and mapped.version == 3
+    assert mapped.fingerprint('traffic') == graph.fingerprint('traffic')
+    assert mapped.shortest_path(1000, 1035, 'd') == graph.shortest_path(1000, 1035, 'd')
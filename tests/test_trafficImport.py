@@ -0,0 +1,37 @@
+import pytest
+import trafficImport
+
+
+@pytest.fixture
+def traffic_files(tmp_path):
+    #the same volumes with the columns of traffic.csv and with the ones of new_traffic.csv
+    rows = [('1', '2', '10', '100.004', '2019'), ('1', '2', '10', '100.004', '2019'),
+            ('1', '2', '10', '200', '2020'), ('1', '2', '10', '300', '2020'),
+            ('2', '3', '11', '50', '2019'), ('3', '4', '12', '', '2019')]
+    old = tmp_path / 'traffic.csv'
+    old.write_text('node_start,node_end,id_road_section,traffic_volume,year\n' +
+                   ''.join(','.join(row) + '\n' for row in rows))
+    new = tmp_path / 'new_traffic.csv'
+    new.write_text('year,id_road_section,node_end,node_start,traffic_volume\n' +
+                   ''.join(','.join((year, osmid, end, start, volume)) + '\n'
+                           for start, end, osmid, volume, year in rows))
+    return str(old), str(new)
+
+
+def test_both_column_orders_are_read(traffic_files):
+    old, new = (trafficImport.read_traffic(path) for path in traffic_files)
+    assert list(old.columns) == trafficImport.TRAFFIC_COLUMNS
+    assert old.equals(new)
+    #the rows without volume are dropped, the volumes are rounded
+    assert len(old) == 5 and old.traffic_volume.tolist()[0] == 100.0
+
+
+def test_volumes_are_averaged_across_the_years(traffic_files):
+    pairs = trafficImport.aggregate(trafficImport.read_traffic(traffic_files[1]))
+    pairs = {(row.node_start, row.node_end): row for row in pairs.itertuples()}
+    assert sorted(pairs) == [('1', '2'), ('2', '3')]
+    #the repeated row of 2019 counts once, the two volumes of 2020 both
+    assert pairs['1', '2'].AADT == pytest.approx((100 + 200 + 300) / 3)
+    assert pairs['1', '2'].volumes == [{'year': '2019', 'traffic_volume': 100.0, 'osmid': '10'},
+                                       {'year': '2020', 'traffic_volume': 250.0, 'osmid': '10'}]
+    assert pairs['2', '3'].AADT == pytest.approx(50.0)
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+import routingEngine
+import turnRouting
+from conftest import grid_frames, reference_costs
+
+
+def edge(graph, u, v):
+    return next(e for e in range(graph.offsets[u], graph.offsets[u + 1]) if graph.targets[e] == v)
+
+
+def transitions(turns, e):
+    return turns.t_targets[turns.t_offsets[e]:turns.t_offsets[e + 1]].tolist()
+
+
+@pytest.fixture
+def open_grid():
+    return grid_frames(closed=0)
+
+
+@pytest.fixture
+def dead_end(open_grid):
+    #a street from the corner 1000 to a junction without other routes
+    nodes, edges = open_grid
+    nodes = pd.concat([nodes, pd.DataFrame({'node_id': [1001], 'junction_id': [2000],
+                                            'lat': [44.6395], 'lon': [10.9195]})], ignore_index=True)
+    spur = pd.DataFrame({'source': [5, 1001], 'target': [1001, 5], 'osmid': ['300', '300'],
+                         'name': ['Vicolo Cieco'] * 2, 'distance': [80.0, 80.0], 'AADT': [150.0, 150.0],
+                         'status': ['active'] * 2})
+    return nodes, pd.concat([edges, spur], ignore_index=True)
+
+
+def test_without_penalties_the_costs_match_scipy(grid, graph):
+    #a U-turn is never part of a shortest path, so only the turn penalty can change the costs
+    turns = turnRouting.TurnGraph(graph, turn_penalty=0.0)
+    expected = reference_costs(*grid)
+    for s in range(graph.node_count):
+        for t in range(graph.node_count):
+            result = turns.search(s, t)
+            assert (result is None) if np.isinf(expected[s, t]) else result[0] == pytest.approx(expected[s, t])
+
+
+def test_turn_penalties_never_decrease_the_costs(grid, graph):
+    turns = turnRouting.TurnGraph(graph)
+    expected = reference_costs(*grid)
+    for t in range(graph.node_count):
+        result = turns.search(0, t)
+        if result is not None:
+            assert result[0] >= expected[0, t] - 1e-9
+
+
+def test_restriction_removes_the_turn(open_grid):
+    graph = routingEngine.RoadGraph.from_frames(*open_grid)
+    #from the row 2 (street 102) to the column 2 (street 202) at the junction 1014
+    restrictions = pd.DataFrame([['102', '1014', '202', 'no_left_turn']], columns=turnRouting.RESTRICTION_COLUMNS)
+    free = turnRouting.TurnGraph(graph, turn_penalty=0.0)
+    restricted = turnRouting.TurnGraph(graph, restrictions=restrictions, turn_penalty=0.0)
+    entering = edge(graph, 13, 14)
+    assert edge(graph, 14, 20) in transitions(free, entering)
+    assert edge(graph, 14, 20) not in transitions(restricted, entering)
+    assert edge(graph, 14, 8) not in transitions(restricted, entering)
+    assert edge(graph, 14, 15) in transitions(restricted, entering)
+    #the route from 1013 to 1020 cannot turn at 1014 any more
+    cost, path = restricted.search(13, 20)
+    assert all(path[i:i + 3] != [13, 14, 20] for i in range(len(path) - 2))
+    assert cost >= free.search(13, 20)[0]
+
+
+def test_only_restriction_keeps_one_way_out(open_grid):
+    graph = routingEngine.RoadGraph.from_frames(*open_grid)
+    restrictions = pd.DataFrame([['102', '1014', '102', 'only_straight_on']], columns=turnRouting.RESTRICTION_COLUMNS)
+    turns = turnRouting.TurnGraph(graph, restrictions=restrictions)
+    assert transitions(turns, edge(graph, 13, 14)) == [edge(graph, 14, 15)]
+
+
+def test_u_turns_only_at_dead_ends(dead_end):
+    graph = routingEngine.RoadGraph.from_frames(*dead_end)
+    turns = turnRouting.TurnGraph(graph)
+    spur = graph.index_of(2000)
+    #at the end of the dead end the only way out is back
+    assert transitions(turns, edge(graph, 0, spur)) == [edge(graph, spur, 0)]
+    #at the corner there are other ways out
+    assert edge(graph, 0, 1) not in transitions(turns, edge(graph, 1, 0))
+    cost, path = turns.search(1, spur)
+    assert path == [1, 0, spur]
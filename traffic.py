@@ -1,7 +1,10 @@
 from neo4j import GraphDatabase
 import argparse
-import os
-import shutil
+import graphVersion
+import edgeWeights
+import dualGraph
+import aadtImputation
+import trafficImport
 
 
 class App:
@@ -11,141 +14,44 @@ class App:
     def close(self):
         self.driver.close()
 
-    def get_path(self):
-        #gets the path of the neo4j instance
+    def set_index(self):
+        #the junctions of the traffic file are matched by id
         with self.driver.session() as session:
-            result = session.write_transaction(self._get_path)
-            return result
+            session.write_transaction(self._set_index)
 
     @staticmethod
-    def _get_path(tx):
-        result = tx.run("""
-                        Call dbms.listConfig() yield name,value where name = 'dbms.directories.neo4j_home' return value;
-                    """)
-        return result.values()
-        
-    def get_import_folder_name(self):
-        #gets the name of the import folder of the neo4j instance
+    def _set_index(tx):
+        tx.run("""
+                        create index road_junction_id if not exists for (n:RoadJunction) on (n.id)
+                    """).consume()
+
+    def import_traffic(self, file_name, batch_size=10000):
+        #imports the traffic from the csv file: the AADT2019 relationships and the AADT of the routes
+        traffic = trafficImport.read_traffic(file_name)
+        pairs = trafficImport.aggregate(traffic)
+        print('{} rows of traffic on {} pairs of junctions read'.format(len(traffic), len(pairs)))
+        return trafficImport.import_traffic(self.driver, pairs, batch_size)
+
+    def estimate_AADT_property(self, batch_size=10000):
+        #estimates the AADT where no traffic data are provided, from the routes around and then from the highway type
+        return aadtImputation.impute(self.driver, batch_size)
+
+    def update_streets(self, batch_size=10000):
+        #updates the streets of the dual graph whose routes have a new AADT
         with self.driver.session() as session:
-            result = session.write_transaction(self._get_import_folder_name)
-            return result
+            osmids = session.read_transaction(edgeWeights.changed_streets)
+        return dualGraph.update(self.driver, osmids, batch_size)
 
-    @staticmethod
-    def _get_import_folder_name(tx):
-        result = tx.run("""
-                        Call dbms.listConfig() yield name,value where name = 'dbms.directories.import' return value;
-                    """)
-        return result.values()
-
-    def import_traffic(self):
-        #imports the traffic from the csv file to the graph
+    def update_weights(self):
+        #writes the normalized traffic weight of the routes whose AADT has changed
         with self.driver.session() as session:
-            result = session.write_transaction(self._import_traffic)
-            return result
+            return session.write_transaction(edgeWeights.materialize_weights)
 
-    @staticmethod
-    def _import_traffic(tx):
-        result = tx.run("""
-                        load csv with headers from 'file:///traffic.csv' as row
-                           match (a:RoadJunction {id: row.node_start})
-                           match(b:RoadJunction {id: row.node_end})
-                           merge (a)-[:AADT2019 {traffic_volume:round(toFloat(row.traffic_volume),2)
-                                                         ,year: row.year,osmid: row.id_road_section}]->(b);
-                    """)
-        result = tx.run("""
-                        match (d:RoadOsm)
-                        with d 
-                        match (m:RoadJunction)-[r1:ROUTE {osmid: d.osmid, status: 'active'}]->(n:RoadJunction)
-                        with d,avg(r1.AADT) as AADT, sum(r1.distance) as dist,r1.name as road_name
-                        set d.traffic = AADT/dist, 
-                        d.AADT=AADT,d.distance = dist,
-                        d.name= road_name
-                    """)
-        return result.values()
-
-    def add_route_AADT_property(self):
-        #insert AADT as a property of the route relationship in the primal graph
-        with self.driver.session() as session:
-            result = session.write_transaction(self._add_route_AADT_property)
-            return result
-
-    @staticmethod
-    def _add_route_AADT_property(tx):
-        result = tx.run("""
-                        load csv with headers from 'file:///traffic.csv' as row
-                           match (a:RoadJunction {id: row.node_start})-[route:ROUTE]->(b:RoadJunction {id: row.node_end})
-                           call { with row
-                                  match (a:RoadJunction {id: row.node_start})-[r:AADT2019]->(b:RoadJunction {id: row.node_end})
-                                  return avg(r.traffic_volume) as avgTraf
-                                }
-                           set route.AADT = avgTraf;
-                    """)
-        return result.values()
-
-    def estimate_AADT_property(self):
-        #estimates the AADT where no traffic data are provided
-        with self.driver.session() as session:
-            result = session.write_transaction(self._estimate_AADT_property)
-            return result
-
-    @staticmethod
-    def _estimate_AADT_property(tx):
-        #considering nearest AADT relationships
-        result = tx.run("""
-                        MATCH (n:RoadJunction)-[route:ROUTE]->(m:RoadJunction)  WHERE NOT EXISTS(route.AADT)
-                           call { with n
-                                  match (n)-[r:AADT2019*1..5]->(b:RoadJunction)
-                                  unwind r as p
-                                  return avg(p.traffic_volume) as avgTraf
-                                }
-                           set route.AADT = avgTraf
-                    """)
-        result = tx.run("""
-                        MATCH (n:RoadJunction)-[route:ROUTE]->(m:RoadJunction)  WHERE NOT EXISTS(route.AADT)
-                           call { with n
-                                  match (n)-[r:ROUTE*1..3]->(b:RoadJunction)
-                                  unwind r as p
-                                  return avg(p.AADT) as avgTraf
-                                }
-                           set route.AADT = avgTraf
-                    """)
-        return result.values()
-    
-    def find_highway_types(self):
-        #returns all the highway types from the route relationships' attributes
-        with self.driver.session() as session:
-            result = session.write_transaction(self._find_highway_types)
-            return result
-
-    @staticmethod    
-    def _find_highway_types(tx):
-        result = tx.run("""
-                        MATCH (:RoadJunction)-[route:ROUTE]->(:RoadJunction)
-                                 return route.highway,round(avg(route.AADT),2) as mean
-        """)
-        return result.values()
-
-    def estimate_AADT_from_road_type(self,name,value):
-        #evaluates AADT considering the AADT of roads of the same type
+    def bump_versions(self):
+        #the AADT is part of the weights of the primal graph: the projections and the routes
+        #cached on the previous versions are no longer valid (the dual graph is bumped by its update)
         with self.driver.session() as session:
-            result = session.write_transaction(self._estimate_AADT_from_road_type,name,value)
-            return result
-    @staticmethod    
-    def _estimate_AADT_from_road_type(tx,name,value):
-        query = """
-                       match ()-[r:ROUTE]->() WHERE NOT EXISTS(r.AADT) and r.highway = '""" + str(name) + """'
-                          set r.AADT=""" + str(value) 
-        print(query)
-        # result = tx.run("""
-                       # match ()-[r:ROUTE]->() WHERE NOT EXISTS(r.AADT) and r.highway = '$h'
-                          # call { MATCH (:Node)-[route:ROUTE]->(:Node)  
-                                 # where route.highway = '$h2'
-                                 # return avg(route.AADT) as mean
-                               # }
-                          # set r.AADT= mean
-               # """, h = h, h2 = h)
-        result = tx.run(query)
-        return result.values()
+            session.write_transaction(graphVersion.bump_version, graphVersion.PRIMAL)
 
 
 def add_options():
@@ -162,6 +68,9 @@ def add_options():
     parser.add_argument('--nameFile', '-f', dest='file_name', type=str,
                         help="""Insert the name and path of the .csv file.""",
                         required=True)
+    parser.add_argument('--batchSize', '-b', dest='batch_size', type=int,
+                        help="""Insert the number of pairs of junctions (or of estimated routes, or of streets of the dual graph) written in each transaction.""",
+                        required=False, default=10000)
     return parser
 
 
@@ -171,21 +80,18 @@ def main(args=None):
     options = argParser.parse_args(args=args)
     #connecting neo4j instance
     greeter = App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
-    #copying the traffic file in the import folder of neo4j
-    path = greeter.get_path()[0][0] + '\\' + greeter.get_import_folder_name()[0][0] + '\\traffic.csv'
-    shutil.copyfile(options.file_name, path)
-    #import traffic data in the graph
-    greeter.import_traffic()
-    #insert AADT property in the ROUTE relationships of the primal graph
-    greeter.add_route_AADT_property()
+    greeter.set_index()
+    #import traffic data in the graph and the AADT property of the ROUTE relationships of the primal graph
+    routes = greeter.import_traffic(options.file_name, options.batch_size)
+    print('AADT written on {} routes'.format(routes))
     #extimate traffic flow where the route relation has no AADT property
-    greeter.estimate_AADT_property()
-    #retrieve all the highway types in the graph
-    road_types = greeter.find_highway_types()
-    #for each road type estimate the AADT where missing
-    for h in road_types:
-        if h[1]:
-            greeter.estimate_AADT_from_road_type(h[0],h[1])
+    estimates = greeter.estimate_AADT_property(options.batch_size)
+    print('AADT estimated on {} routes'.format(estimates))
+    #updating the streets of the dual graph whose AADT changed, before the weights mark them as up to date
+    greeter.update_streets(options.batch_size)
+    #materializing the traffic weight used by the projections
+    greeter.update_weights()
+    greeter.bump_versions()
     greeter.close()
     return 0
 
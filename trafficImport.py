@@ -0,0 +1,67 @@
+"""Import of the traffic volumes from a csv file (traffic.csv or new_traffic.csv) read with pandas.
+   The columns are selected by name, so the order of the columns of the file does not matter.
+   The rows are aggregated in memory by (node_start, node_end, year) and a single batched query for
+   each group of pairs of junctions writes the AADT2019 relationships of every year and the AADT of the
+   ROUTE relationships between the two junctions, the average of the volumes as in the import through
+   LOAD CSV. The file is read by the script, so it does not need to be copied in the import folder of neo4j.
+   The junctions are matched by id, the index on RoadJunction(id) must exist."""
+import pandas as pd
+
+TRAFFIC_COLUMNS = ['node_start', 'node_end', 'id_road_section', 'traffic_volume', 'year']
+
+
+def read_traffic(path):
+    """the rows of the csv file with the columns of TRAFFIC_COLUMNS, the volumes rounded to 2 decimals"""
+    traffic = pd.read_csv(path, usecols=TRAFFIC_COLUMNS, dtype=str)[TRAFFIC_COLUMNS]
+    traffic['traffic_volume'] = pd.to_numeric(traffic['traffic_volume'], errors='coerce').round(2)
+    return traffic.dropna(subset=['node_start', 'node_end', 'traffic_volume', 'year'])
+
+
+def aggregate(traffic):
+    """a row for each pair of junctions with the AADT (the average of the volumes of all the years)
+       and the list of the volumes of each year. The duplicated rows count once, as with the MERGE
+       of the relationships of the import through LOAD CSV."""
+    traffic = traffic.drop_duplicates()
+    years = traffic.groupby(['node_start', 'node_end', 'year'], sort=False).agg(
+        traffic_volume=('traffic_volume', 'mean'), count=('traffic_volume', 'size'),
+        osmid=('id_road_section', 'first')).reset_index()
+    years['total'] = years['traffic_volume'] * years['count']
+    pairs = years.groupby(['node_start', 'node_end'], sort=False).agg(total=('total', 'sum'), count=('count', 'sum'))
+    pairs['AADT'] = pairs['total'] / pairs['count']
+    #null values instead of NaN, so the properties are not set
+    volumes = years[['year', 'traffic_volume', 'osmid']]
+    volumes = volumes.astype(object).where(volumes.notna(), None)
+    years['volume'] = volumes.to_dict('records')
+    pairs['volumes'] = years.groupby(['node_start', 'node_end'], sort=False)['volume'].agg(list)
+    return pairs.reset_index()[['node_start', 'node_end', 'AADT', 'volumes']]
+
+
+def write_traffic(tx, rows):
+    result = tx.run("""
+                UNWIND $rows AS row
+                MATCH (a:RoadJunction {id: row.node_start})
+                MATCH (b:RoadJunction {id: row.node_end})
+                FOREACH (volume IN row.volumes |
+                    MERGE (a)-[t:AADT2019 {year: volume.year}]->(b)
+                    SET t.traffic_volume = volume.traffic_volume, t.osmid = volume.osmid)
+                WITH a, b, row
+                MATCH (a)-[route:ROUTE]->(b)
+                SET route.AADT = row.AADT
+                RETURN count(route)
+                """, rows=rows)
+    return result.single()[0]
+
+
+def import_traffic(driver, pairs, batch_size=10000, progress=print):
+    """writes the aggregated traffic in batches of batch_size pairs of junctions, one transaction per batch.
+       Returns the number of ROUTE relationships with a new AADT."""
+    routes = 0
+    with driver.session() as session:
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs.iloc[start:start + batch_size]
+            rows = [{'node_start': a, 'node_end': b, 'AADT': float(aadt), 'volumes': volumes}
+                    for a, b, aadt, volumes in batch[['node_start', 'node_end', 'AADT', 'volumes']].values]
+            routes += session.write_transaction(write_traffic, rows)
+            if progress is not None:
+                progress('{} of {} pairs of junctions written'.format(min(start + batch_size, len(pairs)), len(pairs)))
+    return routes
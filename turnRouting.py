@@ -0,0 +1,335 @@
+"""Turn-aware routing on the in-memory road graph. The states of the search are the ROUTE relationships
+   (edge-based routing) and a transition goes from a relationship u->v to a relationship v->w when the two
+   relationships belong to the same street or when the dual graph has a CONNECTED relationship from the
+   street of the first one to the street of the second one at the junction v. Each transition costs the
+   weight of the second relationship plus a turn penalty proportional to the angle between the two
+   segments at the shared junction. The OSM turn restrictions (no_* and only_* with a node as via member)
+   remove the transitions they forbid, and the U-turns are allowed only at the dead ends.
+   All the transitions are precomputed with numpy in compressed sparse row arrays (the turn table), so a
+   query runs the same search loop of routingEngine on the relationships instead of the junctions."""
+import argparse
+import copy
+import re
+import heapq
+import folium as fo
+import numpy as np
+import pandas as pd
+import routingEngine
+
+RESTRICTION_COLUMNS = ['from_way', 'via_node', 'to_way', 'restriction']
+#cost in meters of a turn of 180 degrees, a turn of angle a costs TURN_PENALTY * a / 180
+TURN_PENALTY = 30.0
+MODES = {'d': 'distance', 'h': 'hops', 't': 'traffic'}
+
+
+class App(routingEngine.App):
+    def read_connections(self):
+        """returns the source street, the target street and the junction of every CONNECTED relationship"""
+        with self.driver.session() as session:
+            result = session.read_transaction(self._read_connections)
+            return result
+
+    @staticmethod
+    def _read_connections(tx):
+        result = tx.run("""
+                    MATCH (a:RoadOsm)-[c:CONNECTED]->(b:RoadOsm)
+                    RETURN a.osmid AS source, b.osmid AS target, c.junction AS junction
+                    """)
+        return pd.DataFrame(result.values(), columns=['source', 'target', 'junction'])
+
+
+def read_restrictions(path):
+    """turn restrictions from a csv file with the columns from_way, via_node, to_way and restriction
+       (for example no_left_turn or only_straight_on)"""
+    return pd.read_csv(path, dtype=str)[RESTRICTION_COLUMNS]
+
+
+def restriction_frame(elements):
+    """turn restrictions from the relations of an Overpass json response. The restrictions with a way
+       as via member are ignored."""
+    rows = []
+    for element in elements:
+        if element.get('type') != 'relation':
+            continue
+        tags = element.get('tags', {})
+        restriction = tags.get('restriction', tags.get('restriction:motorcar'))
+        if restriction is None:
+            continue
+        members = element.get('members', [])
+        via = [member for member in members if member['role'] == 'via']
+        if len(via) != 1 or via[0]['type'] != 'node':
+            continue
+        for a in [member['ref'] for member in members if member['role'] == 'from' and member['type'] == 'way']:
+            for b in [member['ref'] for member in members if member['role'] == 'to' and member['type'] == 'way']:
+                rows.append([str(a), str(via[0]['ref']), str(b), restriction])
+    return pd.DataFrame(rows, columns=RESTRICTION_COLUMNS)
+
+
+def download_restrictions(graph, cache=None):
+    """turn restrictions of the area of the graph from the Overpass API, through the local cache"""
+    import osmCache
+    cache = cache or osmCache.OsmCache()
+    lat, lon = float(np.mean(graph.lat)), float(np.mean(graph.lon))
+    dist = float(np.max(routingEngine.haversine(graph.lat, graph.lon, lat, lon)))
+    query = '[out:json];relation["type"="restriction"](around:{},{},{});out body;'.format(int(np.ceil(dist)), lat, lon)
+    return restriction_frame(cache.overpass(query)['elements'])
+
+
+class TurnGraph:
+    """Turn table of a routingEngine.RoadGraph: the transitions between its relationships with the
+       angle of the turn, stored as compressed sparse row arrays indexed by the relationship."""
+
+    def __init__(self, graph, connections=None, restrictions=None, turn_penalty=TURN_PENALTY):
+        if graph.osmids is None:
+            raise ValueError('The graph has been stored without street names and osmids: load it again from neo4j')
+        self.graph = graph
+        self.turn_penalty = float(turn_penalty)
+        self.edge_source = np.repeat(np.arange(graph.node_count, dtype=np.int64), np.diff(graph.offsets))
+        self.edge_target = graph.targets.astype(np.int64)
+        t_from, t_to = self._candidates()
+        allowed = self._connected(t_from, t_to, connections)
+        if restrictions is not None and len(restrictions) > 0:
+            allowed &= ~self._restricted(t_from, t_to, restrictions)
+        #U-turns only where there is no other way out
+        uturn = self.edge_target[t_to] == self.edge_source[t_from]
+        exits = np.bincount(t_from[allowed & ~uturn], minlength=graph.edge_count)
+        allowed &= ~uturn | (exits[t_from] == 0)
+        self.t_from = t_from[allowed]
+        self.t_targets = t_to[allowed]
+        self.t_offsets = np.zeros(graph.edge_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.t_from, minlength=graph.edge_count), out=self.t_offsets[1:])
+        self.angles = self._angles(self.t_from, self.t_targets)
+        self._lists = {}
+
+    @property
+    def transition_count(self):
+        return len(self.t_targets)
+
+    def _candidates(self):
+        #every pair of relationships u->v, v->w, grouped by the first relationship
+        offsets = self.graph.offsets
+        counts = np.diff(offsets)[self.edge_target]
+        t_from = np.repeat(np.arange(self.graph.edge_count, dtype=np.int64), counts)
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        t_to = np.repeat(offsets[self.edge_target], counts) + np.arange(len(t_from), dtype=np.int64) - first
+        return t_from, t_to
+
+    def _connected(self, t_from, t_to, connections):
+        #transitions on the same street or between streets connected at the junction in the dual graph
+        if connections is None:
+            return np.ones(len(t_from), dtype=bool)
+        osmids = self.graph.osmids
+        same = osmids[t_from] == osmids[t_to]
+        streets = pd.Index(pd.unique(np.concatenate([osmids, connections.source.astype(str).values,
+                                                     connections.target.astype(str).values])))
+        junctions = pd.Index(self.graph.junction_ids)
+        size, nodes = len(streets), self.graph.node_count
+        source = streets.get_indexer(connections.source.astype(str))
+        target = streets.get_indexer(connections.target.astype(str))
+        junction = junctions.get_indexer(pd.to_numeric(connections.junction, errors='coerce').fillna(-1).astype(np.int64))
+        known = junction >= 0
+        keys = (source[known].astype(np.int64) * size + target[known]) * nodes + junction[known]
+        codes = streets.get_indexer(osmids).astype(np.int64)
+        transitions = (codes[t_from] * size + codes[t_to]) * nodes + self.edge_target[t_from]
+        return same | np.isin(transitions, keys)
+
+    def _restricted(self, t_from, t_to, restrictions):
+        #the ways of each relationship, osmnx stores a list when it merges more ways in a relationship
+        ways = {}
+
+        def ways_of(e):
+            if e not in ways:
+                ways[e] = set(re.findall(r'\d+', self.graph.osmids[e]))
+            return ways[e]
+        starts = np.zeros(self.graph.edge_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(t_from, minlength=self.graph.edge_count), out=starts[1:])
+        order = np.argsort(self.edge_target, kind='stable')
+        incoming = np.zeros(self.graph.node_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.edge_target, minlength=self.graph.node_count), out=incoming[1:])
+        banned = np.zeros(len(t_from), dtype=bool)
+        for from_way, via_node, to_way, restriction in restrictions[RESTRICTION_COLUMNS].astype(str).values:
+            v = self.graph._index.get(int(via_node)) if via_node.isdigit() else None
+            if v is None:
+                continue
+            for e in order[incoming[v]:incoming[v + 1]]:
+                if from_way not in ways_of(e):
+                    continue
+                for t in range(starts[e], starts[e + 1]):
+                    match = to_way in ways_of(t_to[t])
+                    if (restriction.startswith('no_') and match) or (restriction.startswith('only_') and not match):
+                        banned[t] = True
+        return banned
+
+    def _angles(self, t_from, t_to):
+        #angle in degrees between the directions of the two segments, 0 going straight and 180 for a U-turn
+        lat, lon = self.graph.lat, self.graph.lon
+        scale = np.cos(np.radians(lat[self.edge_source]))
+        bearing = np.degrees(np.arctan2((lon[self.edge_target] - lon[self.edge_source]) * scale,
+                                        lat[self.edge_target] - lat[self.edge_source]))
+        return np.abs((bearing[t_to] - bearing[t_from] + 180.0) % 360.0 - 180.0)
+
+    def transition_costs(self, weight='distance'):
+        """cost of each transition: the weight of the relationship entered plus the turn penalty"""
+        mode = {'distance': 'd', 'hops': 'h', 'traffic': 't'}[weight]
+        penalty = self.graph.connector_cost(self.turn_penalty, mode)
+        return self.graph._costs(weight)[self.t_targets] + penalty * self.angles / 180.0
+
+    def _table(self, weight):
+        if weight not in self._lists:
+            if 'offsets' not in self._lists:
+                self._lists['offsets'] = self.t_offsets.tolist()
+                self._lists['targets'] = self.t_targets.tolist()
+                self._lists['edge_source'] = self.edge_source.tolist()
+                self._lists['edge_target'] = self.edge_target.tolist()
+            self._lists[weight] = (self.transition_costs(weight).tolist(), self.graph._costs(weight).tolist())
+        return self._lists['offsets'], self._lists['targets'], self._lists[weight]
+
+    def with_closures(self, streets=(), osmids=()):
+        """what-if view where the given streets are closed: the turn table is shared, only the costs change"""
+        view = copy.copy(self)
+        view.graph = self.graph.with_closures(streets, osmids)
+        view._lists = {key: self._lists[key] for key in ('offsets', 'targets', 'edge_source', 'edge_target')
+                       if key in self._lists}
+        return view
+
+    def search(self, source, target, weight='distance'):
+        """shortest path between two node indexes on the relationships (A* with the lower bounds of
+           RoadGraph.heuristic, still admissible because the turn penalties are not negative).
+           Returns the total cost and the list of node indexes or None if no path exists."""
+        if source == target:
+            return 0.0, [source]
+        offsets, targets, (costs, edge_costs) = self._table(weight)
+        edge_source, edge_target = self._lists['edge_source'], self._lists['edge_target']
+        h = self.graph.heuristic(target, weight) if weight != 'hops' else None
+        #lower bound of each relationship, the one of the junction where it ends
+        h = h[self.edge_target].tolist() if h is not None else [0.0] * self.graph.edge_count
+        dist = [float('inf')] * self.graph.edge_count
+        parent = {}
+        queue = []
+        for e in range(self.graph.offsets[source], self.graph.offsets[source + 1]):
+            cost = edge_costs[e]
+            if cost < dist[e]:
+                dist[e] = cost
+                parent[e] = -1
+                queue.append((cost + h[e], e))
+        heapq.heapify(queue)
+        while queue:
+            key, e = heapq.heappop(queue)
+            de = dist[e]
+            if key > de + h[e]:
+                continue
+            if edge_target[e] == target:
+                edges = routingEngine.RoadGraph._build_path(parent, e)
+                return de, [edge_source[edges[0]]] + [edge_target[f] for f in edges]
+            for t in range(offsets[e], offsets[e + 1]):
+                f = targets[t]
+                df = de + costs[t]
+                #closed relationships have a NaN cost and the comparison is false
+                if df < dist[f]:
+                    dist[f] = df
+                    parent[f] = e
+                    heapq.heappush(queue, (df + h[f], f))
+        return None
+
+    def shortest_path(self, source, target, mode='d'):
+        """route between two junctions (osm ids) with the modes of routingEngine:
+           distance [d], hops [h] or traffic volume [t], with the turn penalties and the restrictions"""
+        weight = MODES.get(mode[:1])
+        if weight is None:
+            raise ValueError('Unknown routing mode: ' + mode)
+        result = self.search(self.graph.index_of(source), self.graph.index_of(target), weight)
+        if result is None:
+            return []
+        cost, path = result
+        return [[source, target, cost, self.graph.coordinates(path)]]
+
+
+def add_options():
+    parser = argparse.ArgumentParser(description='Turn-aware routing between two road junctions on the in-memory graph.')
+    parser.add_argument('--source', '-s', dest='source', type=str,
+                        help="""Insert the OSM id of the road junction where the route starts.""",
+                        required=True)
+    parser.add_argument('--destination', '-d', dest='destination', type=str,
+                        help="""Insert the OSM id of the road junction where the route ends.""",
+                        required=True)
+    parser.add_argument('--mode', '-m', dest='mode', type=str,
+                        help="""Insert the routing mode: distance[d], hops[h] or traffic volume[t].""",
+                        required=False, default='d')
+    parser.add_argument('--neo4jURL', '-n', dest='neo4jURL', type=str,
+                        help="""Insert the address of the local neo4j instance. For example: neo4j://localhost:7687""",
+                        required=True)
+    parser.add_argument('--neo4juser', '-u', dest='neo4juser', type=str,
+                        help="""Insert the name of the user of the local neo4j instance.""",
+                        required=True)
+    parser.add_argument('--neo4jpwd', '-p', dest='neo4jpwd', type=str,
+                        help="""Insert the password of the local neo4j instance.""",
+                        required=True)
+    parser.add_argument('--graphFile', '-g', dest='graph_file', type=str,
+                        help="""Insert the path of the .npz file where the in-memory graph is cached.""",
+                        required=False, default=None)
+    parser.add_argument('--landmarkFile', '-l', dest='landmark_files', type=str, action='append',
+                        help="""Insert the path of a .npz file of landmarks generated by landmarks.py.
+                              It can be repeated to load the landmarks of both the weights.""",
+                        required=False, default=[])
+    parser.add_argument('--restrictions', '-r', dest='restrictions', type=str,
+                        help="""Insert the path of a csv file of turn restrictions with the columns
+                              from_way, via_node, to_way and restriction.""",
+                        required=False, default=None)
+    parser.add_argument('--downloadRestrictions', dest='download_restrictions', action='store_true',
+                        help="""Download the turn restrictions of the area of the graph from the Overpass API
+                              (through the local cache of the OSM downloads).""",
+                        required=False, default=False)
+    parser.add_argument('--turnPenalty', '-t', dest='turn_penalty', type=float,
+                        help="""Insert the cost in meters of a U-turn, a turn of angle a costs turnPenalty * a / 180.""",
+                        required=False, default=TURN_PENALTY)
+    parser.add_argument('--fileOutput', '-f', dest='mapName', type=str,
+                        help="""Insert the path of the file of the resulting map.""",
+                        required=False, default='map.html')
+    parser.add_argument('--close', dest='close_streets', type=str, action='append',
+                        help="""Insert the name of a street closed only for this route (what-if), without changing the database.
+                              It can be repeated.""",
+                        required=False, default=[])
+    parser.add_argument('--closeOsmid', dest='close_osmids', type=str, action='append',
+                        help="""Insert the OSM id of a street closed only for this route (what-if). It can be repeated.""",
+                        required=False, default=[])
+    return parser
+
+
+def main(args=None):
+    argParser = add_options()
+    #retrieving arguments
+    options = argParser.parse_args(args=args)
+    #connecting to the neo4j instance and loading the graph and the connections of the dual graph in memory
+    greeter = App(options.neo4jURL, options.neo4juser, options.neo4jpwd)
+    graph = routingEngine.load_graph(greeter, options.graph_file)
+    connections = greeter.read_connections()
+    greeter.close()
+    if len(connections) == 0:
+        argParser.error('the dual graph is empty, create it with createRoadSectionGraph.py')
+    routingEngine.load_landmarks(graph, options.landmark_files)
+    restrictions = None
+    if options.restrictions:
+        restrictions = read_restrictions(options.restrictions)
+    elif options.download_restrictions:
+        restrictions = download_restrictions(graph)
+    turns = TurnGraph(graph, connections, restrictions, options.turn_penalty)
+    print('{} routes and {} transitions loaded, {} turn restrictions'.format(
+        graph.edge_count, turns.transition_count, 0 if restrictions is None else len(restrictions)))
+    if options.close_streets or options.close_osmids:
+        turns = turns.with_closures(options.close_streets, options.close_osmids)
+        print('{} routes closed'.format(int(turns.graph.closed.sum())))
+    result = turns.shortest_path(options.source, options.destination, options.mode.lower())
+    if len(result) == 0:
+        print('\nNo path exists')
+        return 0
+    print('cost: {}'.format(result[0][2]))
+    print('number of hops: {}'.format(len(result[0][3]) - 1))
+    #add the path to the map
+    m = fo.Map(location=result[0][3][0], zoom_start=13)
+    fo.PolyLine(result[0][3], color="green", weight=5).add_to(m)
+    m.save(options.mapName)
+    return 0
+
+
+if __name__ == "__main__":
+    main()